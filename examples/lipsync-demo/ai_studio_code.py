@@ -5,10 +5,12 @@ import base64
 import mimetypes
 import os
 import re
-import struct
 from google import genai
 from google.genai import types
 
+from client_registry import get_genai_client
+from wav_writer import StreamingWavWriter, wav_header
+
 
 def save_binary_file(file_name, data):
     f = open(file_name, "wb")
@@ -17,75 +19,146 @@ def save_binary_file(file_name, data):
     print(f"File saved to to: {file_name}")
 
 
-def generate():
-    client = genai.Client(
-        api_key=os.environ.get("GEMINI_API_KEY"),
-    )
+# Default TTS model and the two demo speakers
+TTS_MODEL = os.getenv('TTS_MODEL', "gemini-2.5-pro-preview-tts")
+DEFAULT_VOICES = {"Speaker 1": "Zephyr", "Speaker 2": "Puck"}
+DEFAULT_TEXT = """Read aloud in a warm, welcoming tone
+Speaker 1: Hello! We're excited to show you our native speech capabilities
+Speaker 2: Where you can direct a voice, create realistic dialog, and so much more. Edit these placeholders to get started."""
+
+# Data size written in the header of a WAV stream whose length isn't known yet
+# (RIFF size becomes 0xFFFFFFFF; browsers play such streams progressively)
+STREAMING_WAV_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+def build_tts_request(text, voices=None):
+    """
+    Contents and config for a Gemini TTS call
+
+    Args:
+        text: Text to read (prefix lines with "Speaker 1:" etc. for dialog)
+        voices: {speaker: voice_name} for multi-speaker dialog, or a single
+                voice name (default: DEFAULT_VOICES)
+
+    Returns:
+        (contents, config)
+    """
+    voices = voices or DEFAULT_VOICES
+    if isinstance(voices, str):
+        speech_config = types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voices)
+            )
+        )
+    else:
+        speech_config = types.SpeechConfig(
+            multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
+                speaker_voice_configs=[
+                    types.SpeakerVoiceConfig(
+                        speaker=speaker,
+                        voice_config=types.VoiceConfig(
+                            prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                                voice_name=voice_name
+                            )
+                        ),
+                    )
+                    for speaker, voice_name in voices.items()
+                ]
+            ),
+        )
 
-    model = "gemini-2.5-pro-preview-tts"
     contents = [
         types.Content(
             role="user",
             parts=[
-                types.Part.from_text(text="""Read aloud in a warm, welcoming tone
-Speaker 1: Hello! We're excited to show you our native speech capabilities
-Speaker 2: Where you can direct a voice, create realistic dialog, and so much more. Edit these placeholders to get started."""),
+                types.Part.from_text(text=text),
             ],
         ),
     ]
-    generate_content_config = types.GenerateContentConfig(
+    config = types.GenerateContentConfig(
         temperature=1,
         response_modalities=[
             "audio",
         ],
-        speech_config=types.SpeechConfig(
-            multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
-                speaker_voice_configs=[
-                    types.SpeakerVoiceConfig(
-                        speaker="Speaker 1",
-                        voice_config=types.VoiceConfig(
-                            prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                                voice_name="Zephyr"
-                            )
-                        ),
-                    ),
-                    types.SpeakerVoiceConfig(
-                        speaker="Speaker 2",
-                        voice_config=types.VoiceConfig(
-                            prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                                voice_name="Puck"
-                            )
-                        ),
-                    ),
-                ]
-            ),
-        ),
+        speech_config=speech_config,
     )
+    return contents, config
+
+
+def _chunk_audio(chunk):
+    """inline_data of a streamed response chunk, or None for text/empty chunks"""
+    if (
+        chunk.candidates is None
+        or chunk.candidates[0].content is None
+        or chunk.candidates[0].content.parts is None
+    ):
+        return None
+    inline_data = chunk.candidates[0].content.parts[0].inline_data
+    if inline_data and inline_data.data:
+        return inline_data
+    return None
+
+
+def stream_tts(client, text, voices=None, model=TTS_MODEL):
+    """
+    Yield audio as Gemini produces it
 
-    file_index = 0
+    Yields:
+        (data, mime_type) per audio chunk; Gemini TTS returns raw PCM
+        ("audio/L16;codec=pcm;rate=24000")
+    """
+    contents, config = build_tts_request(text, voices)
     for chunk in client.models.generate_content_stream(
         model=model,
         contents=contents,
-        config=generate_content_config,
+        config=config,
     ):
-        if (
-            chunk.candidates is None
-            or chunk.candidates[0].content is None
-            or chunk.candidates[0].content.parts is None
-        ):
-            continue
-        if chunk.candidates[0].content.parts[0].inline_data and chunk.candidates[0].content.parts[0].inline_data.data:
-            file_name = f"ENTER_FILE_NAME_{file_index}"
-            file_index += 1
-            inline_data = chunk.candidates[0].content.parts[0].inline_data
-            data_buffer = inline_data.data
-            file_extension = mimetypes.guess_extension(inline_data.mime_type)
+        inline_data = _chunk_audio(chunk)
+        if inline_data is not None:
+            yield inline_data.data, inline_data.mime_type
+
+
+async def stream_tts_async(client, text, voices=None, model=TTS_MODEL):
+    """asyncio variant of stream_tts (genai aio client)"""
+    contents, config = build_tts_request(text, voices)
+    async for chunk in await client.aio.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=config,
+    ):
+        inline_data = _chunk_audio(chunk)
+        if inline_data is not None:
+            yield inline_data.data, inline_data.mime_type
+
+
+def streaming_wav_header(mime_type):
+    """WAV header for a PCM stream of unknown length (see STREAMING_WAV_DATA_SIZE)"""
+    parameters = parse_audio_mime_type(mime_type)
+    return wav_header(parameters["rate"], parameters["bits_per_sample"], STREAMING_WAV_DATA_SIZE)
+
+
+def generate(file_name="ENTER_FILE_NAME_0"):
+    """Stream the demo dialog into a single audio file (file_name + extension)"""
+    # Imported here: tts_cache builds on this module
+    from tts_cache import cached_stream_tts, default_tts_cache
+
+    client = get_genai_client(os.environ.get("GEMINI_API_KEY"))
+
+    output = None
+    for data, mime_type in cached_stream_tts(default_tts_cache(), client, DEFAULT_TEXT, DEFAULT_VOICES):
+        if output is None:
+            file_extension = mimetypes.guess_extension(mime_type)
             if file_extension is None:
-                file_extension = ".wav"
-                data_buffer = convert_to_wav(inline_data.data, inline_data.mime_type)
-            save_binary_file(f"{file_name}{file_extension}", data_buffer)
-        else:
-            print(chunk.text)
+                # Raw PCM: append chunks to one WAV, header sizes fixed up on close
+                output_path = f"{file_name}.wav"
+                output = StreamingWavWriter.for_mime_type(output_path, mime_type)
+            else:
+                output_path = f"{file_name}{file_extension}"
+                output = open(output_path, "wb")
+        output.write(data)
+    if output is not None:
+        output.close()
+        print(f"File saved to to: {output_path}")
 
 def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
     """Generates a WAV file header for the given audio data and parameters.
@@ -98,33 +171,7 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
         A bytes object representing the WAV file header.
     """
     parameters = parse_audio_mime_type(mime_type)
-    bits_per_sample = parameters["bits_per_sample"]
-    sample_rate = parameters["rate"]
-    num_channels = 1
-    data_size = len(audio_data)
-    bytes_per_sample = bits_per_sample // 8
-    block_align = num_channels * bytes_per_sample
-    byte_rate = sample_rate * block_align
-    chunk_size = 36 + data_size  # 36 bytes for header fields before data chunk size
-
-    # http://soundfile.sapp.org/doc/WaveFormat/
-
-    header = struct.pack(
-        "<4sI4s4sIHHIIHH4sI",
-        b"RIFF",          # ChunkID
-        chunk_size,       # ChunkSize (total file size - 8 bytes)
-        b"WAVE",          # Format
-        b"fmt ",          # Subchunk1ID
-        16,               # Subchunk1Size (16 for PCM)
-        1,                # AudioFormat (1 for PCM)
-        num_channels,     # NumChannels
-        sample_rate,      # SampleRate
-        byte_rate,        # ByteRate
-        block_align,      # BlockAlign
-        bits_per_sample,  # BitsPerSample
-        b"data",          # Subchunk2ID
-        data_size         # Subchunk2Size (size of audio data)
-    )
+    header = wav_header(parameters["rate"], parameters["bits_per_sample"], len(audio_data))
     return header + audio_data
 
 def parse_audio_mime_type(mime_type: str) -> dict[str, int | None]:
@@ -0,0 +1,252 @@
+# Audio normalization ahead of speech-to-text
+# Nhận diện định dạng thật của audio qua magic bytes (WAV, WebM, Ogg, FLAC, MP3,
+# MP4), rồi đưa PCM về mono 16 kHz LINEAR16 (downmix + lọc thông thấp + resample,
+# vector hoá bằng NumPy). Audio nén (WebM/Ogg/FLAC/...) được giữ nguyên nhưng
+# gắn đúng mime type, để model không phải đoán và không retry vì lỗi định dạng.
+
+import os
+import struct
+
+import numpy as np
+
+from audio_vad import to_wav_bytes
+
+# STT_NORMALIZE=0 sends uploads untouched
+NORMALIZE_ENABLED = os.getenv('STT_NORMALIZE', '1') != '0'
+TARGET_SAMPLE_RATE = int(os.getenv('STT_NORMALIZE_RATE', 16000))
+
+# Low-pass filter ahead of decimation (windowed sinc)
+FILTER_HALF_WIDTH = 32
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Declared content types of headerless 16-bit PCM uploads
+RAW_PCM_MIME_TYPES = ("audio/l16", "audio/pcm", "audio/raw")
+
+
+def sniff_mime_type(data):
+    """Mime type from the container's magic bytes, or None if unrecognized"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "audio/wav"
+    if data[:4] == b"\x1aE\xdf\xa3":
+        return "audio/webm"
+    if data[:4] == b"OggS":
+        return "audio/ogg"
+    if data[:4] == b"fLaC":
+        return "audio/flac"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return "audio/mp3"
+    if data[4:8] == b"ftyp":
+        return "audio/mp4"
+    if data[:4] == b"FORM" and data[8:12] in (b"AIFF", b"AIFC"):
+        return "audio/aiff"
+    return None
+
+
+def read_wav_header(data):
+    """
+    fmt / data chunk info of a WAV file
+
+    Returns:
+        {"format", "channels", "sample_rate", "bits_per_sample", "data_offset",
+         "data_size"}, or None if data isn't a readable WAV file
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    info = {}
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        body = offset + 8
+        if chunk_id == b"fmt " and size >= 16:
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if audio_format == _WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # First two bytes of the SubFormat GUID hold the real format tag
+                audio_format = struct.unpack_from("<H", data, body + 24)[0]
+            info.update(format=audio_format, channels=channels, sample_rate=sample_rate, bits_per_sample=bits)
+        elif chunk_id == b"data":
+            # Streamed WAVs may carry a placeholder size; clamp to what's there
+            info.update(data_offset=body, data_size=min(size, len(data) - body))
+            break
+        offset = body + size + (size & 1)
+    if "format" not in info or "data_offset" not in info or not info["channels"]:
+        return None
+    return info
+
+
+def decode_wav(data):
+    """
+    Decode PCM (8/16/24/32-bit) or IEEE float WAV
+
+    Returns:
+        (samples, sample_rate): float32 array of shape (frames, channels) in
+        [-1, 1], or None if data isn't a supported WAV file
+    """
+    info = read_wav_header(data)
+    if info is None:
+        return None
+    width = info["bits_per_sample"] // 8
+    channels = info["channels"]
+    frame_size = width * channels
+    if frame_size == 0:
+        return None
+    size = info["data_size"] - info["data_size"] % frame_size
+    raw = np.frombuffer(data, dtype=np.uint8, count=size, offset=info["data_offset"])
+
+    if info["format"] == _WAVE_FORMAT_PCM:
+        if width == 1:
+            samples = (raw.astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            samples = raw.view('<i2').astype(np.float32) / 32768.0
+        elif width == 3:
+            triples = raw.reshape(-1, 3).astype(np.int32)
+            values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+            values = np.where(values & 0x800000, values - 0x1000000, values)
+            samples = values.astype(np.float32) / 8388608.0
+        elif width == 4:
+            samples = (raw.view('<i4').astype(np.float64) / 2147483648.0).astype(np.float32)
+        else:
+            return None
+    elif info["format"] == _WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        samples = raw.view('<f4' if width == 4 else '<f8').astype(np.float32)
+    else:
+        return None
+    return samples.reshape(-1, channels), info["sample_rate"]
+
+
+def flac_info(data):
+    """
+    (sample_rate, channels, duration) from a FLAC STREAMINFO block, or None
+
+    duration is None when the encoder didn't record the total sample count.
+    """
+    if data[:4] != b"fLaC" or len(data) < 8 + 18 or data[4] & 0x7F != 0:
+        return None
+    packed = int.from_bytes(data[8 + 10:8 + 18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & ((1 << 36) - 1)
+    if not sample_rate:
+        return None
+    return sample_rate, channels, (total_samples / sample_rate if total_samples else None)
+
+
+def opus_info(data):
+    """
+    (channels, duration) of Ogg / WebM Opus audio, or None if there's no Opus
+    header (e.g. Ogg Vorbis)
+
+    Ogg duration comes from the granule position of the last page (48 kHz
+    samples, minus pre-skip); WebM duration is None.
+    """
+    head = data.find(b"OpusHead", 0, 4096)
+    if head == -1 or len(data) < head + 12:
+        return None
+    channels = data[head + 9]
+    duration = None
+    if data[:4] == b"OggS":
+        last_page = data.rfind(b"OggS")
+        if last_page + 14 <= len(data):
+            granule = struct.unpack_from("<q", data, last_page + 6)[0]
+            pre_skip = struct.unpack_from("<H", data, head + 10)[0]
+            if granule > 0:
+                duration = max(0, granule - pre_skip) / 48000.0
+    return channels, duration
+
+
+def downmix(samples):
+    """Average the channels of a (frames, channels) array"""
+    return samples.mean(axis=1, dtype=np.float32) if samples.shape[1] > 1 else samples[:, 0]
+
+
+def _lowpass_kernel(cutoff):
+    """Windowed-sinc low-pass; cutoff as a fraction of the sample rate (< 0.5)"""
+    taps = np.arange(-FILTER_HALF_WIDTH, FILTER_HALF_WIDTH + 1)
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.blackman(len(taps))
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(mono, sample_rate, target_rate):
+    """
+    Resample a mono float signal
+
+    Downsampling low-passes at 90% of the new Nyquist first so speech
+    harmonics above it don't alias into the band the model listens to.
+    """
+    if sample_rate == target_rate or len(mono) == 0:
+        return mono
+    if target_rate < sample_rate:
+        mono = np.convolve(mono, _lowpass_kernel(0.45 * target_rate / sample_rate), mode='same')
+    frames = int(round(len(mono) * target_rate / float(sample_rate)))
+    positions = np.arange(frames) * (sample_rate / float(target_rate))
+    return np.interp(positions, np.arange(len(mono)), mono).astype(np.float32)
+
+
+def to_pcm16(mono):
+    return (np.clip(mono, -1.0, 1.0) * 32767.0).round().astype('<i2')
+
+
+def _declared_pcm_rate(mime_type, sample_rate):
+    """Sample rate of a declared raw PCM upload ("audio/L16;rate=24000"), or None"""
+    if not mime_type:
+        return None
+    base, *params = [part.strip().lower() for part in mime_type.split(";")]
+    if base not in RAW_PCM_MIME_TYPES:
+        return None
+    for param in params:
+        if param.startswith("rate="):
+            try:
+                return int(param.split("=", 1)[1])
+            except ValueError:
+                break
+    return int(sample_rate) if sample_rate else None
+
+
+def normalize_audio(data, sample_rate=None, mime_type=None, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Normalize uploaded audio for the STT backends
+
+    - WAV (any PCM width / float, any channel count): mono 16-bit at
+      target_rate. Lower rates are kept; upsampling adds bytes, not detail.
+    - Compressed containers (WebM/Ogg Opus, FLAC, MP3, MP4): unchanged.
+    - Headerless audio declared as raw PCM (audio/L16, audio/pcm): read as
+      16-bit mono at sample_rate and wrapped as WAV.
+    - Anything else is passed through untouched.
+
+    Args:
+        data: Uploaded audio bytes
+        sample_rate: Sample rate declared by the client (raw PCM uploads)
+        mime_type: Content type declared by the client
+        target_rate: Output sample rate for PCM audio
+
+    Returns:
+        (audio_bytes, mime_type); mime_type is the sniffed type, or None if
+        the format is unknown
+    """
+    sniffed = sniff_mime_type(data)
+    if not NORMALIZE_ENABLED:
+        return data, sniffed
+    if sniffed is None:
+        sample_rate = _declared_pcm_rate(mime_type, sample_rate)
+        if not sample_rate or len(data) < 2:
+            return data, None
+        samples = np.frombuffer(data, dtype='<i2', count=len(data) // 2).astype(np.float32)[:, None] / 32768.0
+    elif sniffed == "audio/wav":
+        info = read_wav_header(data)
+        if (info is not None and info["format"] == _WAVE_FORMAT_PCM and info["channels"] == 1
+                and info["bits_per_sample"] == 16 and info["sample_rate"] <= target_rate):
+            # Already LINEAR16 mono at or below the target rate
+            return data, sniffed
+        decoded = decode_wav(data)
+        if decoded is None:
+            return data, sniffed
+        samples, sample_rate = decoded
+    else:
+        return data, sniffed
+
+    rate = min(int(sample_rate), target_rate)
+    mono = resample(downmix(samples), int(sample_rate), rate)
+    return to_wav_bytes(to_pcm16(mono)[:, None], rate), "audio/wav"
+
@@ -0,0 +1,236 @@
+# Voice activity detection (VAD) for PCM/WAV audio
+# Cắt khoảng lặng đầu/cuối và (tuỳ chọn) tách audio theo các khoảng dừng dài,
+# giữ nguyên timestamp gốc để word offsets vẫn đúng.
+
+import io
+import os
+import wave
+
+import numpy as np
+
+FRAME_MS = 30
+
+# Silence is measured relative to the recording's own noise floor
+NOISE_FLOOR_PERCENTILE = 10
+SPEECH_ABOVE_FLOOR_DB = 12
+SPEECH_BELOW_PEAK_DB = 25
+MIN_SPEECH_DB = -50
+
+# Keep a little audio around speech so word onsets/endings aren't clipped
+PADDING_MS = 200
+
+# Default pause length that splits a recording into segments (0 = never split)
+SPLIT_PAUSE_MS = int(os.getenv('STT_VAD_SPLIT_PAUSE_MS', 0))
+
+# Opt-in: STT_VAD_TRIM=1 (trimming changes the uploaded bytes, so cache keys too)
+TRIM_SILENCE = os.getenv('STT_VAD_TRIM', '0') == '1'
+
+
+def read_wav_bytes(data):
+    """
+    Decode 16-bit PCM WAV bytes
+
+    Returns:
+        (samples, sample_rate, channels) with samples as int16 array of shape
+        (frames, channels), or None if data is not 16-bit PCM WAV
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as wav_file:
+            if wav_file.getsampwidth() != 2:
+                return None
+            channels = wav_file.getnchannels()
+            sample_rate = wav_file.getframerate()
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    samples = np.frombuffer(frames, dtype='<i2').reshape(-1, channels)
+    return samples, sample_rate, channels
+
+
+def wav_duration(data):
+    """Duration in seconds from the WAV header, or None if data is not WAV"""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as wav_file:
+            return wav_file.getnframes() / float(wav_file.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+
+def read_wav_file(path):
+    with open(path, 'rb') as f:
+        return read_wav_bytes(f.read())
+
+
+def to_wav_bytes(samples, sample_rate):
+    """Encode an int16 (frames, channels) array as WAV bytes"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+    return buffer.getvalue()
+
+
+def frame_levels_db(samples, sample_rate, frame_ms=FRAME_MS):
+    """RMS level (dBFS) of each frame_ms frame of the mono mix"""
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    mono = samples.astype(np.float32).mean(axis=1) / 32768.0
+    n_frames = int(np.ceil(len(mono) / frame_len))
+    padded = np.zeros(n_frames * frame_len, dtype=np.float32)
+    padded[:len(mono)] = mono
+    rms = np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6)), frame_len
+
+
+def detect_speech(samples, sample_rate, frame_ms=FRAME_MS, padding_ms=PADDING_MS):
+    """
+    Find speech regions
+
+    Args:
+        samples: int16 array of shape (frames, channels)
+        sample_rate: Sample rate in Hz
+        frame_ms: Analysis frame length
+        padding_ms: Audio kept before/after each speech region
+
+    Returns:
+        List of (start_sample, end_sample) regions, in order, non-overlapping
+    """
+    if len(samples) == 0:
+        return []
+    levels, frame_len = frame_levels_db(samples, sample_rate, frame_ms)
+    # Above the noise floor, but never so high that a recording with no silence
+    # at all (floor == speech level) loses its speech
+    floor = np.percentile(levels, NOISE_FLOOR_PERCENTILE)
+    threshold = max(min(floor + SPEECH_ABOVE_FLOOR_DB, levels.max() - SPEECH_BELOW_PEAK_DB), MIN_SPEECH_DB)
+    speech = levels > threshold
+    if not speech.any():
+        return []
+
+    # Pad speech frames on both sides (dilation), then read off contiguous runs
+    pad = int(np.ceil(padding_ms / frame_ms))
+    if pad:
+        speech = np.convolve(speech.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode='same') > 0
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * frame_len
+    ends = np.minimum(np.flatnonzero(edges == -1) * frame_len, len(samples))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def merge_regions(regions, sample_rate, min_pause_ms):
+    """Merge regions separated by pauses shorter than min_pause_ms"""
+    min_gap = sample_rate * min_pause_ms // 1000
+    merged = []
+    for start, end in regions:
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def speech_segments(samples, sample_rate, split_pause_ms=0):
+    """
+    Speech segments to transcribe
+
+    Args:
+        split_pause_ms: Split on pauses at least this long; 0 keeps a single
+                        segment from the first to the last speech (trim only)
+
+    Returns:
+        List of (start_sample, end_sample)
+    """
+    regions = detect_speech(samples, sample_rate)
+    if not regions:
+        return []
+    if not split_pause_ms:
+        return [(regions[0][0], regions[-1][1])]
+    return merge_regions(regions, sample_rate, split_pause_ms)
+
+
+def prepare_segments(data, trim=TRIM_SILENCE, split_pause_ms=SPLIT_PAUSE_MS):
+    """
+    Trim/split WAV audio before transcription
+
+    Args:
+        data: Audio bytes
+        trim: Trim leading/trailing silence
+        split_pause_ms: Split on pauses at least this long (0 = don't split)
+
+    Returns:
+        None if data is not 16-bit PCM WAV or VAD is disabled (send as-is);
+        otherwise a list of {"start", "end", "audio"} dicts, where start/end are
+        offsets in seconds in the original recording and audio is WAV bytes.
+        An empty list means no speech was detected.
+    """
+    if not trim and not split_pause_ms:
+        return None
+    decoded = read_wav_bytes(data)
+    if decoded is None:
+        return None
+    samples, sample_rate, _ = decoded
+    return [
+        {
+            "start": start / sample_rate,
+            "end": end / sample_rate,
+            "audio": to_wav_bytes(samples[start:end], sample_rate)
+        }
+        for start, end in speech_segments(samples, sample_rate, split_pause_ms)
+    ]
+
+
+def plan_chunks(samples, sample_rate, max_chunk_seconds=50, overlap_seconds=1.0):
+    """
+    Split a long recording into chunks short enough for synchronous recognize
+
+    Cuts are placed in a silence gap in the second half of each window when one
+    exists (no overlap needed). Otherwise the window is cut at its maximum
+    length, and the next chunk starts overlap_seconds earlier so words on the
+    cut aren't lost.
+
+    Returns:
+        List of (start_sample, end_sample, keep_start_sample, keep_end_sample).
+        keep_* is the part of the chunk that owns its words when stitching.
+        Overlapping chunks split ownership at the middle of the overlap.
+    """
+    total = len(samples)
+    max_len = int(max_chunk_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    if total <= max_len:
+        return [(0, total, 0, total)]
+
+    # Silence gaps between speech regions, as (gap_start, gap_end)
+    regions = detect_speech(samples, sample_rate)
+    gaps = [(regions[i][1], regions[i + 1][0]) for i in range(len(regions) - 1)]
+
+    chunks = []
+    start = 0
+    keep_start = 0
+    while start < total:
+        limit = start + max_len
+        if limit >= total:
+            chunks.append((start, total, keep_start, total))
+            break
+
+        # Widest silence gap whose middle is in the second half of the window
+        best = None
+        for gap_start, gap_end in gaps:
+            middle = (gap_start + gap_end) // 2
+            if start + max_len // 2 <= middle < limit:
+                if best is None or gap_end - gap_start > best[1] - best[0]:
+                    best = (gap_start, gap_end)
+
+        if best is not None:
+            cut = (best[0] + best[1]) // 2
+            chunks.append((start, cut, keep_start, cut))
+            start = keep_start = cut
+        else:
+            next_start = max(limit - overlap, start + 1)
+            boundary = (next_start + limit) // 2
+            chunks.append((start, limit, keep_start, boundary))
+            start, keep_start = next_start, boundary
+    return chunks
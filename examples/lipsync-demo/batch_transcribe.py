@@ -0,0 +1,187 @@
+# Batch transcription CLI
+# Transcribe cả thư mục bản ghi phỏng vấn song song bằng process pool,
+# bỏ qua file đã có _transcription.json mới hơn audio (resume được).
+#
+# Usage:
+#   python batch_transcribe.py recordings/ --workers 8 --language vi-VN
+#   python batch_transcribe.py a.wav b.wav --force
+
+import argparse
+import json
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audio_normalize import flac_info, opus_info
+from speech_to_text import SpeechToText
+
+# Formats SpeechToText.transcribe_audio_file accepts (MP3 / M4A are rejected)
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.opus', '.webm')
+
+# One SpeechToText per worker process (created by the pool initializer)
+_worker_stt = None
+
+
+def transcription_path(audio_file):
+    return os.path.splitext(audio_file)[0] + "_transcription.json"
+
+
+def is_up_to_date(audio_file):
+    """True if the _transcription.json exists and is newer than the audio"""
+    output_file = transcription_path(audio_file)
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(audio_file)
+    except OSError:
+        return False
+
+
+def audio_duration(audio_file):
+    """Duration in seconds (WAV, FLAC, Ogg Opus; None for other formats)"""
+    try:
+        with wave.open(audio_file, 'rb') as wav_file:
+            return wav_file.getnframes() / float(wav_file.getframerate())
+    except (wave.Error, EOFError):
+        pass
+    except OSError:
+        return None
+    with open(audio_file, 'rb') as f:
+        content = f.read()
+    info = flac_info(content) or opus_info(content)
+    return info[-1] if info else None
+
+
+def find_audio_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(AUDIO_EXTENSIONS):
+                        files.append(os.path.join(root, name))
+        elif os.path.isfile(path):
+            if path.lower().endswith(AUDIO_EXTENSIONS):
+                files.append(path)
+            else:
+                print(f"⚠️ Unsupported format, skipping: {path} (expected {', '.join(AUDIO_EXTENSIONS)})")
+        else:
+            print(f"⚠️ Not found: {path}")
+    return files
+
+
+def _init_worker(credentials_path):
+    global _worker_stt
+    _worker_stt = SpeechToText(credentials_path)
+
+
+def _transcribe_one(audio_file, language, options):
+    started = time.perf_counter()
+    result = _worker_stt.transcribe_audio_file(audio_file, language_code=language, **options)
+    if result["success"]:
+        with open(transcription_path(audio_file), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return {
+        "file": audio_file,
+        "success": result["success"],
+        "error": result.get("error"),
+        "seconds": time.perf_counter() - started,
+        "audio_seconds": audio_duration(audio_file)
+    }
+
+
+def run_batch(audio_files, language="en-US", workers=4, force=False,
+              credentials_path=None, options=None):
+    """
+    Transcribe audio files in a process pool
+
+    Args:
+        audio_files: List of audio file paths
+        language: Language code
+        workers: Max concurrent worker processes
+        force: Re-transcribe files whose _transcription.json is up to date
+        credentials_path: Service account JSON (optional)
+        options: Extra keyword arguments for SpeechToText.transcribe_audio_file
+
+    Returns:
+        Summary dictionary
+    """
+    options = options or {}
+    pending = [f for f in audio_files if force or not is_up_to_date(f)]
+    skipped = len(audio_files) - len(pending)
+    if skipped:
+        print(f"⏭️  Skipping {skipped} up-to-date file(s)")
+
+    started = time.perf_counter()
+    done = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(credentials_path,)) as executor:
+            futures = {executor.submit(_transcribe_one, f, language, options): f for f in pending}
+            for future in as_completed(futures):
+                try:
+                    item = future.result()
+                except Exception as e:
+                    item = {"file": futures[future], "success": False, "error": str(e),
+                            "seconds": 0.0, "audio_seconds": None}
+                done.append(item)
+                status = "✅" if item["success"] else f"❌ {item['error']}"
+                print(f"[{len(done)}/{len(pending)}] {item['file']} ({item['seconds']:.2f}s) {status}")
+    elapsed = time.perf_counter() - started
+
+    audio_seconds = sum(item["audio_seconds"] or 0 for item in done if item["success"])
+    summary = {
+        "files": len(audio_files),
+        "skipped": skipped,
+        "transcribed": sum(1 for item in done if item["success"]),
+        "failed": sum(1 for item in done if not item["success"]),
+        "elapsed_seconds": elapsed,
+        "files_per_second": len(done) / elapsed if elapsed > 0 else 0.0,
+        "audio_seconds": audio_seconds,
+        "audio_seconds_per_second": audio_seconds / elapsed if elapsed > 0 else 0.0
+    }
+    return summary
+
+
+def print_summary(summary):
+    print("\n=== BATCH SUMMARY ===")
+    print(f"Files: {summary['files']} (skipped {summary['skipped']}, "
+          f"transcribed {summary['transcribed']}, failed {summary['failed']})")
+    print(f"Elapsed: {summary['elapsed_seconds']:.2f}s")
+    print(f"Throughput: {summary['files_per_second']:.2f} files/s, "
+          f"{summary['audio_seconds_per_second']:.2f} audio-seconds/s "
+          f"({summary['audio_seconds']:.1f}s of audio with a known duration)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch transcribe audio files with Google Cloud Speech-to-Text")
+    parser.add_argument("paths", nargs="+", help="Audio files or directories")
+    parser.add_argument("--language", default="en-US", help="Language code (default: en-US)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="Max concurrent worker processes")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-transcribe files whose _transcription.json is up to date")
+    parser.add_argument("--credentials", default=None, help="Service account JSON (optional)")
+    parser.add_argument("--trim-silence", action="store_true", help="Trim leading/trailing silence (WAV)")
+    args = parser.parse_args(argv)
+
+    audio_files = find_audio_files(args.paths)
+    if not audio_files:
+        print("No audio files found")
+        return 1
+
+    print(f"Found {len(audio_files)} audio files, {args.workers} workers")
+    summary = run_batch(
+        audio_files,
+        language=args.language,
+        workers=args.workers,
+        force=args.force,
+        credentials_path=args.credentials,
+        options={"trim_silence": args.trim_silence}
+    )
+    print_summary(summary)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
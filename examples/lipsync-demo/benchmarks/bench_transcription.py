@@ -0,0 +1,396 @@
+# Load test / benchmark for the transcription serving path
+# Chạy server (Flask hoặc ASGI) với Gemini / Cloud Speech giả lập, replay các
+# file audio thật ở mức concurrency cố định, báo cáo throughput, latency
+# percentiles và peak RSS. Không cần mạng hay API key.
+#
+# Usage:
+#   python benchmarks/bench_transcription.py --requests 500 --concurrency 32
+#   python benchmarks/bench_transcription.py --server asgi --latency-ms 800 --tail-rate 0.05 --tail-ms 4000
+#   python benchmarks/bench_transcription.py --target stt --concurrency 8
+#   python benchmarks/bench_transcription.py --error-rate 0.1 --quota-rate 0.05 --json report.json
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import threading
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.dirname(HERE)
+sys.path.insert(0, DEMO_DIR)
+
+from fake_backends import FakeGeminiClient, FakeSpeechClient, LatencyModel  # noqa: E402
+
+DEFAULT_AUDIO_DIR = os.path.join(DEMO_DIR, "public", "audios")
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.webm', '.ogg', '.flac')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_payloads(audio_dir):
+    paths = sorted(
+        os.path.join(audio_dir, name) for name in os.listdir(audio_dir)
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    if not paths:
+        raise SystemExit(f"No audio files in {audio_dir}")
+    payloads = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            payloads.append((path, f.read()))
+    return payloads
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (server + load generator)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered), max(1, -(-q * len(ordered) // 100))) - 1
+    return ordered[int(index)]
+
+
+def summarize(latencies, statuses, elapsed, extra=None):
+    report = {
+        "requests": len(latencies),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "latency_ms": {
+            f"p{q}": round(percentile(latencies, q) * 1000, 1) for q in PERCENTILES
+        } if latencies else {},
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None
+    }
+    if latencies:
+        report["latency_ms"]["max"] = round(max(latencies) * 1000, 1)
+        report["latency_ms"]["mean"] = round(sum(latencies) / len(latencies) * 1000, 1)
+    report.update(extra or {})
+    return report
+
+
+def run_load(total, concurrency, fn):
+    """
+    Call fn(i) for i in range(total) with `concurrency` callers in flight
+
+    Returns:
+        (latencies, statuses, elapsed)
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            status = fn(i)
+            seconds = time.perf_counter() - started
+            with lock:
+                latencies.append(seconds)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return latencies, statuses, time.perf_counter() - started
+
+
+# --- HTTP server target (speech_api.py / speech_api_async.py) ---
+
+def start_flask(app):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def start_asgi(app):
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    # Hypercorn can't report an ephemeral port back, so pick a free one first
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.accesslog = None
+    loop = asyncio.new_event_loop()
+    stop_event = asyncio.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve(app, config, shutdown_trigger=stop_event.wait))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{port}"
+    _wait_until_up(url)
+
+    def stop():
+        loop.call_soon_threadsafe(stop_event.set)
+        thread.join(timeout=5)
+    return url, stop
+
+
+def _wait_until_up(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url + "/health", timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.05)
+    raise SystemExit(f"Server at {url} did not start")
+
+
+def build_request(url, endpoint, audio, language):
+    if endpoint == "binary":
+        return urllib.request.Request(
+            f"{url}/transcribe-binary?language={language}", data=audio,
+            headers={"Content-Type": "application/octet-stream"}
+        )
+    if endpoint == "blob":
+        body = json.dumps({
+            "audioData": "data:audio/mpeg;base64," + base64.b64encode(audio).decode('ascii'),
+            "language": language
+        }).encode('utf-8')
+        return urllib.request.Request(
+            f"{url}/transcribe-blob", data=body, headers={"Content-Type": "application/json"}
+        )
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def bench_api(args, latency):
+    # Configure before speech_api is imported: Gemini only, no disk cache, no real key
+    os.environ["STT_BACKENDS"] = "gemini"
+    os.environ.pop("GEMINI_API_KEY", None)
+    os.environ.pop("STT_CACHE_DIR", None)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import speech_api
+        if args.server == "asgi":
+            import speech_api_async
+            app = speech_api_async.app
+        else:
+            app = speech_api.app
+    speech_api.stt_api.client = FakeGeminiClient(latency)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    payloads = load_payloads(args.audio_dir)
+    url, stop = start_asgi(app) if args.server == "asgi" else start_flask(app)
+
+    def one(i):
+        path, audio = payloads[i % len(payloads)]
+        if not args.allow_cache_hits:
+            # Unique bytes per request so the transcription cache / coalescing
+            # don't turn the run into a cache benchmark
+            audio = audio + i.to_bytes(8, 'little')
+        request = build_request(url, args.endpoint, audio, args.language)
+        try:
+            with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                body = json.loads(response.read())
+                return 200 if body.get("success") else "200-error"
+        except urllib.error.HTTPError as e:
+            return e.code
+        except Exception as e:
+            return type(e).__name__
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            latencies, statuses, elapsed = run_load(args.requests, args.concurrency, one)
+    finally:
+        stop()
+
+    payload_bytes = sum(len(audio) for _, audio in payloads) / len(payloads)
+    return summarize(latencies, statuses, elapsed, {
+        "target": f"api:{args.server}",
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "payload_files": len(payloads),
+        "avg_payload_kb": round(payload_bytes / 1024, 1),
+        "backend_calls": latency.calls
+    })
+
+
+# --- speech_to_text.py target (Cloud Speech path) ---
+
+# Generated when the audio dir has nothing transcribe_audio_file accepts
+# and there's no ffmpeg to transcode it
+SYNTHETIC_CLIPS = 8
+SYNTHETIC_SAMPLE_RATE = 16000
+
+
+def synthetic_wav_payloads(out_dir, seed):
+    """Speech-length 16 kHz WAVs: voiced syllables (harmonic stacks) between short pauses"""
+    from audio_vad import to_wav_bytes
+
+    rng = np.random.default_rng(seed)
+    sr = SYNTHETIC_SAMPLE_RATE
+    paths = []
+    for n in range(SYNTHETIC_CLIPS):
+        parts = []
+        for _ in range(rng.integers(6, 14)):
+            t = np.arange(int(rng.uniform(0.15, 0.4) * sr)) / sr
+            f0 = rng.uniform(100, 220)
+            voiced = sum(np.sin(2 * np.pi * k * f0 * t) / k for k in range(1, 12))
+            parts += [0.2 * voiced * np.hanning(len(t)), np.zeros(int(rng.uniform(0.05, 0.3) * sr))]
+        samples = (np.concatenate(parts) * 32767).astype('<i2')[:, None]
+        path = os.path.join(out_dir, f"synthetic_{n:02d}.wav")
+        with open(path, 'wb') as f:
+            f.write(to_wav_bytes(samples, sr))
+        paths.append(path)
+    return paths
+
+
+def stt_payload_files(audio_dir, out_dir, seed):
+    """
+    Files SpeechToText.transcribe_audio_file accepts
+
+    Other formats in audio_dir (the demo clips are MP3) are transcoded to 16 kHz
+    WAV into out_dir with ffmpeg; without ffmpeg they are skipped, and if
+    nothing usable is left, synthetic WAVs are generated instead.
+
+    Returns:
+        (paths, source): source is "files", "transcoded" or "synthetic"
+    """
+    from audio_normalize import resample, to_pcm16
+    from audio_vad import to_wav_bytes
+    from batch_transcribe import AUDIO_EXTENSIONS as STT_EXTENSIONS
+    from viseme_analysis import load_audio
+
+    paths, other = [], []
+    for path, _ in load_payloads(audio_dir):
+        (paths if path.lower().endswith(STT_EXTENSIONS) else other).append(path)
+
+    source = "files"
+    if other and shutil.which('ffmpeg') is not None:
+        for path in other:
+            samples, sample_rate = load_audio(path)
+            mono = resample(samples, sample_rate, SYNTHETIC_SAMPLE_RATE)
+            wav_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".wav")
+            with open(wav_path, 'wb') as f:
+                f.write(to_wav_bytes(to_pcm16(mono)[:, None], SYNTHETIC_SAMPLE_RATE))
+            paths.append(wav_path)
+        source = "transcoded"
+    elif other:
+        print(f"⚠️ Skipping {len(other)} file(s) in formats transcribe_audio_file rejects "
+              f"(install ffmpeg to transcode them)", file=sys.stderr)
+    if not paths:
+        print("⚠️ No usable audio, generating synthetic WAV payloads", file=sys.stderr)
+        paths, source = synthetic_wav_payloads(out_dir, seed), "synthetic"
+    return paths, source
+
+
+def bench_stt(args, latency):
+    from speech_to_text import SpeechToText
+
+    # Skip credential loading; the client is replaced by the fake anyway
+    stt = SpeechToText.__new__(SpeechToText)
+    stt.client = FakeSpeechClient(latency)
+
+    with tempfile.TemporaryDirectory(prefix="bench_stt_") as out_dir:
+        paths, source = stt_payload_files(args.audio_dir, out_dir, args.seed)
+
+        def one(i):
+            result = stt.transcribe_audio_file(paths[i % len(paths)], language_code=args.language)
+            return "ok" if result["success"] else "error"
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            latencies, statuses, elapsed = run_load(args.requests, args.concurrency, one)
+    return summarize(latencies, statuses, elapsed, {
+        "target": "stt",
+        "concurrency": args.concurrency,
+        "payload_files": len(paths),
+        "payload_source": source,
+        "backend_calls": latency.calls
+    })
+
+
+def print_report(report):
+    print("\n=== BENCHMARK REPORT ===")
+    print(f"Target: {report['target']}" + (f" ({report['endpoint']})" if "endpoint" in report else ""))
+    print(f"Requests: {report['requests']} at concurrency {report['concurrency']} "
+          f"in {report['elapsed_seconds']:.2f}s")
+    print(f"Throughput: {report['throughput_rps']:.2f} req/s")
+    latency = report["latency_ms"]
+    if latency:
+        print("Latency (ms): " + ", ".join(f"{name} {value:.1f}" for name, value in latency.items()))
+    print(f"Statuses: {report['statuses']}")
+    print(f"Backend calls: {report['backend_calls']}")
+    if report["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the transcription serving path")
+    parser.add_argument("--target", choices=("api", "stt"), default="api",
+                        help="api: HTTP server (speech_api); stt: SpeechToText (Cloud Speech path)")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask", help="Server for --target api")
+    parser.add_argument("--endpoint", choices=("binary", "blob"), default="binary", help="Upload endpoint")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--audio-dir", default=DEFAULT_AUDIO_DIR, help="Directory of audio payloads")
+    parser.add_argument("--language", default="vi-VN")
+    parser.add_argument("--allow-cache-hits", action="store_true",
+                        help="Replay payloads byte-for-byte (cache / coalescing will absorb repeats)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Fake backend median latency")
+    parser.add_argument("--jitter-ms", type=float, default=None,
+                        help="Fake backend latency jitter (+/-, default: 25%% of --latency-ms)")
+    parser.add_argument("--tail-ms", type=float, default=0, help="Extra latency of slow calls")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of slow calls")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 errors")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="Fraction of 429 errors")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed (reproducible runs)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request client timeout")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    latency = LatencyModel(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms if args.jitter_ms is not None else args.latency_ms * 0.25,
+        tail_ms=args.tail_ms,
+        tail_rate=args.tail_rate, error_rate=args.error_rate, quota_rate=args.quota_rate,
+        seed=args.seed
+    )
+    report = bench_api(args, latency) if args.target == "api" else bench_stt(args, latency)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# Offline stand-ins for Gemini and Google Cloud Speech
+# Giả lập latency (kể cả đuôi chậm) và lỗi (500 / 429) để đo serving path mà
+# không cần mạng hay API key.
+
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class LatencyModel:
+    def __init__(self, latency_ms=300, jitter_ms=100, tail_ms=0, tail_rate=0.0,
+                 error_rate=0.0, quota_rate=0.0, seed=None):
+        """
+        Latency / failure injection shared by the fake clients
+
+        Args:
+            latency_ms: Median call latency
+            jitter_ms: Uniform +/- jitter around latency_ms
+            tail_ms: Extra latency added to slow calls
+            tail_rate: Fraction of calls that are slow (0..1)
+            error_rate: Fraction of calls failing with a 500 error
+            quota_rate: Fraction of calls failing with 429 RESOURCE_EXHAUSTED
+            seed: Random seed, for reproducible runs
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def next_call(self):
+        """(delay_seconds, error_message_or_None) for the next call"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            if self._random.random() < self.tail_rate:
+                delay += self.tail_ms
+            roll = self._random.random()
+        error = None
+        if roll < self.quota_rate:
+            error = "429 RESOURCE_EXHAUSTED. Quota exceeded (fake)"
+        elif roll < self.quota_rate + self.error_rate:
+            error = "500 INTERNAL. Fake backend error"
+        return max(0.0, delay) / 1000.0, error
+
+
+class _FakeModels:
+    def __init__(self, latency, transcript):
+        self.latency = latency
+        self.transcript = transcript
+
+    def generate_content(self, model, contents, config=None):
+        delay, error = self.latency.next_call()
+        time.sleep(delay)
+        if error:
+            raise Exception(error)
+        return SimpleNamespace(text=self.transcript)
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def generate_content(self, model, contents, config=None):
+        delay, error = self.latency.next_call()
+        await asyncio.sleep(delay)
+        if error:
+            raise Exception(error)
+        return SimpleNamespace(text=self.transcript)
+
+
+class FakeGeminiClient:
+    def __init__(self, latency, transcript="xin chào, đây là câu trả lời thử nghiệm"):
+        """Drop-in for genai.Client: .models.generate_content and .aio.models.generate_content"""
+        self.latency = latency
+        self.models = _FakeModels(latency, transcript)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(latency, transcript))
+
+
+class FakeSpeechClient:
+    def __init__(self, latency, transcript="hello this is a test answer"):
+        """Drop-in for speech.SpeechClient.recognize"""
+        self.latency = latency
+        self.transcript = transcript
+
+    def recognize(self, config, audio):
+        delay, error = self.latency.next_call()
+        time.sleep(delay)
+        if error:
+            raise Exception(error)
+        words = [
+            SimpleNamespace(
+                word=word,
+                start_time=_Duration(i * 0.4),
+                end_time=_Duration(i * 0.4 + 0.35)
+            )
+            for i, word in enumerate(self.transcript.split())
+        ]
+        alternative = SimpleNamespace(transcript=self.transcript, confidence=0.93, words=words)
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+
+class _Duration:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def total_seconds(self):
+        return self.seconds
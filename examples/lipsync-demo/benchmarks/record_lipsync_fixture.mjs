@@ -0,0 +1,93 @@
+// Record a viseme fixture from the real wawa-lipsync Lipsync (lipsync.ts)
+//
+// Node has no Web Audio, so the AnalyserNode is replaced by one that replays
+// byte frequency frames written by viseme_parity.py, and performance.now()
+// advances 1/fps per frame. Everything after getByteFrequencyData (features,
+// history, scores, consistency boost) is the untouched TS code.
+//
+// Needs Node >= 22.7 (runs TypeScript with --experimental-transform-types):
+//   node --experimental-transform-types benchmarks/record_lipsync_fixture.mjs \
+//     frames.u8 --bins 1024 --fps 60 --sample-rate 48000 > fixture.json
+
+import { readFileSync } from "node:fs";
+import { register } from "node:module";
+import { dirname, join } from "node:path";
+import { fileURLToPath, pathToFileURL } from "node:url";
+
+const HERE = dirname(fileURLToPath(import.meta.url));
+const LIPSYNC_TS = join(HERE, "..", "..", "..", "packages", "wawa-lipsync", "src", "lipsync.ts");
+
+// The package imports "./visemes" etc. without extensions (bundler resolution)
+register(
+  "data:text/javascript," +
+    encodeURIComponent(`
+export async function resolve(specifier, context, next) {
+  if (specifier.startsWith(".") && context.parentURL?.endsWith(".ts") && !/\\.[a-z]+$/.test(specifier)) {
+    return next(specifier + ".ts", context);
+  }
+  return next(specifier, context);
+}`)
+);
+
+function parseArgs(argv) {
+  const args = { bins: 1024, fps: 60, sampleRate: 48000 };
+  const rest = [];
+  for (let i = 0; i < argv.length; i++) {
+    if (argv[i] === "--bins") args.bins = Number(argv[++i]);
+    else if (argv[i] === "--fps") args.fps = Number(argv[++i]);
+    else if (argv[i] === "--sample-rate") args.sampleRate = Number(argv[++i]);
+    else rest.push(argv[i]);
+  }
+  if (rest.length !== 1) {
+    throw new Error("Usage: record_lipsync_fixture.mjs FRAMES_U8 [--bins N] [--fps N] [--sample-rate N]");
+  }
+  args.frames = rest[0];
+  return args;
+}
+
+const args = parseArgs(process.argv.slice(2));
+const bytes = new Uint8Array(readFileSync(args.frames));
+const frameCount = bytes.length / args.bins;
+let frame = 0;
+let nowMs = 0;
+
+class ReplayAnalyser {
+  constructor() {
+    this.fftSize = args.bins * 2;
+  }
+  get frequencyBinCount() {
+    return args.bins;
+  }
+  getByteFrequencyData(target) {
+    target.set(bytes.subarray(frame * args.bins, (frame + 1) * args.bins));
+  }
+}
+
+globalThis.window = {
+  AudioContext: class {
+    constructor() {
+      this.sampleRate = args.sampleRate;
+    }
+    createAnalyser() {
+      return new ReplayAnalyser();
+    }
+  },
+};
+globalThis.performance = { now: () => nowMs };
+
+const { Lipsync } = await import(pathToFileURL(LIPSYNC_TS).href);
+const lipsync = new Lipsync({ fftSize: args.bins * 2, historySize: 10 });
+
+// connectAudio() state reset, without a media element
+lipsync.visemeStartTime = nowMs;
+
+// Same clock as viseme_analysis.select_visemes (frame * frameMs): the 100 ms
+// boost boundary is exact, so timestamps must round the same way
+const frameMs = 1000 / args.fps;
+const visemes = [];
+for (frame = 0; frame < frameCount; frame++) {
+  nowMs = frame * frameMs;
+  lipsync.processAudio();
+  visemes.push(lipsync.viseme);
+}
+process.stdout.write(JSON.stringify({ fps: args.fps, visemes }) + "\n");
@@ -0,0 +1,196 @@
+# Parity check: viseme_analysis.py vs wawa-lipsync's Lipsync (lipsync.ts)
+# Kiểm tra hai phần, frame theo frame:
+#   1. byte_frequency_data (vector hoá) so với AnalyserNode mô phỏng từng lần poll
+#      (FFT + smoothing + thang dB -> byte, không vector hoá)
+#   2. analyze() so với viseme do chính lipsync.ts tạo ra trên cùng byte data
+#      (fixture ghi bằng record_lipsync_fixture.mjs, lưu trong benchmarks/fixtures)
+# Clip tổng hợp (nguyên âm có formant, phụ âm xát, bật hơi, khoảng lặng) được
+# sinh lại mỗi lần chạy với seed cố định. Exit code 1 nếu lệch.
+#
+# Usage:
+#   python benchmarks/viseme_parity.py
+#   python benchmarks/viseme_parity.py --record --node ~/.nvm/versions/node/v22.20.0/bin/node
+#   python benchmarks/viseme_parity.py --audio clip.wav --node node22   (ghi trực tiếp, không lưu fixture)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.dirname(HERE)
+sys.path.insert(0, DEMO_DIR)
+
+from viseme_analysis import (  # noqa: E402
+    CONTEXT_SAMPLE_RATE, DEFAULT_FPS, FFT_SIZE, MAX_DECIBELS, MIN_DECIBELS, RENDER_QUANTUM,
+    SMOOTHING_TIME_CONSTANT, analyze, byte_frequency_data, compare_with_fixture, load_audio, resample
+)
+
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+RECORDER = os.path.join(HERE, "record_lipsync_fixture.mjs")
+
+SEED = 1234
+
+# Formants (Hz) of the synthetic vowels
+VOWEL_FORMANTS = {
+    "a": (800, 1200, 2500),
+    "e": (500, 1900, 2600),
+    "i": (300, 2300, 3000),
+    "o": (500, 900, 2400),
+    "u": (320, 800, 2300),
+}
+
+
+def _vowel(formants, seconds, sr, f0=140.0):
+    """Harmonic stack shaped by formant resonances"""
+    t = np.arange(int(seconds * sr)) / sr
+    out = np.zeros_like(t)
+    for k in range(1, int(5000 // f0)):
+        freq = k * f0
+        gain = sum(1.0 / (1.0 + ((freq - f) / 90.0) ** 2) for f in formants)
+        out += gain * np.sin(2 * np.pi * freq * t)
+    return 0.25 * out / np.abs(out).max()
+
+
+def _band_noise(rng, low, high, seconds, sr, level):
+    """White noise band-limited with an FFT mask"""
+    noise = rng.standard_normal(int(seconds * sr))
+    spectrum = np.fft.rfft(noise)
+    freqs = np.fft.rfftfreq(len(noise), 1.0 / sr)
+    spectrum[(freqs < low) | (freqs > high)] = 0
+    band = np.fft.irfft(spectrum, len(noise))
+    return level * band / np.abs(band).max()
+
+
+def _silence(seconds, sr):
+    return np.zeros(int(seconds * sr))
+
+
+def synthetic_clips(sr=CONTEXT_SAMPLE_RATE):
+    """Deterministic test clips: {name: float32 samples at sr}"""
+    rng = np.random.default_rng(SEED)
+    vowels = []
+    for name in "aeiouaoeiu":
+        vowels += [_vowel(VOWEL_FORMANTS[name], 0.3, sr), _silence(0.12, sr)]
+
+    consonants = []
+    for low, high, level in ((4000, 9000, 0.5), (2500, 4000, 0.4), (6000, 12000, 0.6), (1000, 3000, 0.3)):
+        burst = _band_noise(rng, low, high, 0.02, sr, 0.9)
+        consonants += [_silence(0.15, sr), burst, _band_noise(rng, low, high, 0.2, sr, level),
+                       _vowel(VOWEL_FORMANTS["a"], 0.25, sr)]
+    consonants.append(_silence(0.2, sr))
+
+    speechlike = []
+    for i, name in enumerate("eaoiu" * 2):
+        fricative = _band_noise(rng, 3000 + 1000 * (i % 4), 11000, 0.08 + 0.02 * (i % 3), sr, 0.35)
+        speechlike += [fricative, _vowel(VOWEL_FORMANTS[name], 0.18 + 0.04 * (i % 3), sr),
+                       _silence(0.04 * (i % 2), sr)]
+    speechlike = np.concatenate(speechlike)
+
+    return {
+        "vowels": np.concatenate(vowels).astype(np.float32),
+        "consonants": np.concatenate(consonants).astype(np.float32),
+        "speechlike": speechlike.astype(np.float32),
+    }
+
+
+def reference_byte_frequency_data(samples, sample_rate, fps=DEFAULT_FPS, fft_size=FFT_SIZE):
+    """AnalyserNode.getByteFrequencyData, one poll at a time (no vectorization)"""
+    num_frames = int(np.ceil(len(samples) / float(sample_rate) * fps))
+    padded = np.concatenate([np.zeros(fft_size), samples.astype(np.float64)])
+    window = np.blackman(fft_size)
+    previous = np.zeros(fft_size // 2)
+    frames = []
+    for i in range(num_frames):
+        # Audio reaches the analyser one render quantum at a time
+        end = min(int(i * sample_rate / float(fps)) // RENDER_QUANTUM * RENDER_QUANTUM + fft_size, len(padded))
+        magnitude = np.abs(np.fft.rfft(padded[end - fft_size:end] * window))[:fft_size // 2] / fft_size
+        previous = SMOOTHING_TIME_CONSTANT * previous + (1 - SMOOTHING_TIME_CONSTANT) * magnitude
+        with np.errstate(divide='ignore'):
+            decibels = 20 * np.log10(previous)
+        frames.append(np.clip(np.floor(255.0 / (MAX_DECIBELS - MIN_DECIBELS) * (decibels - MIN_DECIBELS)), 0, 255))
+    return np.array(frames, dtype=np.uint8).reshape(-1, fft_size // 2)
+
+
+def record_fixture(node, samples, fps=DEFAULT_FPS):
+    """Run lipsync.ts on the analyser bytes of a 48 kHz clip; returns {"fps", "visemes"}"""
+    data = byte_frequency_data(samples, CONTEXT_SAMPLE_RATE, fps)
+    with tempfile.NamedTemporaryFile(suffix=".u8", delete=False) as f:
+        f.write(data.tobytes())
+        frames_path = f.name
+    try:
+        result = subprocess.run(
+            [node, "--experimental-transform-types", "--no-warnings", RECORDER, frames_path,
+             "--bins", str(data.shape[1]), "--fps", str(fps), "--sample-rate", str(CONTEXT_SAMPLE_RATE)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+        )
+    finally:
+        os.unlink(frames_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"Recorder failed (Node >= 22.7 required): {result.stderr.decode(errors='replace').strip()}")
+    return json.loads(result.stdout)
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURE_DIR, f"lipsync_{name}.json")
+
+
+def check_clip(name, samples, fixture, fps=DEFAULT_FPS):
+    """Print and return (analyser_ok, viseme_report) for one 48 kHz clip"""
+    data = byte_frequency_data(samples, CONTEXT_SAMPLE_RATE, fps)
+    reference = reference_byte_frequency_data(samples, CONTEXT_SAMPLE_RATE, fps)
+    # float32 windowing vs float64: allow one step where a value sits on a byte boundary
+    diff = np.abs(data.astype(np.int16) - reference.astype(np.int16))
+    analyser_ok = data.shape == reference.shape and diff.max(initial=0) <= 1
+
+    report = compare_with_fixture(analyze(samples, CONTEXT_SAMPLE_RATE, fps), fixture, fps)
+    print(f"{'✅' if analyser_ok else '❌'} {name}: analyser bytes max diff {diff.max(initial=0)} "
+          f"({np.count_nonzero(diff)} of {diff.size} values differ)")
+    print(f"   visemes {report['matching']}/{report['frames']} frames match Lipsync "
+          f"({report['agreement']:.1%}), first mismatch at frame {report['first_mismatch']}, "
+          f"{len(set(fixture['visemes']))} distinct visemes")
+    return analyser_ok, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check viseme_analysis.py against the TS Lipsync frame for frame")
+    parser.add_argument("--record", action="store_true", help="Re-record the synthetic clip fixtures (needs --node)")
+    parser.add_argument("--node", default=os.getenv("LIPSYNC_NODE"),
+                        help="Node >= 22.7 binary for recording (default: $LIPSYNC_NODE)")
+    parser.add_argument("--audio", nargs="*", default=[], help="Also check these clips, recorded live (needs --node)")
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="Fail below this fraction of matching frames (default: 1.0)")
+    args = parser.parse_args(argv)
+
+    if (args.record or args.audio) and not args.node:
+        print("❌ --record / --audio need a Node >= 22.7 binary (--node or LIPSYNC_NODE)", file=sys.stderr)
+        return 1
+
+    clips = synthetic_clips()
+    stored = set(clips)
+    for path in args.audio:
+        samples, sample_rate = load_audio(path)
+        clips[os.path.basename(path)] = resample(samples, sample_rate)
+
+    failed = False
+    for name, samples in clips.items():
+        if args.record or name not in stored:
+            fixture = record_fixture(args.node, samples)
+            if name in stored:
+                os.makedirs(FIXTURE_DIR, exist_ok=True)
+                with open(fixture_path(name), 'w', encoding='utf-8') as f:
+                    json.dump(fixture, f)
+        else:
+            with open(fixture_path(name), 'r', encoding='utf-8') as f:
+                fixture = json.load(f)
+        analyser_ok, report = check_clip(name, samples, fixture)
+        failed = failed or not analyser_ok or report["agreement"] < args.min_agreement
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# Process-wide registry of model clients
+# Giữ gRPC channel / HTTP connection "ấm" cho mỗi credentials, dùng chung giữa
+# các thread, để việc load credentials và TLS handshake không nằm trong latency
+# của từng request.
+
+import hashlib
+import os
+import threading
+
+from google import genai
+from google.cloud import speech
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+from google.oauth2 import service_account
+
+# Set STT_SHARED_CLIENTS=0 to build a fresh client on every call (old behaviour)
+SHARED_CLIENTS = os.getenv('STT_SHARED_CLIENTS', '1') != '0'
+
+# gRPC keepalive so idle pooled channels aren't silently dropped by proxies/NAT
+GRPC_KEEPALIVE_MS = int(os.getenv('STT_GRPC_KEEPALIVE_MS', 30000))
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _registry_key(kind, *parts):
+    # Include the pid: gRPC channels must not be shared across fork()
+    return (kind, os.getpid()) + parts
+
+
+def _get_or_create(key, factory):
+    if not SHARED_CLIENTS:
+        return factory()
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+
+def _create_speech_client(credentials_path):
+    credentials = None
+    if credentials_path:
+        credentials = service_account.Credentials.from_service_account_file(credentials_path)
+    channel = SpeechGrpcTransport.create_channel(
+        credentials=credentials,
+        options=[
+            ("grpc.max_send_message_length", -1),
+            ("grpc.max_receive_message_length", -1),
+            ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+            ("grpc.keepalive_permit_without_calls", 1),
+        ],
+    )
+    return speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+
+
+def get_speech_client(credentials_path=None):
+    """
+    Shared Cloud Speech client for the given credentials
+
+    Args:
+        credentials_path: Service account JSON path; None uses default credentials
+                          (GOOGLE_APPLICATION_CREDENTIALS)
+    """
+    path = os.path.abspath(credentials_path) if credentials_path else None
+    return _get_or_create(
+        _registry_key("speech", path),
+        lambda: _create_speech_client(path)
+    )
+
+
+def get_genai_client(api_key=None):
+    """
+    Shared Gemini client for the given API key
+
+    Args:
+        api_key: Gemini API key; None uses GEMINI_API_KEY
+    """
+    api_key = api_key or os.environ.get("GEMINI_API_KEY")
+    # Don't keep raw API keys around as dict keys
+    key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest() if api_key else None
+    return _get_or_create(
+        _registry_key("genai", key_id),
+        lambda: genai.Client(api_key=api_key)
+    )
+
+
+def registry_stats():
+    with _lock:
+        kinds = {}
+        for key in _clients:
+            kinds[key[0]] = kinds.get(key[0], 0) + 1
+        return {"shared": SHARED_CLIENTS, "clients": kinds}
@@ -0,0 +1,134 @@
+# Lipsync-ready audio: WAV + binary viseme track in one response
+# Audio TTS được phân tích viseme ngay trên server (phân tích phổ, hoặc căn theo
+# word timing của Speech-to-Text); track viseme (dạng nhị phân gọn "VTRK") được
+# gắn vào file WAV dưới dạng một RIFF chunk "vtrk". Trình phát audio bình thường
+# bỏ qua chunk này; client (wawa-lipsync decodeLipsyncWav) đọc
+# track để khỏi phải phân tích FFT mỗi frame và khỏi lệch giữa audio / miệng.
+#
+# VTRK (little-endian):
+#   header  "VTRK" | u8 version | u8 source | u16 reserved | u32 count
+#   entries count x (u32 start_ms | u8 viseme index in VISEMES order)
+
+import io
+import struct
+
+import numpy as np
+
+from audio_vad import read_wav_bytes, wav_duration
+from viseme_alignment import align_transcription, transcription_words
+from viseme_analysis import DEFAULT_FPS, VISEMES, analyze, viseme_track
+from wav_writer import StreamingWavWriter
+
+TRACK_MAGIC = b"VTRK"
+TRACK_FORMAT_VERSION = 1
+TRACK_CHUNK_ID = b"vtrk"
+
+# Where the track came from
+SOURCE_AUDIO = 0
+SOURCE_WORDS = 1
+SOURCES = {"audio": SOURCE_AUDIO, "words": SOURCE_WORDS}
+
+_HEADER = struct.Struct("<4sBBHI")
+_ENTRY = np.dtype([("start_ms", "<u4"), ("viseme", "u1")])
+
+_VISEME_INDEX = {name: i for i, name in enumerate(VISEMES)}
+
+
+def encode_track(track, source=SOURCE_AUDIO):
+    """[[start_ms, viseme], ...] -> VTRK bytes (5 bytes per viseme change)"""
+    entries = np.empty(len(track), dtype=_ENTRY)
+    entries["start_ms"] = [start for start, _ in track]
+    entries["viseme"] = [_VISEME_INDEX[viseme] for _, viseme in track]
+    return _HEADER.pack(TRACK_MAGIC, TRACK_FORMAT_VERSION, source, 0, len(track)) + entries.tobytes()
+
+
+def decode_track(data):
+    """
+    VTRK bytes -> (track, source)
+
+    Raises:
+        ValueError: data is not a VTRK track this version understands
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Viseme track too short")
+    magic, version, source, _, count = _HEADER.unpack_from(data)
+    if magic != TRACK_MAGIC or version != TRACK_FORMAT_VERSION:
+        raise ValueError("Not a VTRK v1 viseme track")
+    entries = np.frombuffer(data, dtype=_ENTRY, count=count, offset=_HEADER.size)
+    return [[int(start), VISEMES[viseme]] for start, viseme in zip(entries["start_ms"], entries["viseme"])], source
+
+
+def append_riff_chunk(wav_bytes, chunk_id, payload):
+    """Add a chunk at the end of a RIFF/WAVE file and fix up the RIFF size"""
+    if wav_bytes[:4] != b"RIFF" or wav_bytes[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    pad = b"\0" if len(payload) & 1 else b""
+    out = bytearray(wav_bytes)
+    out += struct.pack("<4sI", chunk_id, len(payload)) + payload + pad
+    struct.pack_into("<I", out, 4, len(out) - 8)
+    return bytes(out)
+
+
+def collect_pcm(chunks):
+    """
+    Gather streamed (data, mime_type) TTS chunks into one WAV
+
+    Returns:
+        (wav_bytes, mime_type), or (None, None) if no audio arrived
+    """
+    buffer = io.BytesIO()
+    writer = None
+    mime_type = None
+    for data, chunk_mime_type in chunks:
+        if writer is None:
+            mime_type = chunk_mime_type
+            writer = StreamingWavWriter.for_mime_type(buffer, mime_type)
+        writer.write(data)
+    if writer is None:
+        return None, None
+    writer.close()
+    return buffer.getvalue(), mime_type
+
+
+def wav_visemes(wav_bytes, fps=DEFAULT_FPS):
+    """Per-frame visemes of a 16-bit mono WAV produced by collect_pcm"""
+    decoded = read_wav_bytes(wav_bytes)
+    if decoded is None:
+        raise ValueError("Expected 16-bit PCM WAV audio")
+    samples, sample_rate, _ = decoded
+    return analyze(samples.astype(np.float32).mean(axis=1) / 32768.0, sample_rate, fps)
+
+
+def lipsync_wav(wav_bytes, track, source=SOURCE_AUDIO):
+    """WAV bytes with the viseme track embedded as a "vtrk" chunk"""
+    return append_riff_chunk(wav_bytes, TRACK_CHUNK_ID, encode_track(track, source))
+
+
+def render_lipsync_wav(wav_bytes, fps=DEFAULT_FPS, word_timings=None, language_code="en-US"):
+    """
+    Compute a viseme track for a WAV and embed it
+
+    Args:
+        wav_bytes: 16-bit PCM WAV
+        fps: Analysis frames per second (spectral analysis)
+        word_timings: Optional callable(wav_bytes, language_code) returning a
+                      SpeechToText result with word time offsets; the track is
+                      then aligned to the words, falling back to spectral
+                      analysis if no word timings come back
+        language_code: Language of the speech (grapheme rules for alignment)
+
+    Returns:
+        (lipsync_wav_bytes, track, source_name)
+    """
+    if word_timings is not None:
+        try:
+            result = word_timings(wav_bytes, language_code)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        if result.get("success") and transcription_words(result):
+            duration = wav_duration(wav_bytes)
+            track = align_transcription(result, language_code, duration)
+            return lipsync_wav(wav_bytes, track, SOURCE_WORDS), track, "words"
+        print(f"⚠️ No word timings ({result.get('error', 'no words')}), using spectral analysis")
+    track = viseme_track(wav_visemes(wav_bytes, fps), fps)
+    return lipsync_wav(wav_bytes, track, SOURCE_AUDIO), track, "audio"
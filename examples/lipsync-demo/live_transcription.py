@@ -0,0 +1,113 @@
+# Live transcription over WebSocket
+# Nhận audio frame từ microphone (PCM/Opus/FLAC), trả về kết quả interim/final ngay
+# trong lúc ứng viên đang nói, dựa trên SpeechToText.transcribe_streaming.
+#
+# Protocol (/ws/transcribe):
+#   1. client -> text:   {"language": "vi-VN", "sampleRate": 16000, "encoding": "LINEAR16"}
+#   2. client -> binary: audio frames
+#   3. client -> text:   "stop" (or {"event": "stop"}) when the answer is over
+#   server -> text: {"event": "ready"}
+#                   {"event": "result", "transcript": ..., "is_final": ..., "confidence": ...}
+#                   {"event": "end"} | {"event": "error", "error": ...}
+
+import json
+import os
+
+from speech_to_text import SpeechToText
+
+SUPPORTED_ENCODINGS = ("LINEAR16", "OGG_OPUS", "WEBM_OPUS", "FLAC")
+
+
+def get_live_stt():
+    """SpeechToText for a live session (cheap: the gRPC client is shared per process)"""
+    return SpeechToText(os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or None)
+
+
+def parse_start_message(message):
+    """
+    Parse the first (config) message of a live session
+
+    Returns:
+        Dict with language, sample_rate, encoding, interim_results
+
+    Raises:
+        ValueError: if the message is not a valid config
+    """
+    if not isinstance(message, str):
+        raise ValueError("First message must be a JSON config")
+    config = json.loads(message or "{}")
+    if not isinstance(config, dict):
+        raise ValueError("Config must be a JSON object")
+
+    encoding = str(config.get('encoding', 'LINEAR16')).upper()
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+
+    return {
+        "language": config.get('language', 'vi-VN'),
+        "sample_rate": int(config.get('sampleRate', 16000)),
+        "encoding": encoding,
+        "interim_results": bool(config.get('interimResults', True))
+    }
+
+
+def is_stop_message(message):
+    if not isinstance(message, str):
+        return False
+    if message.strip().lower() == "stop":
+        return True
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get('event') == 'stop'
+
+
+def audio_frames(receive):
+    """Yield binary frames from receive() until a stop message or disconnect (None)"""
+    while True:
+        message = receive()
+        if message is None or is_stop_message(message):
+            return
+        if isinstance(message, (bytes, bytearray)):
+            yield bytes(message)
+
+
+def event(name, **fields):
+    return json.dumps(dict(event=name, **fields), ensure_ascii=False)
+
+
+def run_live_session(receive, send):
+    """
+    Run one live transcription session (blocking; call from a worker thread)
+
+    Args:
+        receive: Callable returning the next client message (str, bytes, or None when closed)
+        send: Callable sending a text message to the client
+    """
+    try:
+        config = parse_start_message(receive())
+        stt = get_live_stt()
+        send(event("ready"))
+
+        for result in stt.transcribe_streaming(
+            audio_frames(receive),
+            language_code=config["language"],
+            sample_rate=config["sample_rate"],
+            interim_results=config["interim_results"],
+            encoding=config["encoding"]
+        ):
+            send(event(
+                "result",
+                transcript=result["transcript"],
+                is_final=result["is_final"],
+                confidence=result["confidence"]
+            ))
+
+        send(event("end"))
+
+    except ValueError as e:
+        send(event("error", error=f"Invalid request: {str(e)}"))
+    except Exception as e:
+        print(f"❌ Live transcription failed: {e}")
+        send(event("error", error=f"Live transcription failed: {str(e)}"))
@@ -0,0 +1,219 @@
+# Pre-render pipeline for public/dialogues.json
+# 1. Tổng hợp (TTS) audio còn thiếu cho từng câu thoại
+# 2. Phân tích viseme offline cho từng clip, ghi track ra public/visemes/*.json
+#    và thêm "visemeFile" vào dialogues.json để client khỏi phải phân tích real-time.
+# Bỏ qua clip có viseme track mới hơn audio (chạy lại được).
+#
+# Usage:
+#   python prerender_dialogues.py
+#   python prerender_dialogues.py public/dialogues.json --voice Kore --workers 4
+#   python prerender_dialogues.py --skip-tts --force
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from viseme_analysis import DEFAULT_FPS, analyze_file
+
+DEFAULT_DIALOGUES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public", "dialogues.json")
+DEFAULT_VOICE = "Zephyr"
+VISEME_DIR = "visemes"
+TTS_AUDIO_DIR = "audios"
+
+
+def iter_dialogues(manifest):
+    for conversation in manifest.get("conversations", []):
+        for dialogue in conversation.get("dialogues", []):
+            yield dialogue
+
+
+def public_path(public_dir, url):
+    """Filesystem path of a site-relative URL like /audios/a.mp3"""
+    return os.path.join(public_dir, *url.lstrip('/').split('/'))
+
+
+def viseme_url(audio_url):
+    stem = os.path.splitext(os.path.basename(audio_url))[0]
+    return f"/{VISEME_DIR}/{stem}.json"
+
+
+def is_up_to_date(audio_file, track_file):
+    try:
+        return os.path.getmtime(track_file) >= os.path.getmtime(audio_file)
+    except OSError:
+        return False
+
+
+def synthesize_missing(dialogues, public_dir, voice):
+    """
+    Synthesize audio for dialogues whose audioFile is unset or missing on disk
+
+    Returns:
+        Number of clips synthesized
+    """
+    from ai_studio_code import TTS_MODEL
+    from client_registry import get_genai_client
+    from tts_cache import cached_stream_tts, default_tts_cache
+    from wav_writer import StreamingWavWriter
+
+    missing = [
+        d for d in dialogues
+        if d.get("text") and not (d.get("audioFile") and os.path.isfile(public_path(public_dir, d["audioFile"])))
+    ]
+    if not missing:
+        return 0
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        print(f"⚠️ GEMINI_API_KEY not set, skipping TTS for {len(missing)} dialogue(s)")
+        return 0
+
+    client = get_genai_client(api_key)
+    cache = default_tts_cache()
+    os.makedirs(os.path.join(public_dir, TTS_AUDIO_DIR), exist_ok=True)
+    synthesized = 0
+    for dialogue in missing:
+        audio_url = dialogue.get("audioFile") or f"/{TTS_AUDIO_DIR}/{dialogue['id']}.wav"
+        if not audio_url.lower().endswith('.wav'):
+            audio_url = os.path.splitext(audio_url)[0] + ".wav"
+        path = public_path(public_dir, audio_url)
+        writer = None
+        try:
+            for data, mime_type in cached_stream_tts(cache, client, dialogue["text"], voice, TTS_MODEL):
+                if writer is None:
+                    writer = StreamingWavWriter.for_mime_type(path, mime_type)
+                writer.write(data)
+        except Exception as e:
+            print(f"❌ TTS failed for {dialogue['id']}: {e}")
+            if writer is not None:
+                writer.close()
+                os.remove(path)
+            continue
+        if writer is None:
+            print(f"❌ No audio generated for {dialogue['id']}")
+            continue
+        writer.close()
+        dialogue["audioFile"] = audio_url
+        dialogue["duration"] = round(writer.duration, 2)
+        synthesized += 1
+        print(f"🔊 {dialogue['id']}: {audio_url} ({writer.duration:.1f}s)")
+    return synthesized
+
+
+def _analyze_one(audio_file, track_file, fps):
+    started = time.perf_counter()
+    track = analyze_file(audio_file, fps)
+    os.makedirs(os.path.dirname(track_file), exist_ok=True)
+    with open(track_file, 'w', encoding='utf-8') as f:
+        json.dump(track, f, separators=(',', ':'))
+    return {"changes": len(track["track"]), "duration": track["duration"], "seconds": time.perf_counter() - started}
+
+
+def prerender(dialogues_path, voice=DEFAULT_VOICE, fps=DEFAULT_FPS, workers=4, force=False, skip_tts=False):
+    """
+    Synthesize missing audio and compute viseme tracks for every dialogue
+
+    Args:
+        dialogues_path: Path of dialogues.json (its directory is the public dir)
+        voice: Gemini voice name for synthesized clips
+        fps: Viseme analysis frames per second
+        workers: Max concurrent analysis processes
+        force: Recompute tracks that are up to date
+        skip_tts: Don't synthesize missing audio
+
+    Returns:
+        Summary dictionary
+    """
+    public_dir = os.path.dirname(os.path.abspath(dialogues_path))
+    with open(dialogues_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    dialogues = list(iter_dialogues(manifest))
+
+    synthesized = 0 if skip_tts else synthesize_missing(dialogues, public_dir, voice)
+
+    # Several dialogues can share one clip; analyze each clip once
+    clips = {}
+    for dialogue in dialogues:
+        audio_url = dialogue.get("audioFile")
+        if audio_url and os.path.isfile(public_path(public_dir, audio_url)):
+            clips.setdefault(audio_url, []).append(dialogue)
+        elif audio_url:
+            print(f"⚠️ Missing audio for {dialogue.get('id')}: {audio_url}")
+
+    pending = {}
+    for audio_url in clips:
+        audio_file = public_path(public_dir, audio_url)
+        track_file = public_path(public_dir, viseme_url(audio_url))
+        if force or not is_up_to_date(audio_file, track_file):
+            pending[audio_url] = (audio_file, track_file)
+    if len(pending) < len(clips):
+        print(f"⏭️  Skipping {len(clips) - len(pending)} up-to-date clip(s)")
+
+    failed = set()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_analyze_one, audio_file, track_file, fps): audio_url
+                for audio_url, (audio_file, track_file) in pending.items()
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                audio_url = futures[future]
+                try:
+                    item = future.result()
+                except Exception as e:
+                    failed.add(audio_url)
+                    print(f"[{i}/{len(pending)}] {audio_url} ❌ {e}")
+                    continue
+                print(f"[{i}/{len(pending)}] {audio_url} ✅ {item['changes']} visemes / "
+                      f"{item['duration']:.1f}s ({item['seconds']:.2f}s)")
+
+    changed = synthesized > 0
+    for audio_url, clip_dialogues in clips.items():
+        if audio_url in failed:
+            continue
+        for dialogue in clip_dialogues:
+            if dialogue.get("visemeFile") != viseme_url(audio_url):
+                dialogue["visemeFile"] = viseme_url(audio_url)
+                changed = True
+    if changed:
+        with open(dialogues_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+
+    return {
+        "dialogues": len(dialogues),
+        "synthesized": synthesized,
+        "clips": len(clips),
+        "analyzed": len(pending) - len(failed),
+        "failed": len(failed),
+        "manifest_updated": changed
+    }
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Pre-render TTS audio and viseme tracks for dialogues.json")
+    parser.add_argument("dialogues", nargs="?", default=DEFAULT_DIALOGUES, help="Path of dialogues.json")
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help=f"Gemini voice for synthesized audio (default: {DEFAULT_VOICE})")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help=f"Viseme frames per second (default: {DEFAULT_FPS})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Max concurrent analysis processes")
+    parser.add_argument("--force", action="store_true", help="Recompute viseme tracks that are up to date")
+    parser.add_argument("--skip-tts", action="store_true", help="Don't synthesize missing audio")
+    args = parser.parse_args(argv)
+
+    summary = prerender(args.dialogues, voice=args.voice, fps=args.fps, workers=args.workers,
+                        force=args.force, skip_tts=args.skip_tts)
+    print("\n=== PRE-RENDER SUMMARY ===")
+    print(f"Dialogues: {summary['dialogues']}, synthesized {summary['synthesized']}")
+    print(f"Clips: {summary['clips']}, analyzed {summary['analyzed']}, failed {summary['failed']}")
+    if summary["manifest_updated"]:
+        print(f"📝 Updated {args.dialogues}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+# Quota-aware rate limiting for Gemini calls
+# Token bucket theo từng model (có thể chia sẻ giữa các worker process qua một
+# state file), hàng đợi ưu tiên (lượt phỏng vấn live trước batch job) và
+# exponential backoff có jitter cho retry.
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+try:
+    import fcntl  # Shared state across worker processes (Unix only)
+except ImportError:
+    fcntl = None
+
+PRIORITY_LIVE = 0
+PRIORITY_BATCH = 10
+
+PRIORITY_NAMES = {
+    "live": PRIORITY_LIVE,
+    "batch": PRIORITY_BATCH,
+}
+
+# How long a request may wait for a token before giving up
+MAX_WAIT_SECONDS = float(os.getenv('GEMINI_RATE_LIMIT_MAX_WAIT', 30))
+
+# Optional file holding the bucket state, so all workers on a host share one quota
+STATE_DIR = os.getenv('GEMINI_RATE_LIMIT_DIR') or None
+
+
+def parse_priority(value, default=PRIORITY_LIVE):
+    """'live' / 'batch' / an integer (lower runs first)"""
+    if value is None or value == "":
+        return default
+    value = str(value).strip().lower()
+    if value in PRIORITY_NAMES:
+        return PRIORITY_NAMES[value]
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0, floor=0.0):
+    """
+    Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))
+
+    floor sets a minimum wait (full jitter alone can come out near 0 s).
+    """
+    return max(floor, random.uniform(0, min(cap, base * (2 ** attempt))))
+
+
+def model_rate_per_minute(model):
+    """
+    Requests per minute for a model
+
+    GEMINI_RPM_<MODEL> (e.g. GEMINI_RPM_GEMINI_1_5_FLASH) overrides GEMINI_RPM.
+    0 or unset disables limiting.
+    """
+    env_name = "GEMINI_RPM_" + re.sub(r'[^A-Za-z0-9]', '_', model).upper()
+    return float(os.getenv(env_name) or os.getenv('GEMINI_RPM') or 0)
+
+
+class _LocalState:
+    def __init__(self, capacity):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def update(self, fn):
+        now = time.monotonic()
+        self.tokens, self.updated, self.blocked_until, result = fn(
+            self.tokens, self.updated, self.blocked_until, now
+        )
+        return result
+
+
+class _FileState:
+    def __init__(self, path, capacity):
+        """Bucket state in a small file, updated under an exclusive flock"""
+        self.path = path
+        self.capacity = capacity
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def update(self, fn):
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    tokens, updated, blocked_until = (float(x) for x in f.read().split())
+                except ValueError:
+                    tokens, updated, blocked_until = self.capacity, time.time(), 0.0
+                tokens, updated, blocked_until, result = fn(tokens, updated, blocked_until, time.time())
+                f.seek(0)
+                f.truncate()
+                f.write(f"{tokens} {updated} {blocked_until}")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return result
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None, state_path=None):
+        """
+        Token bucket with a priority wait queue
+
+        Args:
+            rate_per_minute: Sustained request rate (0 = unlimited)
+            burst: Bucket capacity (default: 1/6 of the per-minute rate, at least 1)
+            state_path: Optional state file shared by all processes on the host
+                        (needs fcntl; falls back to per-process state otherwise)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, rate_per_minute / 6.0)
+        if state_path and fcntl is not None:
+            self._state = _FileState(state_path, self.capacity)
+        else:
+            self._state = _LocalState(self.capacity)
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.granted = 0
+        self.waited_seconds = 0.0
+        self.timeouts = 0
+        self.penalties = 0
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _take(self):
+        """Take a token if one is available; otherwise return seconds until one is"""
+        def take(tokens, updated, blocked_until, now):
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            if now < blocked_until:
+                return tokens, now, blocked_until, blocked_until - now
+            if tokens >= 1:
+                return tokens - 1, now, blocked_until, 0.0
+            return tokens, now, blocked_until, (1 - tokens) / self.rate
+        return self._state.update(take)
+
+    def acquire(self, priority=PRIORITY_LIVE, timeout=MAX_WAIT_SECONDS):
+        """
+        Block until a token is available
+
+        Waiters are served by priority (lower first), then arrival order.
+
+        Returns:
+            True if a token was taken, False on timeout
+        """
+        if self.unlimited:
+            return True
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._waiters[0] == ticket:
+                        wait = self._take()
+                        if wait == 0:
+                            self._granted(started)
+                            return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._remove(ticket)
+
+    async def acquire_async(self, priority=PRIORITY_LIVE, timeout=MAX_WAIT_SECONDS):
+        """asyncio variant of acquire (waits with asyncio.sleep, not a thread)"""
+        if self.unlimited:
+            return True
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._waiters[0] == ticket:
+                        wait = self._take()
+                        if wait == 0:
+                            self._granted(started)
+                            return True
+                    else:
+                        wait = 0.05  # Not our turn yet; poll again shortly
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        return False
+                    wait = min(wait, remaining)
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                self._remove(ticket)
+
+    def penalize(self, seconds):
+        """Quota error from the API: drain the bucket and pause everyone for a while"""
+        if self.unlimited:
+            return
+
+        def block(tokens, updated, blocked_until, now):
+            return 0.0, now, max(blocked_until, now + seconds), None
+        self._state.update(block)
+        self.penalties += 1
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "rate_per_minute": round(self.rate * 60, 2),
+                "waiting": len(self._waiters),
+                "granted": self.granted,
+                "avg_wait_seconds": round(self.waited_seconds / self.granted, 4) if self.granted else 0.0,
+                "timeouts": self.timeouts,
+                "penalties": self.penalties
+            }
+
+    def _granted(self, started):
+        # Caller holds self._cond
+        self.granted += 1
+        self.waited_seconds += time.monotonic() - started
+
+    def _remove(self, ticket):
+        # Caller holds self._cond
+        self._waiters.remove(ticket)
+        heapq.heapify(self._waiters)
+        self._cond.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model):
+    """Process-wide limiter for a model (configured from GEMINI_RPM*)"""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            state_path = None
+            if STATE_DIR:
+                state_path = os.path.join(STATE_DIR, re.sub(r'[^A-Za-z0-9.-]', '_', model) + ".bucket")
+            limiter = TokenBucket(model_rate_per_minute(model), state_path=state_path)
+            _limiters[model] = limiter
+        return limiter
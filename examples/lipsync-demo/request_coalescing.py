@@ -0,0 +1,118 @@
+# Request coalescing (single-flight) for identical in-flight transcriptions
+# Khi nhiều request giống hệt nhau đến cùng lúc, chỉ request đầu tiên gọi model,
+# các request sau chờ và dùng lại kết quả đó.
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """Thread-based single-flight group (used by the Flask server)"""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Run fn() once per key among concurrent callers
+
+        Args:
+            key: Dedup key (e.g. audio digest + language)
+            fn: Zero-argument callable doing the real work
+
+        Returns:
+            (result, shared): shared is True if this caller waited on another
+            caller's in-flight call instead of running fn itself
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        """asyncio single-flight group (used by the ASGI server)"""
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        """
+        Await coro_fn() once per key among concurrent callers
+
+        Args:
+            key: Dedup key (e.g. audio digest + language)
+            coro_fn: Zero-argument coroutine function doing the real work
+
+        Returns:
+            (result, shared): same as SingleFlight.do
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            shared = True
+        else:
+            # The work runs as a detached task that owns the result: if the
+            # leader is cancelled (client disconnect), followers still get it
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.leaders += 1
+            shared = False
+        # shield: a cancelled caller must not cancel the shared call
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark retrieved so asyncio doesn't warn when nobody was waiting
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,174 @@
+# Hedged requests for tail latency
+# Nếu lời gọi đầu tiên chưa trả về sau một percentile latency gần đây, gửi thêm
+# một lời gọi thứ hai (cùng backend hoặc backend khác), lấy kết quả về trước và
+# huỷ lời gọi còn lại. Số hedge mỗi phút bị giới hạn bởi budget.
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Opt-in: STT_HEDGE=1
+HEDGE_ENABLED = os.getenv('STT_HEDGE', '0') == '1'
+
+# Hedge once the first call is slower than this percentile of recent latency
+HEDGE_PERCENTILE = float(os.getenv('STT_HEDGE_PERCENTILE', 95))
+
+# Max hedged (extra) calls per minute, per process
+HEDGE_BUDGET_PER_MINUTE = int(os.getenv('STT_HEDGE_BUDGET_PER_MINUTE', 10))
+
+# Threads running hedge (backup) calls for the Flask server; primaries get
+# their own thread
+HEDGE_MAX_WORKERS = int(os.getenv('STT_HEDGE_MAX_WORKERS', 32))
+
+
+class HedgeBudget:
+    def __init__(self, per_minute=HEDGE_BUDGET_PER_MINUTE):
+        """Sliding one-minute window of hedges sent"""
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._sent = deque()
+        self.hedged = 0
+        self.wins = 0
+        self.denied = 0
+
+    def try_take(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._sent and now - self._sent[0] >= 60:
+                self._sent.popleft()
+            if len(self._sent) >= self.per_minute:
+                self.denied += 1
+                return False
+            self._sent.append(now)
+            self.hedged += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_per_minute": self.per_minute,
+                "hedged": self.hedged,
+                "hedge_wins": self.wins,
+                "budget_denied": self.denied
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _executor
+
+
+def _succeeded(result):
+    return isinstance(result, dict) and bool(result.get("success"))
+
+
+def hedged_call(primary, hedge, delay, budget):
+    """
+    Run primary() on its own thread; if it hasn't finished after delay
+    seconds, also start hedge() on the hedge pool, and return the first
+    successful result
+
+    Each primary gets a dedicated thread, so the pool never caps concurrency
+    (it only holds hedges). Threads can't be interrupted: the losing call
+    runs to completion in the background and its result is dropped.
+
+    Args:
+        primary: Zero-argument callable returning a result dict
+        hedge: Zero-argument callable for the backup call
+        delay: Seconds to wait before hedging
+        budget: HedgeBudget limiting hedges per minute
+
+    Returns:
+        (result, hedged): hedged is True if the backup call was sent
+    """
+    results = queue.Queue()
+
+    def run(name, fn):
+        try:
+            results.put((name, fn(), None))
+        except Exception as e:
+            results.put((name, None, e))
+
+    threading.Thread(target=run, args=("primary", primary), name="hedge-primary", daemon=True).start()
+    try:
+        _, result, error = results.get(timeout=delay)
+    except queue.Empty:
+        pass
+    else:
+        if error is not None:
+            raise error
+        return result, False
+
+    if not budget.try_take():
+        _, result, error = results.get()
+        if error is not None:
+            raise error
+        return result, False
+
+    print(f"⏱️ No response after {delay:.2f}s, sending hedged request")
+    second = _get_executor().submit(run, "hedge", hedge)
+    outcomes = {}
+    while len(outcomes) < 2:
+        name, result, error = results.get()
+        if error is None and _succeeded(result):
+            if name == "hedge":
+                budget.record_win()
+            else:
+                second.cancel()
+            return result, True
+        outcomes[name] = (result, error)
+    # Both failed: report the primary's error unless it raised
+    result, error = outcomes["primary"]
+    if error is not None:
+        result, error = outcomes["hedge"]
+    if error is not None:
+        raise error
+    return result, True
+
+
+async def hedged_call_async(primary, hedge, delay, budget):
+    """
+    asyncio variant of hedged_call: primary / hedge are coroutine functions,
+    and the losing call is cancelled
+    """
+    first = asyncio.ensure_future(primary())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done or not budget.try_take():
+            return await first, False
+
+        print(f"⏱️ No response after {delay:.2f}s, sending hedged request")
+        second = asyncio.ensure_future(hedge())
+        tasks.append(second)
+        pending = set(tasks)
+        result = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if _succeeded(result):
+                    if task is second:
+                        budget.record_win()
+                    return result, True
+        return result, True
+    finally:
+        # Cancel the loser (or everything, if the caller itself was cancelled)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
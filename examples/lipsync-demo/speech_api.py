@@ -1,53 +1,90 @@
 # Speech-to-Text API Server
-# Flask API để xử lý audio và chuyển đổi sang text
+# Flask API để xử lý audio và chuyển đổi sang text using Gemini API
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import io
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+import asyncio
 import os
-import tempfile
-import wave
-from google.cloud import speech
-from google.oauth2 import service_account
-import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from google.genai import types
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from ai_studio_code import parse_audio_mime_type, streaming_wav_header
+from audio_normalize import normalize_audio, sniff_mime_type
+from audio_vad import prepare_segments, wav_duration
+from client_registry import get_genai_client, registry_stats
+from lipsync_audio import SOURCES, TRACK_CHUNK_ID, collect_pcm, render_lipsync_wav
+from live_transcription import run_live_session
+from metrics import (
+    AUDIO_BYTES, AUDIO_SECONDS, CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS,
+    QUOTA_ERRORS, RETRIES, STAGE_LATENCY, TRANSCRIPTIONS, render as render_metrics
+)
+from rate_limiter import PRIORITY_LIVE, backoff_delay, get_limiter, parse_priority
+from request_coalescing import SingleFlight, AsyncSingleFlight
+from stt_router import GEMINI_MODELS, build_router
+from transcription_cache import TranscriptionCache, cache_key
+from tts_cache import cached_stream_tts, default_tts_cache
+from upload_stream import (
+    MAX_UPLOAD_BYTES, UploadTooLarge, JsonAudioExtractor,
+    check_content_length, read_stream, spool_stream
+)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
+# Reject oversized uploads early (413) instead of buffering them
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+sock = Sock(app)  # WebSocket routes (live transcription)
 
-# Speech-to-Text API Server
-# Flask API để xử lý audio và chuyển đổi sang text using Gemini API
-
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import io
-import os
-import tempfile
-import wave
-import base64
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+# Convert language code to language name for Gemini
+LANGUAGE_NAMES = {
+    "vi-VN": "tiếng Việt",
+    "en-US": "English",
+    "en-GB": "English",
+    "zh-CN": "Chinese",
+    "ja-JP": "Japanese",
+    "ko-KR": "Korean",
+    "fr-FR": "French",
+    "de-DE": "German", 
+    "es-ES": "Spanish"
+}
 
-# Load environment variables
-load_dotenv()
+# Retry delays: full-jitter exponential backoff; quota errors (429) back off longer
+RETRY_BASE_SECONDS = 1.0
+QUOTA_RETRY_BASE_SECONDS = float(os.getenv('GEMINI_QUOTA_BACKOFF', 4))
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+# Max VAD segments of one recording transcribed concurrently
+VAD_MAX_WORKERS = int(os.getenv('STT_VAD_MAX_WORKERS', 4))
 
 class SpeechToTextAPI:
     def __init__(self):
+        # Transcription cache: in-memory LRU + optional on-disk tier (STT_CACHE_DIR)
+        self.cache = TranscriptionCache(
+            max_entries=int(os.getenv('STT_CACHE_SIZE', 256)),
+            cache_dir=os.getenv('STT_CACHE_DIR') or None
+        )
+        # TTS phrase cache on disk (TTS_CACHE_DIR), None if disabled
+        self.tts_cache = default_tts_cache()
+        # Single-flight groups: identical in-flight requests share one model call
+        self.inflight = SingleFlight()
+        self.inflight_async = AsyncSingleFlight()
+        
+        # Primary Gemini model (GEMINI_MODELS, default gemini-1.5-flash: stable, higher quota)
+        self.model = GEMINI_MODELS[0]
+        
         # Try to initialize with Gemini API key
         api_key = os.getenv('GEMINI_API_KEY')
         
         if api_key:
             try:
-                self.client = genai.Client(api_key=api_key)
-                # Use standard model instead of experimental one for better quota
-                self.model = "gemini-1.5-flash"  # More stable and higher quota
+                self.client = get_genai_client(api_key)
                 print(f"✅ Initialized with Gemini API key")
                 print(f"🤖 Using model: {self.model}")
             except Exception as e:
@@ -56,29 +93,168 @@ class SpeechToTextAPI:
         else:
             print("❌ GEMINI_API_KEY not found in environment")
             self.client = None
+        
+        # Backends behind transcribe_audio: Gemini models, Cloud Speech, local (STT_BACKENDS)
+        self.router = build_router(self)
     
-    def transcribe_audio_gemini(self, audio_data, language_code="vi-VN"):
-        """Transcribe audio using Gemini API with retry mechanism"""
+    def _build_contents(self, audio_data, language_code, mime_type="audio/webm"):
+        """Build the Gemini request contents (prompt + inline audio)"""
+        # Convert language code to language name for Gemini
+        language_name = LANGUAGE_NAMES.get(language_code, "English")
+        
+        # Method 1: inline_data (Gemini 1.5 Flash supports this)
+        audio_part = types.Part(
+            inline_data=types.Blob(
+                data=audio_data,
+                mime_type=mime_type
+            )
+        )
+        
+        prompt = f"Please transcribe this audio to text in {language_name}. Only return the transcribed text, no additional commentary."
+        text_part = types.Part(text=prompt)
+        
+        return [
+            types.Content(
+                role="user",
+                parts=[text_part, audio_part]
+            )
+        ]
+    
+    def _generation_config(self):
+        # Lower temperature, fewer tokens to save quota
+        return types.GenerateContentConfig(
+            temperature=0.1,
+            max_output_tokens=500
+        )
+    
+    def _success_result(self, transcript, model):
+        print(f"✅ Transcription successful: {transcript[:50]}...")
+        return {
+            "success": True,
+            "results": [{
+                "transcript": transcript,
+                "confidence": 0.90,  # Slightly lower confidence for 1.5-flash
+                "model_used": model
+            }],
+            "full_transcript": transcript
+        }
+    
+    def _handle_attempt_error(self, attempt_error, attempts, max_attempts, model):
+        """
+        Classify a failed attempt.
+        
+        Returns:
+            (result, retry_delay): result is the error dict to return (or None to retry),
+            retry_delay is the number of seconds to wait before the next attempt.
+        """
+        error_msg = str(attempt_error)
+        print(f"❌ Attempt {attempts} failed: {error_msg}")
+        
+        # Check for quota errors: pause the shared limiter and back off
+        if is_quota_error(error_msg):
+            QUOTA_ERRORS.inc(model=model)
+            if attempts < max_attempts:
+                RETRIES.inc(reason="quota")
+                # Floored: with GEMINI_RPM unset, penalize() is a no-op and this
+                # sleep is the only thing slowing the retry down
+                retry_delay = backoff_delay(attempts, base=QUOTA_RETRY_BASE_SECONDS,
+                                            floor=QUOTA_RETRY_BASE_SECONDS)
+                get_limiter(model).penalize(retry_delay)
+                print(f"🔄 Quota exceeded, backing off {retry_delay:.1f} seconds...")
+                return None, retry_delay
+            return {
+                "error": "Gemini API quota exceeded. Please check your billing or wait for quota reset. You can also try using a different model or reduce usage frequency."
+            }, 0
+        
+        # Check for audio format errors  
+        if "audio" in error_msg.lower() or "format" in error_msg.lower():
+            if attempts < max_attempts:
+                RETRIES.inc(reason="format")
+                print(f"🔄 Audio format issue, trying alternative approach...")
+                return None, 0
+            return {"error": "Audio format not supported. Please try recording in a different format."}, 0
+        
+        # Other errors - retry if attempts left
+        if attempts < max_attempts:
+            RETRIES.inc(reason="error")
+            retry_delay = backoff_delay(attempts, base=RETRY_BASE_SECONDS)
+            print(f"🔄 Retrying in {retry_delay:.1f} seconds...")
+            return None, retry_delay
+        
+        return {"error": f"Transcription failed after {max_attempts} attempts: {error_msg}"}, 0
+    
+    def _handle_fatal_error(self, e):
+        error_msg = str(e)
+        if is_quota_error(error_msg):
+            return {
+                "error": "API quota exceeded. Please wait a moment or check your Gemini API billing settings."
+            }
+        return {"error": f"Gemini transcription failed: {error_msg}"}
+    
+    def _merge_segment_results(self, segments, results):
+        """Combine per-segment results; each result keeps its segment's original timestamps"""
+        if not segments:
+            print(f"🔇 No speech detected, skipping model call")
+            return {"success": True, "results": [], "full_transcript": "", "no_speech": True}
+        
+        for result in results:
+            if not result.get("success"):
+                return result
+        
+        merged = []
+        for segment, result in zip(segments, results):
+            for item in result["results"]:
+                merged.append(dict(
+                    item,
+                    start_time=round(segment["start"], 3),
+                    end_time=round(segment["end"], 3)
+                ))
+        
+        return {
+            "success": True,
+            "results": merged,
+            "full_transcript": " ".join(r["transcript"] for r in merged)
+        }
+    
+    def transcribe_audio_gemini(self, audio_data, language_code="vi-VN", priority=PRIORITY_LIVE, model=None):
+        """
+        Transcribe audio using Gemini API with retry mechanism
+        
+        WAV input can go through VAD first: with STT_VAD_TRIM=1 leading/trailing
+        silence is trimmed, and with STT_VAD_SPLIT_PAUSE_MS set long pauses split
+        the audio into segments that are transcribed in parallel.
+        
+        Args:
+            model: Gemini model to call (default: self.model)
+        """
         if not self.client:
             return {"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}
         
+        model = model or self.model
+        with STAGE_LATENCY.time(stage="vad"):
+            segments = prepare_segments(audio_data)
+        if segments is None:
+            return self._transcribe_gemini_once(audio_data, language_code, sniff_mime_type(audio_data) or "audio/webm",
+                                                priority=priority, model=model)
+        
+        def transcribe_segment(segment):
+            return self._transcribe_gemini_once(segment["audio"], language_code, mime_type="audio/wav",
+                                                priority=priority, model=model)
+        
+        if len(segments) > 1:
+            with ThreadPoolExecutor(max_workers=VAD_MAX_WORKERS) as executor:
+                results = list(executor.map(transcribe_segment, segments))
+        else:
+            results = [transcribe_segment(segment) for segment in segments]
+        
+        return self._merge_segment_results(segments, results)
+    
+    def _transcribe_gemini_once(self, audio_data, language_code, mime_type="audio/webm", priority=PRIORITY_LIVE,
+                                model=None):
+        """One generate_content round (with retries) for a single piece of audio"""
         try:
-            # Convert language code to language name for Gemini
-            language_map = {
-                "vi-VN": "tiếng Việt",
-                "en-US": "English",
-                "en-GB": "English",
-                "zh-CN": "Chinese",
-                "ja-JP": "Japanese",
-                "ko-KR": "Korean",
-                "fr-FR": "French",
-                "de-DE": "German", 
-                "es-ES": "Spanish"
-            }
-            
-            language_name = language_map.get(language_code, "English")
+            contents = self._build_contents(audio_data, language_code, mime_type)
             
-            # Try multiple approaches for audio input
             attempts = 0
             max_attempts = 3
             
@@ -87,102 +263,356 @@ class SpeechToTextAPI:
                     attempts += 1
                     print(f"🔄 Attempt {attempts} to transcribe audio...")
                     
-                    # Method 1: Try with inline_data (Gemini 1.5 Flash supports this)
-                    if attempts <= 2:
-                        audio_part = types.Part(
-                            inline_data=types.Blob(
-                                data=audio_data,
-                                mime_type="audio/webm"
-                            )
-                        )
-                        
-                        prompt = f"Please transcribe this audio to text in {language_name}. Only return the transcribed text, no additional commentary."
-                        text_part = types.Part(text=prompt)
-                        
-                        contents = [
-                            types.Content(
-                                role="user",
-                                parts=[text_part, audio_part]
-                            )
-                        ]
-                        
-                        # Generate transcription with lower temperature
+                    with STAGE_LATENCY.time(stage="rate_limit_wait"):
+                        acquired = get_limiter(model).acquire(priority)
+                    if not acquired:
+                        return rate_limited_result()
+                    
+                    with STAGE_LATENCY.time(stage="model_call"):
                         response = self.client.models.generate_content(
-                            model=self.model,
+                            model=model,
                             contents=contents,
-                            config=types.GenerateContentConfig(
-                                temperature=0.1,
-                                max_output_tokens=500  # Reduce tokens to save quota
-                            )
+                            config=self._generation_config()
                         )
-                    else:
-                        # Method 2: Fallback - return a helpful message if audio transcription fails
-                        return {
-                            "error": "Audio transcription temporarily unavailable due to quota limits. Please try text input or wait a moment and retry."
-                        }
                     
                     if response.text:
-                        transcript = response.text.strip()
-                        print(f"✅ Transcription successful: {transcript[:50]}...")
-                        
-                        return {
-                            "success": True,
-                            "results": [{
-                                "transcript": transcript,
-                                "confidence": 0.90,  # Slightly lower confidence for 1.5-flash
-                                "model_used": self.model
-                            }],
-                            "full_transcript": transcript
-                        }
-                    else:
-                        if attempts < max_attempts:
-                            print(f"⚠️ No response text, retrying...")
-                            continue
-                        return {"error": "No transcription generated after multiple attempts"}
+                        return self._success_result(response.text.strip(), model)
+                    
+                    if attempts < max_attempts:
+                        RETRIES.inc(reason="empty")
+                        print(f"⚠️ No response text, retrying...")
+                        continue
+                    return {"error": "No transcription generated after multiple attempts"}
                         
                 except Exception as attempt_error:
-                    error_msg = str(attempt_error)
-                    print(f"❌ Attempt {attempts} failed: {error_msg}")
+                    result, retry_delay = self._handle_attempt_error(attempt_error, attempts, max_attempts, model)
+                    if result is not None:
+                        return result
+                    if retry_delay:
+                        with STAGE_LATENCY.time(stage="retry_wait"):
+                            time.sleep(retry_delay)
+            
+            return {"error": "Maximum retry attempts exceeded"}
+            
+        except Exception as e:
+            return self._handle_fatal_error(e)
+    
+    async def transcribe_audio_gemini_async(self, audio_data, language_code="vi-VN", priority=PRIORITY_LIVE,
+                                            model=None):
+        """
+        Async variant of transcribe_audio_gemini.
+        
+        Uses the genai aio client and asyncio.sleep between retries, so a waiting
+        request only holds a coroutine on the event loop, not a worker thread.
+        """
+        if not self.client:
+            return {"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}
+        
+        model = model or self.model
+        # VAD is CPU work; keep it off the event loop
+        with STAGE_LATENCY.time(stage="vad"):
+            segments = await asyncio.to_thread(prepare_segments, audio_data)
+        if segments is None:
+            return await self._transcribe_gemini_once_async(audio_data, language_code,
+                                                            sniff_mime_type(audio_data) or "audio/webm",
+                                                            priority=priority, model=model)
+        
+        # Same per-request segment concurrency as the thread pool in the sync path
+        limit = asyncio.Semaphore(VAD_MAX_WORKERS)
+        
+        async def transcribe_segment(segment):
+            async with limit:
+                return await self._transcribe_gemini_once_async(segment["audio"], language_code,
+                                                                mime_type="audio/wav", priority=priority,
+                                                                model=model)
+        
+        results = await asyncio.gather(*[transcribe_segment(segment) for segment in segments])
+        return self._merge_segment_results(segments, results)
+    
+    async def _transcribe_gemini_once_async(self, audio_data, language_code, mime_type="audio/webm",
+                                            priority=PRIORITY_LIVE, model=None):
+        try:
+            contents = self._build_contents(audio_data, language_code, mime_type)
+            
+            attempts = 0
+            max_attempts = 3
+            
+            while attempts < max_attempts:
+                try:
+                    attempts += 1
+                    print(f"🔄 Attempt {attempts} to transcribe audio (async)...")
                     
-                    # Check for quota errors
-                    if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                        return {
-                            "error": "Gemini API quota exceeded. Please check your billing or wait for quota reset. You can also try using a different model or reduce usage frequency."
-                        }
+                    with STAGE_LATENCY.time(stage="rate_limit_wait"):
+                        acquired = await get_limiter(model).acquire_async(priority)
+                    if not acquired:
+                        return rate_limited_result()
+                    
+                    with STAGE_LATENCY.time(stage="model_call"):
+                        response = await self.client.aio.models.generate_content(
+                            model=model,
+                            contents=contents,
+                            config=self._generation_config()
+                        )
                     
-                    # Check for audio format errors  
-                    if "audio" in error_msg.lower() or "format" in error_msg.lower():
-                        if attempts < max_attempts:
-                            print(f"🔄 Audio format issue, trying alternative approach...")
-                            continue
-                        return {"error": "Audio format not supported. Please try recording in a different format."}
+                    if response.text:
+                        return self._success_result(response.text.strip(), model)
                     
-                    # Other errors - retry if attempts left
                     if attempts < max_attempts:
-                        print(f"🔄 Retrying in 2 seconds...")
-                        import time
-                        time.sleep(2)
+                        RETRIES.inc(reason="empty")
+                        print(f"⚠️ No response text, retrying...")
                         continue
-                    
-                    return {"error": f"Transcription failed after {max_attempts} attempts: {error_msg}"}
+                    return {"error": "No transcription generated after multiple attempts"}
+                
+                except Exception as attempt_error:
+                    result, retry_delay = self._handle_attempt_error(attempt_error, attempts, max_attempts, model)
+                    if result is not None:
+                        return result
+                    if retry_delay:
+                        with STAGE_LATENCY.time(stage="retry_wait"):
+                            await asyncio.sleep(retry_delay)
             
             return {"error": "Maximum retry attempts exceeded"}
-            
+        
         except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                return {
-                    "error": "API quota exceeded. Please wait a moment or check your Gemini API billing settings."
-                }
-            return {"error": f"Gemini transcription failed: {error_msg}"}
+            return self._handle_fatal_error(e)
+    
+    def _cached(self, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        print(f"⚡ Transcription cache hit")
+        TRANSCRIPTIONS.inc(outcome="cached")
+        return dict(cached, cached=True)
+    
+    def _count_audio(self, audio_data):
+        AUDIO_BYTES.inc(len(audio_data))
+        duration = wav_duration(audio_data)
+        if duration:
+            AUDIO_SECONDS.inc(duration)
     
-    def transcribe_audio(self, audio_data, sample_rate=16000, language_code="vi-VN"):
-        """Main transcription method using Gemini API"""
-        return self.transcribe_audio_gemini(audio_data, language_code)
+    def _finish(self, result, shared):
+        """Count the outcome; mark results shared with an in-flight request"""
+        if shared:
+            print(f"🔗 Coalesced with in-flight transcription")
+            TRANSCRIPTIONS.inc(outcome="coalesced")
+            return dict(result, coalesced=True)
+        TRANSCRIPTIONS.inc(outcome="success" if result.get("success") else "error")
+        return result
+    
+    def transcribe_audio(self, audio_data, sample_rate=16000, language_code="vi-VN", priority=PRIORITY_LIVE,
+                         mime_type=None):
+        """
+        Main transcription method
+        
+        Requests go through the backend router (Gemini first by default, failing
+        over to Cloud Speech / a local model). Results are cached by audio content,
+        and identical requests that arrive while a transcription is in flight wait
+        for it instead of calling the model.
+        
+        PCM audio (WAV, or raw PCM declared as audio/L16) is normalized to mono
+        16 kHz LINEAR16 first; compressed uploads are passed through.
+        
+        Args:
+            sample_rate: Sample rate of raw PCM uploads (WAV carries its own)
+            priority: Rate limiter priority (PRIORITY_LIVE for interview turns,
+                      PRIORITY_BATCH for background jobs; lower goes first)
+            mime_type: Content type declared by the client
+        """
+        self._count_audio(audio_data)
+        with STAGE_LATENCY.time(stage="normalize"):
+            audio_data, _ = normalize_audio(audio_data, sample_rate, mime_type)
+        key = cache_key(audio_data, language_code, self.model)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        
+        def run():
+            result = self.router.transcribe(audio_data, language_code, priority)
+            self.cache.put(key, result)
+            return result
+        
+        result, shared = self.inflight.do(key, run)
+        return self._finish(result, shared)
+    
+    async def transcribe_audio_async(self, audio_data, sample_rate=16000, language_code="vi-VN", slots=None,
+                                     priority=PRIORITY_LIVE, mime_type=None):
+        """
+        Async counterpart of transcribe_audio (used by speech_api_async.py)
+        
+        Args:
+            slots: Optional asyncio.Semaphore held only around the model call, so
+                   cache hits and coalesced requests don't take a concurrency slot
+        """
+        self._count_audio(audio_data)
+        # Resampling is CPU work; keep it off the event loop
+        with STAGE_LATENCY.time(stage="normalize"):
+            audio_data, _ = await asyncio.to_thread(normalize_audio, audio_data, sample_rate, mime_type)
+        key = cache_key(audio_data, language_code, self.model)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        
+        async def run():
+            if slots is None:
+                result = await self.router.transcribe_async(audio_data, language_code, priority)
+            else:
+                async with slots:
+                    result = await self.router.transcribe_async(audio_data, language_code, priority)
+            self.cache.put(key, result)
+            return result
+        
+        result, shared = await self.inflight_async.do(key, run)
+        return self._finish(result, shared)
+
+
+def is_quota_error(error_msg):
+    return "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg
+
+
+def rate_limited_result():
+    return {
+        "error": "Gemini API rate limit: too many requests queued. Please wait a moment and retry."
+    }
+
+
+def request_priority(args, headers):
+    """Scheduling priority from ?priority= or X-Priority ('live' / 'batch'); defaults to live"""
+    return parse_priority(args.get('priority') or headers.get('X-Priority'))
+
+
+def too_large_response():
+    return jsonify({"error": f"Audio upload too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"}), 413
+
+
+def binary_request_params(args, headers):
+    """
+    Metadata for raw binary uploads: query string first, then X-* headers
+    
+    Returns:
+        (language, sample_rate)
+    """
+    language = args.get('language') or headers.get('X-Language') or 'vi-VN'
+    sample_rate = args.get('sampleRate') or headers.get('X-Sample-Rate') or 16000
+    return language, int(sample_rate)
+
+
+def route_label(url_rule):
+    """Metrics label for a request: the route pattern, never the raw path"""
+    return url_rule.rule if url_rule is not None else "unmatched"
+
+
+def observe_upload(started, decode_seconds=0.0):
+    """Record upload read time (minus base64 decoding, recorded separately)"""
+    STAGE_LATENCY.observe(max(0.0, time.perf_counter() - started - decode_seconds), stage="upload_read")
+    if decode_seconds:
+        STAGE_LATENCY.observe(decode_seconds, stage="base64_decode")
+
+
+def tts_request_params(data):
+    """
+    Parse a /tts/stream body: {"text": ..., "voices": {...} | "voice": "Kore", "format": "wav" | "pcm"}
+    
+    Returns:
+        (text, voices, fmt)
+    """
+    text = data.get('text')
+    if not text or not isinstance(text, str):
+        raise ValueError("No text provided")
+    voices = data.get('voices') or data.get('voice')
+    if voices is not None and not isinstance(voices, (str, dict)):
+        raise ValueError("voices must be a voice name or a {speaker: voice} object")
+    fmt = data.get('format', 'wav')
+    if fmt not in ('wav', 'pcm'):
+        raise ValueError(f"Unsupported format: {fmt}")
+    return text, voices, fmt
+
+
+def tts_stream_response_args(mime_type, fmt):
+    """(content_type, headers) for a streamed TTS response"""
+    parameters = parse_audio_mime_type(mime_type)
+    content_type = "audio/wav" if fmt == "wav" else f"audio/L16;rate={parameters['rate']}"
+    headers = {
+        "X-Sample-Rate": str(parameters["rate"]),
+        "X-Bits-Per-Sample": str(parameters["bits_per_sample"]),
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Don't let a reverse proxy buffer the stream
+    }
+    return content_type, headers
+
+
+def lipsync_request_params(data):
+    """
+    Parse a /tts/lipsync body: /tts/stream fields plus "source": "audio" | "words", "language"
+    
+    Returns:
+        (text, voices, source, language)
+    """
+    text, voices, _ = tts_request_params(data)
+    source = data.get('source', 'audio')
+    if source not in SOURCES:
+        raise ValueError(f"Unsupported viseme source: {source}")
+    return text, voices, source, data.get('language', 'vi-VN')
+
+
+def word_timings_for(source):
+    """Word timing function for render_lipsync_wav (Cloud Speech), or None"""
+    if source != "words":
+        return None
+    backend = stt_api.router.backend("cloud_speech")
+    if backend is None:
+        print("⚠️ Word timings need Cloud Speech (GOOGLE_APPLICATION_CREDENTIALS), using spectral analysis")
+        return None
+    return backend.word_timings
+
+
+def lipsync_response_headers(track, source):
+    """Headers for a /tts/lipsync response"""
+    return {
+        "X-Viseme-Track": TRACK_CHUNK_ID.decode('ascii'),
+        "X-Viseme-Count": str(len(track)),
+        "X-Viseme-Source": source,
+        "Cache-Control": "no-cache"
+    }
+
+
+def add_fallback_suggestion(result):
+    """If Gemini fails due to quota, suggest the browser Speech API fallback"""
+    if not result.get("success") and ("quota" in result.get("error", "").lower() or "429" in result.get("error", "")):
+        result["fallback_suggestion"] = {
+            "method": "browser_speech_api",
+            "message": "Gemini API quota exceeded. You can use browser's built-in Speech Recognition as a fallback.",
+            "instructions": "The React app can automatically switch to Web Speech API for speech recognition."
+        }
+    return result
 
 # Initialize Speech-to-Text
 stt_api = SpeechToTextAPI()
 
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = route_label(request.url_rule)
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+@app.after_request
+def record_request_metrics(response):
+    route = g.get('metrics_route')
+    if route is not None:
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+        HTTP_LATENCY.observe(time.perf_counter() - g.metrics_started, route=route)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    route = g.pop('metrics_route', None)
+    if route is not None:
+        HTTP_IN_FLIGHT.dec(route=route)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (per process)"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -190,13 +620,29 @@ def health_check():
         "status": "healthy",
         "speech_client_ready": stt_api.client is not None,
         "using_gemini_api": True,
-        "gemini_model": stt_api.model if stt_api.client else None
+        "gemini_model": stt_api.model if stt_api.client else None,
+        "cache": stt_api.cache.stats(),
+        "coalescing": stt_api.inflight.stats(),
+        "rate_limit": get_limiter(stt_api.model).stats() if stt_api.client else None,
+        "backends": stt_api.router.stats(),
+        "hedging": stt_api.router.hedge_stats(),
+        "tts_cache": stt_api.tts_cache.stats() if stt_api.tts_cache else None,
+        "clients": registry_stats()
     })
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return too_large_response()
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
     """Transcribe audio to text"""
     try:
+        # Multipart is parsed in chunks by werkzeug into a spooled temp file;
+        # MAX_CONTENT_LENGTH rejects oversized bodies before/while reading.
+        check_content_length(request.content_length)
+        started = time.perf_counter()
+        
         # Get parameters
         language = request.form.get('language', 'vi-VN')
         sample_rate = int(request.form.get('sample_rate', 16000))
@@ -211,16 +657,21 @@ def transcribe():
         
         # Read audio data
         audio_data = audio_file.read()
+        observe_upload(started)
         
         # Transcribe
         result = stt_api.transcribe_audio(
             audio_data=audio_data,
             sample_rate=sample_rate,
-            language_code=language
+            language_code=language,
+            priority=request_priority(request.args, request.headers),
+            mime_type=audio_file.mimetype
         )
         
         return jsonify(result)
         
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
@@ -228,14 +679,21 @@ def transcribe():
 def transcribe_blob():
     """Transcribe audio blob from frontend recording"""
     try:
-        data = request.get_json()
-        
-        if not data or 'audioData' not in data:
-            return jsonify({"error": "No audio data provided"}), 400
+        check_content_length(request.content_length)
         
-        # Decode base64 audio data
-        audio_base64 = data['audioData'].split(',')[1] if ',' in data['audioData'] else data['audioData']
-        audio_data = base64.b64decode(audio_base64)
+        # Stream the JSON body: audioData is base64-decoded chunk by chunk into a
+        # spooled buffer, so the JSON text and base64 string are never held whole
+        started = time.perf_counter()
+        extractor = JsonAudioExtractor()
+        try:
+            read_stream(request.stream, extractor)
+            audio_file, data = extractor.finish()
+            if not extractor.found:
+                return jsonify({"error": "No audio data provided"}), 400
+            audio_data = audio_file.read()
+        finally:
+            extractor.close()
+        observe_upload(started, extractor.decoder.decode_seconds)
         
         # Get parameters
         language = data.get('language', 'vi-VN')
@@ -245,22 +703,149 @@ def transcribe_blob():
         result = stt_api.transcribe_audio(
             audio_data=audio_data,
             sample_rate=sample_rate,
-            language_code=language
+            language_code=language,
+            priority=request_priority(request.args, request.headers),
+            mime_type=extractor.mime_type
         )
         
         # If Gemini fails due to quota, suggest fallback
-        if not result.get("success") and ("quota" in result.get("error", "").lower() or "429" in result.get("error", "")):
-            result["fallback_suggestion"] = {
-                "method": "browser_speech_api",
-                "message": "Gemini API quota exceeded. You can use browser's built-in Speech Recognition as a fallback.",
-                "instructions": "The React app can automatically switch to Web Speech API for speech recognition."
-            }
+        return jsonify(add_fallback_suggestion(result))
         
-        return jsonify(result)
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/transcribe-binary', methods=['POST'])
+def transcribe_binary():
+    """
+    Transcribe a raw audio body (application/octet-stream, audio/webm, ...)
+    
+    Same result schema as /transcribe-blob, without the base64/JSON overhead.
+    Metadata: ?language=vi-VN&sampleRate=16000 or X-Language / X-Sample-Rate headers.
+    Headerless 16-bit PCM: Content-Type audio/L16 (rate from ;rate= or sampleRate).
+    """
+    try:
+        check_content_length(request.content_length)
+        language, sample_rate = binary_request_params(request.args, request.headers)
+        
+        started = time.perf_counter()
+        audio_file, size = spool_stream(request.stream)
+        with audio_file:
+            if size == 0:
+                return jsonify({"error": "No audio data provided"}), 400
+            audio_data = audio_file.read()
+        observe_upload(started)
+        
+        result = stt_api.transcribe_audio(
+            audio_data=audio_data,
+            sample_rate=sample_rate,
+            language_code=language,
+            priority=request_priority(request.args, request.headers),
+            mime_type=request.mimetype
+        )
+        
+        return jsonify(add_fallback_suggestion(result))
         
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/tts/stream', methods=['POST'])
+def tts_stream():
+    """
+    Text-to-speech, streamed (chunked) as Gemini produces audio
+    
+    The avatar can start playback and lipsync on the first chunk instead of
+    waiting for the whole dialog. format=wav (default) sends a WAV header with
+    an open-ended length followed by PCM; format=pcm sends raw PCM
+    (X-Sample-Rate / X-Bits-Per-Sample headers).
+    """
+    try:
+        text, voices, fmt = tts_request_params(request.get_json(silent=True) or {})
+        if not stt_api.client:
+            return jsonify({"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}), 503
+        
+        # Wait for the first chunk before answering, so errors still get a JSON response
+        started = time.perf_counter()
+        chunks = cached_stream_tts(stt_api.tts_cache, stt_api.client, text, voices)
+        first = next(chunks, None)
+        if first is None:
+            return jsonify({"error": "No audio generated"}), 502
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="tts_first_chunk")
+        data, mime_type = first
+        
+        def body():
+            if fmt == "wav":
+                yield streaming_wav_header(mime_type)
+            yield data
+            try:
+                for chunk, _ in chunks:
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent; all we can do is end the stream
+                print(f"❌ TTS stream interrupted: {e}")
+        
+        content_type, headers = tts_stream_response_args(mime_type, fmt)
+        return Response(stream_with_context(body()), content_type=content_type, headers=headers)
+        
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"TTS failed: {str(e)}"}), 500
+
+@app.route('/tts/lipsync', methods=['POST'])
+def tts_lipsync():
+    """
+    Text-to-speech with precomputed mouth shapes, in one response
+    
+    Returns a WAV file whose "vtrk" chunk holds the viseme track (see
+    lipsync_audio.py), so the avatar needn't run FFT analysis per frame.
+    Body: {"text": ..., "voices": {...} | "voice": "Kore", "source": "audio" | "words", "language": "vi-VN"}
+    source=words aligns visemes to Cloud Speech word timings instead of
+    analyzing the spectrum (falls back to analysis without word timings).
+    """
+    try:
+        text, voices, source, language = lipsync_request_params(request.get_json(silent=True) or {})
+        if not stt_api.client:
+            return jsonify({"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}), 503
+        
+        wav_bytes, _ = collect_pcm(cached_stream_tts(stt_api.tts_cache, stt_api.client, text, voices))
+        if wav_bytes is None:
+            return jsonify({"error": "No audio generated"}), 502
+        with STAGE_LATENCY.time(stage="viseme_analysis"):
+            body, track, source = render_lipsync_wav(
+                wav_bytes, word_timings=word_timings_for(source), language_code=language
+            )
+        return Response(body, content_type="audio/wav", headers=lipsync_response_headers(track, source))
+        
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"TTS failed: {str(e)}"}), 500
+
+@sock.route('/ws/transcribe')
+def live_transcribe(ws):
+    """Live transcription: microphone frames in, interim/final results out"""
+    def receive():
+        try:
+            return ws.receive()
+        except ConnectionClosed:
+            return None
+    
+    def send(message):
+        try:
+            ws.send(message)
+        except ConnectionClosed:
+            pass
+    
+    run_live_session(receive, send)
+
 if __name__ == '__main__':
     print("🚀 Starting Speech-to-Text API Server...")
     print(f"🔑 Gemini API key: {'Found' if os.getenv('GEMINI_API_KEY') else 'Not found'}")
@@ -268,7 +853,12 @@ if __name__ == '__main__':
     print(f"🌐 CORS enabled for frontend integration")
     print(f"📝 Available endpoints:")
     print(f"   GET  /health - Health check")
+    print(f"   GET  /metrics - Prometheus metrics")
     print(f"   POST /transcribe - Transcribe audio file")
     print(f"   POST /transcribe-blob - Transcribe audio blob")
+    print(f"   POST /transcribe-binary - Transcribe raw audio body")
+    print(f"   POST /tts/stream - Streaming text-to-speech (chunked WAV/PCM)")
+    print(f"   POST /tts/lipsync - Text-to-speech WAV with embedded viseme track")
+    print(f"   WS   /ws/transcribe - Live transcription (interim + final results)")
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
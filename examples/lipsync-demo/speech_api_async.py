@@ -0,0 +1,354 @@
+# Async Speech-to-Text API Server (ASGI)
+# Chế độ asyncio cho speech_api.py: cùng routes, cùng JSON, nhưng mỗi request
+# chờ Gemini trên event loop thay vì chiếm một worker thread.
+#
+# Run:
+#   hypercorn speech_api_async:app --bind 0.0.0.0:5000
+# or:
+#   python speech_api_async.py
+
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from quart import Quart, Response, g, request, jsonify, websocket
+from quart_cors import cors
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from ai_studio_code import streaming_wav_header
+from client_registry import registry_stats
+from lipsync_audio import collect_pcm, render_lipsync_wav
+from live_transcription import run_live_session
+from metrics import (
+    CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, STAGE_LATENCY, render as render_metrics
+)
+from rate_limiter import PRIORITY_LIVE, get_limiter
+from speech_api import (
+    stt_api, add_fallback_suggestion, binary_request_params, lipsync_request_params,
+    lipsync_response_headers, observe_upload, request_priority, route_label, tts_request_params,
+    tts_stream_response_args, word_timings_for
+)
+from tts_cache import cached_stream_tts_async
+from upload_stream import (
+    MAX_UPLOAD_BYTES, UploadTooLarge, BoundedSpool, JsonAudioExtractor,
+    check_content_length
+)
+
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # Enable CORS for React frontend
+# Reject oversized uploads early (413) instead of buffering them
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Max number of concurrent Gemini calls per process. Requests above this limit
+# wait on the semaphore (a coroutine each, no thread), not on a worker.
+MAX_CONCURRENCY = int(os.getenv('STT_MAX_CONCURRENCY', 64))
+
+_model_slots = None
+
+
+def model_slots():
+    """Per-process semaphore bounding in-flight model calls"""
+    global _model_slots
+    if _model_slots is None:
+        _model_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _model_slots
+
+
+async def transcribe_bounded(audio_data, sample_rate, language, priority=PRIORITY_LIVE, mime_type=None):
+    return await stt_api.transcribe_audio_async(
+        audio_data=audio_data,
+        sample_rate=sample_rate,
+        language_code=language,
+        slots=model_slots(),
+        priority=priority,
+        mime_type=mime_type
+    )
+
+
+def too_large_response():
+    return jsonify({"error": f"Audio upload too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"}), 413
+
+
+@app.errorhandler(413)
+async def request_too_large(e):
+    return too_large_response()
+
+
+@app.before_request
+async def start_request_metrics():
+    g.metrics_route = route_label(request.url_rule)
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    route = g.get('metrics_route')
+    if route is not None:
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+        HTTP_LATENCY.observe(time.perf_counter() - g.metrics_started, route=route)
+    return response
+
+
+@app.teardown_request
+async def finish_request_metrics(error=None):
+    route = g.pop('metrics_route', None)
+    if route is not None:
+        HTTP_IN_FLIGHT.dec(route=route)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus metrics (per process)"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        "status": "healthy",
+        "speech_client_ready": stt_api.client is not None,
+        "using_gemini_api": True,
+        "gemini_model": stt_api.model if stt_api.client else None,
+        "serving_mode": "asgi",
+        "max_concurrency": MAX_CONCURRENCY,
+        "cache": stt_api.cache.stats(),
+        "coalescing": stt_api.inflight_async.stats(),
+        "rate_limit": get_limiter(stt_api.model).stats() if stt_api.client else None,
+        "backends": stt_api.router.stats(),
+        "hedging": stt_api.router.hedge_stats(),
+        "tts_cache": stt_api.tts_cache.stats() if stt_api.tts_cache else None,
+        "clients": registry_stats()
+    })
+
+
+@app.route('/transcribe', methods=['POST'])
+async def transcribe():
+    """Transcribe audio to text"""
+    try:
+        check_content_length(request.content_length)
+        started = time.perf_counter()
+
+        # Get parameters
+        form = await request.form
+        language = form.get('language', 'vi-VN')
+        sample_rate = int(form.get('sample_rate', 16000))
+
+        # Get audio file
+        files = await request.files
+        if 'audio' not in files:
+            return jsonify({"error": "No audio file provided"}), 400
+
+        audio_file = files['audio']
+        if audio_file.filename == '':
+            return jsonify({"error": "No audio file selected"}), 400
+
+        # Read audio data
+        audio_data = audio_file.read()
+        observe_upload(started)
+
+        # Transcribe
+        result = await transcribe_bounded(audio_data, sample_rate, language,
+                                          request_priority(request.args, request.headers),
+                                          mime_type=audio_file.mimetype)
+
+        return jsonify(result)
+
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/transcribe-blob', methods=['POST'])
+async def transcribe_blob():
+    """Transcribe audio blob from frontend recording"""
+    try:
+        check_content_length(request.content_length)
+
+        # Stream the JSON body, base64-decoding audioData chunk by chunk
+        started = time.perf_counter()
+        extractor = JsonAudioExtractor()
+        try:
+            async for chunk in request.body:
+                extractor.feed(chunk)
+            audio_file, data = extractor.finish()
+            if not extractor.found:
+                return jsonify({"error": "No audio data provided"}), 400
+            audio_data = audio_file.read()
+        finally:
+            extractor.close()
+        observe_upload(started, extractor.decoder.decode_seconds)
+
+        # Get parameters
+        language = data.get('language', 'vi-VN')
+        sample_rate = data.get('sampleRate', 16000)
+
+        # Transcribe with Gemini API
+        result = await transcribe_bounded(audio_data, sample_rate, language,
+                                          request_priority(request.args, request.headers),
+                                          mime_type=extractor.mime_type)
+
+        # If Gemini fails due to quota, suggest fallback
+        return jsonify(add_fallback_suggestion(result))
+
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/transcribe-binary', methods=['POST'])
+async def transcribe_binary():
+    """Transcribe a raw audio body (same schema as /transcribe-blob)"""
+    try:
+        check_content_length(request.content_length)
+        language, sample_rate = binary_request_params(request.args, request.headers)
+
+        started = time.perf_counter()
+        spool = BoundedSpool()
+        try:
+            async for chunk in request.body:
+                spool.feed(chunk)
+            if spool.size == 0:
+                return jsonify({"error": "No audio data provided"}), 400
+            audio_data = spool.finish().read()
+        finally:
+            spool.close()
+        observe_upload(started)
+
+        result = await transcribe_bounded(audio_data, sample_rate, language,
+                                          request_priority(request.args, request.headers),
+                                          mime_type=request.mimetype)
+
+        return jsonify(add_fallback_suggestion(result))
+
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return too_large_response()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/tts/stream', methods=['POST'])
+async def tts_stream():
+    """Text-to-speech, streamed (chunked) as Gemini produces audio (see speech_api.tts_stream)"""
+    try:
+        text, voices, fmt = tts_request_params(await request.get_json(silent=True) or {})
+        if not stt_api.client:
+            return jsonify({"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}), 503
+
+        # Wait for the first chunk before answering, so errors still get a JSON response
+        started = time.perf_counter()
+        chunks = cached_stream_tts_async(stt_api.tts_cache, stt_api.client, text, voices)
+        try:
+            data, mime_type = await chunks.__anext__()
+        except StopAsyncIteration:
+            return jsonify({"error": "No audio generated"}), 502
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="tts_first_chunk")
+
+        async def body():
+            if fmt == "wav":
+                yield streaming_wav_header(mime_type)
+            yield data
+            try:
+                async for chunk, _ in chunks:
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent; all we can do is end the stream
+                print(f"❌ TTS stream interrupted: {e}")
+
+        content_type, headers = tts_stream_response_args(mime_type, fmt)
+        return Response(body(), content_type=content_type, headers=headers)
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"TTS failed: {str(e)}"}), 500
+
+
+@app.route('/tts/lipsync', methods=['POST'])
+async def tts_lipsync():
+    """Text-to-speech WAV with an embedded viseme track (see speech_api.tts_lipsync)"""
+    try:
+        text, voices, source, language = lipsync_request_params(await request.get_json(silent=True) or {})
+        if not stt_api.client:
+            return jsonify({"error": "Gemini client not initialized. Please check your GEMINI_API_KEY."}), 503
+
+        chunks = [item async for item in cached_stream_tts_async(stt_api.tts_cache, stt_api.client, text, voices)]
+        wav_bytes, _ = collect_pcm(chunks)
+        if wav_bytes is None:
+            return jsonify({"error": "No audio generated"}), 502
+        # NumPy analysis / Cloud Speech calls block; keep them off the event loop
+        started = time.perf_counter()
+        body, track, source = await asyncio.to_thread(
+            render_lipsync_wav, wav_bytes, word_timings=word_timings_for(source), language_code=language
+        )
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="viseme_analysis")
+        return Response(body, content_type="audio/wav", headers=lipsync_response_headers(track, source))
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"TTS failed: {str(e)}"}), 500
+
+
+@app.websocket('/ws/transcribe')
+async def live_transcribe():
+    """Live transcription: microphone frames in, interim/final results out"""
+    # The gRPC stream is blocking, so the session runs in its own thread;
+    # frames and results are bridged through queues.
+    loop = asyncio.get_running_loop()
+    incoming = queue.Queue()
+    outgoing = asyncio.Queue()
+    done = object()
+
+    def send(message):
+        loop.call_soon_threadsafe(outgoing.put_nowait, message)
+
+    def session():
+        try:
+            run_live_session(incoming.get, send)
+        finally:
+            loop.call_soon_threadsafe(outgoing.put_nowait, done)
+
+    async def pump_in():
+        try:
+            while True:
+                incoming.put(await websocket.receive())
+        finally:
+            incoming.put(None)  # Disconnected: end the audio stream
+
+    threading.Thread(target=session, daemon=True).start()
+    reader = asyncio.ensure_future(pump_in())
+    try:
+        while True:
+            message = await outgoing.get()
+            if message is done:
+                break
+            await websocket.send(message)
+    finally:
+        reader.cancel()
+
+
+if __name__ == '__main__':
+    print("🚀 Starting Speech-to-Text API Server (async mode)...")
+    print(f"🔑 Gemini API key: {'Found' if os.getenv('GEMINI_API_KEY') else 'Not found'}")
+    print(f"⚡ Max concurrent model calls: {MAX_CONCURRENCY}")
+    print(f"📝 Available endpoints:")
+    print(f"   GET  /health - Health check")
+    print(f"   GET  /metrics - Prometheus metrics")
+    print(f"   POST /transcribe - Transcribe audio file")
+    print(f"   POST /transcribe-blob - Transcribe audio blob")
+    print(f"   POST /transcribe-binary - Transcribe raw audio body")
+    print(f"   POST /tts/stream - Streaming text-to-speech (chunked WAV/PCM)")
+    print(f"   POST /tts/lipsync - Text-to-speech WAV with embedded viseme track")
+    print(f"   WS   /ws/transcribe - Live transcription (interim + final results)")
+
+    app.run(host='0.0.0.0', port=5000)
@@ -3,10 +3,95 @@
 
 import io
 import os
+import queue
+import threading
+import time
 from google.cloud import speech
-from google.oauth2 import service_account
-import wave
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from client_registry import get_speech_client
+from audio_normalize import flac_info, normalize_audio, opus_info, read_wav_header, sniff_mime_type
+from audio_vad import prepare_segments, plan_chunks, read_wav_bytes, read_wav_file, to_wav_bytes
+
+# Google closes a streaming session after ~305 s; restart it a little before that
+STREAMING_LIMIT_SECONDS = 290
+
+# Max audio chunks buffered between the audio source and the gRPC stream
+STREAMING_BUFFER_CHUNKS = 32
+
+# Synchronous recognize() rejects audio longer than ~1 minute
+SYNC_RECOGNIZE_LIMIT_SECONDS = 55
+
+# Compressed containers Cloud Speech decodes itself (sent as-is, no transcoding)
+COMPRESSED_ENCODINGS = {
+    "audio/webm": "WEBM_OPUS",
+    "audio/ogg": "OGG_OPUS",
+    "audio/flac": "FLAC",
+}
+
+# Opus always decodes at 48 kHz
+OPUS_SAMPLE_RATE = 48000
+
+# How long to wait for a long_running_recognize operation
+LONG_RUNNING_TIMEOUT_SECONDS = 900
+
+_END_OF_AUDIO = object()
+
+
+class _ResumableAudioStream:
+    """
+    Bounded buffer between an audio generator and successive streaming sessions
+    
+    A background thread pulls chunks from the source into a bounded queue
+    (backpressure: the source blocks when the queue is full). Each session
+    drains the queue until its time limit, and the next session picks up
+    exactly where the previous one stopped.
+    """
+    
+    def __init__(self, audio_generator, max_buffered_chunks=STREAMING_BUFFER_CHUNKS):
+        self._queue = queue.Queue(maxsize=max_buffered_chunks)
+        self._stop = threading.Event()
+        self.finished = False
+        self.error = None
+        self._thread = threading.Thread(target=self._fill, args=(audio_generator,), daemon=True)
+        self._thread.start()
+    
+    def _fill(self, audio_generator):
+        try:
+            for chunk in audio_generator:
+                if not self._put(chunk):
+                    return
+        except Exception as e:
+            self.error = e
+        self._put(_END_OF_AUDIO)
+    
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def requests(self, session_limit):
+        """Yield audio requests for one session, until end of audio or session_limit seconds"""
+        deadline = time.monotonic() + session_limit
+        while time.monotonic() < deadline and not self._stop.is_set():
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is _END_OF_AUDIO:
+                self.finished = True
+                return
+            if chunk:
+                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+    
+    def close(self):
+        self._stop.set()
+
 
 class SpeechToText:
     def __init__(self, credentials_path=None):
@@ -17,70 +102,69 @@ class SpeechToText:
             credentials_path: Path to Google Cloud service account JSON file
                             If None, will use GOOGLE_APPLICATION_CREDENTIALS environment variable
         """
-        if credentials_path:
-            credentials = service_account.Credentials.from_service_account_file(credentials_path)
-            self.client = speech.SpeechClient(credentials=credentials)
-        else:
-            # Use default credentials from environment
-            self.client = speech.SpeechClient()
+        # Shared per-process client: the gRPC channel and credentials are loaded
+        # once, not on every SpeechToText() / transcribe_file() call
+        self.client = get_speech_client(credentials_path)
     
     def transcribe_audio_file(self, audio_file_path, language_code="en-US", 
-                            enable_word_time_offsets=True, enable_automatic_punctuation=True):
+                            enable_word_time_offsets=True, enable_automatic_punctuation=True,
+                            trim_silence=False, split_pause_ms=0, max_workers=4):
         """
         Transcribe audio file to text
         
         Args:
-            audio_file_path: Path to audio file (WAV format recommended)
+            audio_file_path: Path to audio file (WAV, or FLAC / Ogg / WebM Opus,
+                             which are uploaded as-is)
             language_code: Language code (e.g., "en-US", "vi-VN")
             enable_word_time_offsets: Include word timing information
             enable_automatic_punctuation: Add punctuation automatically
+            trim_silence: Drop leading/trailing silence before upload (WAV only)
+            split_pause_ms: Split on pauses at least this long and transcribe the
+                            segments in parallel (WAV only, 0 = don't split)
+            max_workers: Max segments transcribed concurrently
+            
+        WAV files longer than the synchronous recognize() limit automatically use
+        the chunked long-audio mode (see transcribe_long_audio_file).
             
         Returns:
-            Dictionary with transcription results
+            Dictionary with transcription results. Word times are always relative
+            to the start of the original file.
         """
         try:
             # Read audio file
             with io.open(audio_file_path, "rb") as audio_file:
                 content = audio_file.read()
             
-            # Get audio info for better configuration
-            sample_rate, channels = self._get_audio_info(audio_file_path)
-            
-            audio = speech.RecognitionAudio(content=content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=sample_rate,
-                language_code=language_code,
-                enable_word_time_offsets=enable_word_time_offsets,
-                enable_automatic_punctuation=enable_automatic_punctuation,
-                audio_channel_count=channels,
-            )
+            # Mono 16 kHz LINEAR16 (stereo / 44.1-48 kHz / 24-bit / float WAV)
+            content, _ = normalize_audio(content)
+            encoding, sample_rate, channels, duration = self._get_audio_info(content)
             
-            # Perform transcription
-            response = self.client.recognize(config=config, audio=audio)
+            options = {
+                "language_code": language_code,
+                "enable_word_time_offsets": enable_word_time_offsets,
+                "enable_automatic_punctuation": enable_automatic_punctuation,
+            }
             
-            # Process results
-            results = []
-            for result in response.results:
-                alternative = result.alternatives[0]
-                result_data = {
-                    "transcript": alternative.transcript,
-                    "confidence": alternative.confidence
+            if encoding != "LINEAR16":
+                results = self._recognize_compressed(content, encoding, sample_rate, channels, duration, **options)
+                return {
+                    "success": True,
+                    "results": results,
+                    "full_transcript": " ".join([r["transcript"] for r in results])
                 }
-                
-                # Add word timing if enabled
-                if enable_word_time_offsets and alternative.words:
-                    words = []
-                    for word_info in alternative.words:
-                        word_data = {
-                            "word": word_info.word,
-                            "start_time": word_info.start_time.total_seconds(),
-                            "end_time": word_info.end_time.total_seconds()
-                        }
-                        words.append(word_data)
-                    result_data["words"] = words
-                
-                results.append(result_data)
+            
+            decoded = read_wav_bytes(content)
+            if decoded is not None and len(decoded[0]) > SYNC_RECOGNIZE_LIMIT_SECONDS * decoded[1]:
+                return self._transcribe_long(decoded, max_workers=max_workers, **options)
+            
+            segments = None
+            if trim_silence or split_pause_ms:
+                segments = prepare_segments(content, trim=trim_silence, split_pause_ms=split_pause_ms)
+            
+            if segments is None:
+                results = self._recognize(content, sample_rate, channels, **options)
+            else:
+                results = self._recognize_segments(segments, sample_rate, channels, max_workers, **options)
             
             return {
                 "success": True,
@@ -94,22 +178,239 @@ class SpeechToText:
                 "error": str(e)
             }
     
+    def transcribe_audio_bytes(self, content, language_code="en-US",
+                               enable_word_time_offsets=False, enable_automatic_punctuation=True,
+                               max_workers=4):
+        """
+        Transcribe in-memory audio (16-bit PCM WAV, WebM/Ogg Opus or FLAC)
+        
+        Args:
+            content: Audio bytes
+            language_code: Language code
+            enable_word_time_offsets: Include word timing information
+            enable_automatic_punctuation: Add punctuation automatically
+            max_workers: Max chunks transcribed concurrently (long WAV audio)
+            
+        Returns:
+            Dictionary with transcription results (same format as transcribe_audio_file)
+        """
+        try:
+            options = {
+                "language_code": language_code,
+                "enable_word_time_offsets": enable_word_time_offsets,
+                "enable_automatic_punctuation": enable_automatic_punctuation,
+            }
+            
+            content, _ = normalize_audio(content)
+            decoded = read_wav_bytes(content)
+            if decoded is not None:
+                samples, sample_rate, channels = decoded
+                if len(samples) > SYNC_RECOGNIZE_LIMIT_SECONDS * sample_rate:
+                    return self._transcribe_long(decoded, max_workers=max_workers, **options)
+                results = self._recognize(content, sample_rate, channels, **options)
+            else:
+                encoding, sample_rate, channels, duration = self._get_audio_info(content)
+                results = self._recognize_compressed(content, encoding, sample_rate, channels, duration, **options)
+            
+            return {
+                "success": True,
+                "results": results,
+                "full_transcript": " ".join([r["transcript"] for r in results])
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _recognize(self, content, sample_rate, channels, language_code,
+                   enable_word_time_offsets, enable_automatic_punctuation, offset=0.0,
+                   encoding="LINEAR16", long_running=False):
+        """
+        Run client.recognize on one piece of audio; word times are shifted by offset
+        
+        long_running uses long_running_recognize instead (inline audio longer
+        than the synchronous limit, up to 10 MB).
+        """
+        audio = speech.RecognitionAudio(content=content)
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+            enable_word_time_offsets=enable_word_time_offsets,
+            enable_automatic_punctuation=enable_automatic_punctuation,
+            audio_channel_count=channels,
+        )
+        
+        # Perform transcription
+        if long_running:
+            operation = self.client.long_running_recognize(config=config, audio=audio)
+            response = operation.result(timeout=LONG_RUNNING_TIMEOUT_SECONDS)
+        else:
+            response = self.client.recognize(config=config, audio=audio)
+        
+        # Process results
+        results = []
+        for result in response.results:
+            alternative = result.alternatives[0]
+            result_data = {
+                "transcript": alternative.transcript,
+                "confidence": alternative.confidence
+            }
+            
+            # Add word timing if enabled
+            if enable_word_time_offsets and alternative.words:
+                words = []
+                for word_info in alternative.words:
+                    word_data = {
+                        "word": word_info.word,
+                        "start_time": word_info.start_time.total_seconds() + offset,
+                        "end_time": word_info.end_time.total_seconds() + offset
+                    }
+                    words.append(word_data)
+                result_data["words"] = words
+            
+            results.append(result_data)
+        
+        return results
+    
+    def _recognize_compressed(self, content, encoding, sample_rate, channels, duration, **options):
+        """Send compressed audio with its own encoding; long clips go through long_running_recognize"""
+        long_running = duration is not None and duration > SYNC_RECOGNIZE_LIMIT_SECONDS
+        return self._recognize(content, sample_rate, channels, encoding=encoding,
+                               long_running=long_running, **options)
+    
+    def _recognize_segments(self, segments, sample_rate, channels, max_workers, **options):
+        """Transcribe VAD segments concurrently, keeping results in recording order"""
+        def recognize(segment):
+            return self._recognize(segment["audio"], sample_rate, channels,
+                                   offset=segment["start"], **options)
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            segment_results = list(executor.map(recognize, segments))
+        
+        return [result for results in segment_results for result in results]
+    
+    def transcribe_long_audio_file(self, audio_file_path, language_code="en-US",
+                                   enable_word_time_offsets=True, enable_automatic_punctuation=True,
+                                   max_chunk_seconds=50, overlap_seconds=1.0, max_workers=4):
+        """
+        Transcribe a WAV file longer than the synchronous recognize() limit
+        
+        The audio is split at silence (or at fixed windows with overlap when the
+        speaker doesn't pause), chunks are transcribed concurrently, and the
+        transcripts and word times are stitched back together.
+        
+        Args:
+            audio_file_path: Path to a 16-bit PCM WAV file
+            language_code: Language code
+            enable_word_time_offsets: Include word timing information
+            enable_automatic_punctuation: Add punctuation automatically
+            max_chunk_seconds: Max chunk length sent to recognize()
+            overlap_seconds: Overlap between chunks cut without a silence gap
+            max_workers: Max chunks transcribed concurrently
+            
+        Returns:
+            Dictionary with transcription results (same format as transcribe_audio_file)
+        """
+        try:
+            decoded = read_wav_file(audio_file_path)
+            if decoded is None:
+                return {
+                    "success": False,
+                    "error": "Long-audio mode requires a 16-bit PCM WAV file"
+                }
+            return self._transcribe_long(
+                decoded,
+                language_code=language_code,
+                enable_word_time_offsets=enable_word_time_offsets,
+                enable_automatic_punctuation=enable_automatic_punctuation,
+                max_chunk_seconds=max_chunk_seconds,
+                overlap_seconds=overlap_seconds,
+                max_workers=max_workers
+            )
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _transcribe_long(self, decoded, language_code, enable_word_time_offsets,
+                         enable_automatic_punctuation, max_chunk_seconds=50,
+                         overlap_seconds=1.0, max_workers=4):
+        samples, sample_rate, channels = decoded
+        chunks = plan_chunks(samples, sample_rate, max_chunk_seconds, overlap_seconds)
+        print(f"Long audio: {len(samples) / sample_rate:.1f}s in {len(chunks)} chunks")
+        
+        def recognize(chunk):
+            start, end, keep_start, keep_end = chunk
+            # Word offsets are needed to stitch overlapping chunks
+            results = self._recognize(
+                to_wav_bytes(samples[start:end], sample_rate), sample_rate, channels,
+                language_code=language_code,
+                enable_word_time_offsets=True,
+                enable_automatic_punctuation=enable_automatic_punctuation,
+                offset=start / sample_rate
+            )
+            return self._keep_owned_words(
+                results, keep_start / sample_rate, keep_end / sample_rate, enable_word_time_offsets
+            )
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            chunk_results = list(executor.map(recognize, chunks))
+        
+        results = [result for results in chunk_results for result in results]
+        return {
+            "success": True,
+            "results": results,
+            "full_transcript": " ".join([r["transcript"] for r in results])
+        }
+    
+    def _keep_owned_words(self, results, keep_start, keep_end, include_words):
+        """Drop words outside [keep_start, keep_end) so overlapping chunks don't repeat them"""
+        kept = []
+        for result in results:
+            words = result.get("words")
+            if words is not None:
+                owned = [w for w in words if keep_start <= w["start_time"] < keep_end]
+                if not owned:
+                    continue
+                if len(owned) != len(words):
+                    result = dict(result, transcript=" ".join(w["word"] for w in owned))
+                result["words"] = owned
+                if not include_words:
+                    del result["words"]
+            kept.append(result)
+        return kept
+    
     def transcribe_streaming(self, audio_generator, language_code="en-US", 
-                           sample_rate=16000, interim_results=True):
+                           sample_rate=16000, interim_results=True,
+                           max_buffered_chunks=STREAMING_BUFFER_CHUNKS,
+                           session_limit=STREAMING_LIMIT_SECONDS, encoding="LINEAR16"):
         """
         Perform streaming speech recognition
         
+        Audio chunks are sent as they arrive (not collected up front), so interim
+        results come back while the speaker is still talking. Sessions longer than
+        the API's ~5-minute limit are restarted transparently.
+        
         Args:
             audio_generator: Generator yielding audio chunks
             language_code: Language code
             sample_rate: Audio sample rate
             interim_results: Return interim results
+            max_buffered_chunks: Max chunks buffered ahead of the gRPC stream
+            session_limit: Seconds before a session is closed and a new one started
+            encoding: RecognitionConfig.AudioEncoding name ("LINEAR16", "OGG_OPUS",
+                      "WEBM_OPUS"). Session restarts are only seamless for LINEAR16,
+                      since a container stream cannot be cut mid-way.
             
         Yields:
             Transcription results as they become available
         """
         config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
             sample_rate_hertz=sample_rate,
             language_code=language_code,
             enable_automatic_punctuation=True,
@@ -120,32 +421,61 @@ class SpeechToText:
             interim_results=interim_results,
         )
         
-        audio_generator = (speech.StreamingRecognizeRequest(audio_content=chunk)
-                          for chunk in audio_generator)
-        
-        requests = (speech.StreamingRecognizeRequest(streaming_config=streaming_config),)
-        requests = requests + tuple(audio_generator)
+        audio_stream = _ResumableAudioStream(audio_generator, max_buffered_chunks)
+        session = 0
+        try:
+            while not audio_stream.finished:
+                # The helper sends the streaming_config request first, then our audio
+                responses = self.client.streaming_recognize(
+                    streaming_config, audio_stream.requests(session_limit)
+                )
+                
+                for response in responses:
+                    for result in response.results:
+                        if not result.alternatives:
+                            continue
+                        yield {
+                            "transcript": result.alternatives[0].transcript,
+                            "is_final": result.is_final,
+                            "confidence": result.alternatives[0].confidence if result.is_final else None,
+                            "session": session
+                        }
+                
+                session += 1
+            
+            if audio_stream.error is not None:
+                raise audio_stream.error
+        finally:
+            audio_stream.close()
+    
+    def _get_audio_info(self, content):
+        """
+        RecognitionConfig parameters read from the audio itself
         
-        responses = self.client.streaming_recognize(requests)
+        Returns:
+            (encoding, sample_rate, channels, duration); duration is None when
+            the container doesn't say (WAV and WebM: callers check length
+            themselves or use synchronous recognize)
         
-        for response in responses:
-            for result in response.results:
-                yield {
-                    "transcript": result.alternatives[0].transcript,
-                    "is_final": result.is_final,
-                    "confidence": result.alternatives[0].confidence if result.is_final else None
-                }
-    
-    def _get_audio_info(self, audio_file_path):
-        """Get audio file information (sample rate, channels)"""
-        try:
-            with wave.open(audio_file_path, 'rb') as wav_file:
-                sample_rate = wav_file.getframerate()
-                channels = wav_file.getnchannels()
-                return sample_rate, channels
-        except:
-            # Default values if unable to read file info
-            return 16000, 1
+        Raises:
+            ValueError: unsupported format (guessing 16 kHz mono would only fail
+                        later at the API with a less useful error)
+        """
+        mime_type = sniff_mime_type(content)
+        if mime_type == "audio/wav":
+            info = read_wav_header(content)
+            if info is not None:
+                return "LINEAR16", info["sample_rate"], info["channels"], None
+        elif mime_type == "audio/flac":
+            info = flac_info(content)
+            if info is not None:
+                return ("FLAC",) + info
+        elif mime_type in COMPRESSED_ENCODINGS:
+            info = opus_info(content)
+            if info is not None:
+                channels, duration = info
+                return COMPRESSED_ENCODINGS[mime_type], OPUS_SAMPLE_RATE, channels, duration
+        raise ValueError("Unsupported audio format (expected WAV, WebM/Ogg Opus or FLAC)")
 
 
 def transcribe_file(file_path, language="en-US", credentials_path=None):
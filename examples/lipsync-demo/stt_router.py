@@ -0,0 +1,355 @@
+# Multi-backend routing for speech-to-text
+# Danh sách backend theo thứ tự (các model Gemini, Google Cloud Speech, model
+# local), theo dõi latency p50/p95 và tỉ lệ lỗi của từng backend, chọn backend
+# nhanh nhất đang khoẻ và tự chuyển sang backend khác khi một backend lỗi.
+
+import asyncio
+import io
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from metrics import MODEL_CALLS, MODEL_CALLS_IN_FLIGHT
+from rate_limiter import PRIORITY_LIVE
+from request_hedging import (
+    HEDGE_ENABLED, HEDGE_PERCENTILE, HedgeBudget, hedged_call, hedged_call_async
+)
+
+try:
+    from faster_whisper import WhisperModel  # Optional local fallback
+except ImportError:
+    WhisperModel = None
+
+# Backend order (unavailable ones are skipped)
+BACKENDS = os.getenv('STT_BACKENDS', 'gemini,cloud_speech,local')
+
+# Gemini models, in preference order
+GEMINI_MODELS = [m.strip() for m in os.getenv('GEMINI_MODELS', 'gemini-1.5-flash').split(',') if m.strip()]
+
+# Rolling window of calls kept per backend for latency / error rate
+WINDOW_SIZE = int(os.getenv('STT_ROUTER_WINDOW', 50))
+MIN_SAMPLES = 5
+
+# A backend whose error rate goes above this is skipped for COOLDOWN_SECONDS
+MAX_ERROR_RATE = float(os.getenv('STT_ROUTER_MAX_ERROR_RATE', 0.5))
+COOLDOWN_SECONDS = float(os.getenv('STT_ROUTER_COOLDOWN', 30))
+
+# Every Nth request goes to the least-measured healthy backend first, so
+# latencies of fallbacks stay known and a faster backend gets discovered (0 = off)
+PROBE_EVERY = int(os.getenv('STT_ROUTER_PROBE_EVERY', 20))
+
+LOCAL_MODEL_SIZE = os.getenv('STT_LOCAL_MODEL', 'small')
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = min(len(ordered), max(1, math.ceil(q / 100.0 * len(ordered)))) - 1
+    return ordered[index]
+
+
+class BackendStats:
+    def __init__(self, window=WINDOW_SIZE):
+        """Rolling latency / error stats with a simple circuit breaker"""
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)  # (seconds, ok)
+        self.calls = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            self._samples.append((seconds, ok))
+            errors = sum(1 for _, sample_ok in self._samples if not sample_ok)
+            if len(self._samples) >= MIN_SAMPLES and errors / len(self._samples) > MAX_ERROR_RATE:
+                # Trip: skip this backend for a while, then start over with a clean window
+                self.down_until = time.monotonic() + COOLDOWN_SECONDS
+                self._samples.clear()
+
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def sample_count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def latency(self, q):
+        """Latency percentile of successful calls, or None without enough samples"""
+        with self._lock:
+            latencies = [seconds for seconds, ok in self._samples if ok]
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return percentile(latencies, q)
+
+    def snapshot(self):
+        with self._lock:
+            samples = list(self._samples)
+        latencies = [seconds for seconds, ok in samples if ok]
+        p50 = percentile(latencies, 50) if latencies else None
+        p95 = percentile(latencies, 95) if latencies else None
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "error_rate": round(sum(1 for _, ok in samples if not ok) / len(samples), 3) if samples else 0.0,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "healthy": self.healthy()
+        }
+
+
+class GeminiBackend:
+    def __init__(self, api, model):
+        self.api = api
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    def available(self):
+        return self.api.client is not None
+
+    def transcribe(self, audio_data, language_code, priority):
+        return self.api.transcribe_audio_gemini(audio_data, language_code, priority, model=self.model)
+
+    async def transcribe_async(self, audio_data, language_code, priority):
+        return await self.api.transcribe_audio_gemini_async(audio_data, language_code, priority, model=self.model)
+
+
+class CloudSpeechBackend:
+    name = "cloud_speech"
+
+    def __init__(self, credentials_path=None):
+        self.credentials_path = credentials_path
+        self._stt = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return bool(self.credentials_path)
+
+    def _get_stt(self):
+        with self._lock:
+            if self._stt is None:
+                from speech_to_text import SpeechToText
+                self._stt = SpeechToText(self.credentials_path)
+            return self._stt
+
+    def transcribe(self, audio_data, language_code, priority):
+        result = self._get_stt().transcribe_audio_bytes(audio_data, language_code=language_code)
+        if not result["success"]:
+            return {"error": f"Cloud Speech transcription failed: {result['error']}"}
+        for item in result["results"]:
+            item["model_used"] = self.name
+        return result
+
+    async def transcribe_async(self, audio_data, language_code, priority):
+        return await asyncio.to_thread(self.transcribe, audio_data, language_code, priority)
+
+    def word_timings(self, audio_data, language_code):
+        """Transcription with per-word start_time / end_time (SpeechToText result format)"""
+        return self._get_stt().transcribe_audio_bytes(
+            audio_data, language_code=language_code, enable_word_time_offsets=True
+        )
+
+
+class LocalWhisperBackend:
+    name = "local"
+
+    def __init__(self, model_size=LOCAL_MODEL_SIZE):
+        self.model_size = model_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return WhisperModel is not None
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = WhisperModel(self.model_size, device="cpu", compute_type="int8")
+            return self._model
+
+    def transcribe(self, audio_data, language_code, priority):
+        segments, _ = self._get_model().transcribe(io.BytesIO(audio_data), language=language_code.split('-')[0])
+        transcript = " ".join(segment.text.strip() for segment in segments).strip()
+        return {
+            "success": True,
+            "results": [{
+                "transcript": transcript,
+                "confidence": 0.80,
+                "model_used": f"whisper-{self.model_size}"
+            }],
+            "full_transcript": transcript
+        }
+
+    async def transcribe_async(self, audio_data, language_code, priority):
+        return await asyncio.to_thread(self.transcribe, audio_data, language_code, priority)
+
+
+class STTRouter:
+    def __init__(self, backends):
+        """
+        Route transcriptions over an ordered list of backends
+
+        Healthy backends with enough latency samples are tried fastest-first
+        (by p95); backends without data keep their configured order after them,
+        and backends in cooldown are tried last. A failed call falls through to
+        the next backend. Every PROBE_EVERY-th request tries the least-measured
+        healthy backend first.
+        
+        With hedging enabled (STT_HEDGE=1), a call that is slower than the
+        backend's HEDGE_PERCENTILE latency gets a backup call to the next
+        backend (or the same one if it's the only one), within the hedge budget.
+        """
+        self.backends = backends
+        self.stats_by_name = {backend.name: BackendStats() for backend in backends}
+        self.hedging = HEDGE_ENABLED
+        self.hedge_budget = HedgeBudget()
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def backend(self, name):
+        """The configured, available backend called name, or None"""
+        return next((b for b in self.backends if b.name == name and b.available()), None)
+
+    def ordered(self):
+        measured, unmeasured, down = [], [], []
+        for backend in self.backends:
+            if not backend.available():
+                continue
+            stats = self.stats_by_name[backend.name]
+            p95 = stats.latency(95)
+            if not stats.healthy():
+                down.append(backend)
+            elif p95 is None:
+                unmeasured.append(backend)
+            else:
+                measured.append((p95, len(measured), backend))
+        measured.sort()
+        healthy = [backend for _, _, backend in measured] + unmeasured
+        
+        with self._lock:
+            self._requests += 1
+            probe = PROBE_EVERY > 0 and self._requests % PROBE_EVERY == 0
+        if probe and len(healthy) > 1:
+            least = min(healthy, key=lambda b: self.stats_by_name[b.name].sample_count())
+            healthy.remove(least)
+            healthy.insert(0, least)
+        return healthy + down
+
+    def _record(self, backend, started, result):
+        ok = bool(result.get("success"))
+        self.stats_by_name[backend.name].record(time.perf_counter() - started, ok)
+        MODEL_CALLS.inc(backend=backend.name, outcome="success" if ok else "error")
+        if ok:
+            result["backend"] = backend.name
+        else:
+            print(f"⚠️ Backend {backend.name} failed: {result.get('error')}")
+        return result
+
+    def _call(self, backend, audio_data, language_code, priority):
+        started = time.perf_counter()
+        try:
+            with MODEL_CALLS_IN_FLIGHT.track_in_progress(backend=backend.name):
+                result = backend.transcribe(audio_data, language_code, priority)
+        except Exception as e:
+            result = {"error": f"{backend.name} failed: {str(e)}"}
+        return self._record(backend, started, result)
+
+    async def _call_async(self, backend, audio_data, language_code, priority):
+        started = time.perf_counter()
+        try:
+            with MODEL_CALLS_IN_FLIGHT.track_in_progress(backend=backend.name):
+                result = await backend.transcribe_async(audio_data, language_code, priority)
+        except Exception as e:
+            result = {"error": f"{backend.name} failed: {str(e)}"}
+        return self._record(backend, started, result)
+
+    def _hedge_plan(self, backend, remaining):
+        """(delay, alternate) if the call to backend should be hedged, else (None, None)"""
+        if not self.hedging:
+            return None, None
+        delay = self.stats_by_name[backend.name].latency(HEDGE_PERCENTILE)
+        if delay is None:
+            return None, None
+        return delay, remaining[0] if remaining else backend
+
+    def transcribe(self, audio_data, language_code="vi-VN", priority=PRIORITY_LIVE):
+        result = None
+        backends = self.ordered()
+        while backends:
+            backend = backends.pop(0)
+            delay, alternate = self._hedge_plan(backend, backends)
+            if delay is None:
+                result = self._call(backend, audio_data, language_code, priority)
+            else:
+                result, hedged = hedged_call(
+                    partial(self._call, backend, audio_data, language_code, priority),
+                    partial(self._call, alternate, audio_data, language_code, priority),
+                    delay, self.hedge_budget
+                )
+                if hedged and alternate is not backend:
+                    backends.remove(alternate)
+            if result.get("success"):
+                return result
+        return result or no_backend_result()
+
+    async def transcribe_async(self, audio_data, language_code="vi-VN", priority=PRIORITY_LIVE):
+        result = None
+        backends = self.ordered()
+        while backends:
+            backend = backends.pop(0)
+            delay, alternate = self._hedge_plan(backend, backends)
+            if delay is None:
+                result = await self._call_async(backend, audio_data, language_code, priority)
+            else:
+                result, hedged = await hedged_call_async(
+                    partial(self._call_async, backend, audio_data, language_code, priority),
+                    partial(self._call_async, alternate, audio_data, language_code, priority),
+                    delay, self.hedge_budget
+                )
+                if hedged and alternate is not backend:
+                    backends.remove(alternate)
+            if result.get("success"):
+                return result
+        return result or no_backend_result()
+
+    def hedge_stats(self):
+        return dict(self.hedge_budget.stats(), enabled=self.hedging, percentile=HEDGE_PERCENTILE)
+
+    def stats(self):
+        return {
+            backend.name: dict(self.stats_by_name[backend.name].snapshot(), available=backend.available())
+            for backend in self.backends
+        }
+
+
+def no_backend_result():
+    return {
+        "error": "No speech-to-text backend available. Please check your GEMINI_API_KEY or GOOGLE_APPLICATION_CREDENTIALS."
+    }
+
+
+def build_router(api, backend_names=BACKENDS):
+    """
+    Router for a SpeechToTextAPI, configured from STT_BACKENDS / GEMINI_MODELS
+
+    Args:
+        api: SpeechToTextAPI providing the Gemini client
+        backend_names: Comma-separated backend kinds in preference order
+                       ("gemini", "cloud_speech", "local")
+    """
+    backends = []
+    for kind in (name.strip() for name in backend_names.split(',')):
+        if kind == "gemini":
+            backends.extend(GeminiBackend(api, model) for model in GEMINI_MODELS)
+        elif kind == "cloud_speech":
+            backends.append(CloudSpeechBackend(os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or None))
+        elif kind == "local":
+            backends.append(LocalWhisperBackend())
+        elif kind:
+            print(f"⚠️ Unknown STT backend: {kind}")
+    return STTRouter(backends)
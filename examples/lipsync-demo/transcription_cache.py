@@ -0,0 +1,119 @@
+# Transcription cache for the Speech-to-Text API
+# Cache kết quả transcription theo hash của audio + ngôn ngữ + model
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def audio_digest(audio_data):
+    """SHA-256 hex digest of the raw audio bytes"""
+    return hashlib.sha256(audio_data).hexdigest()
+
+
+def cache_key(audio_data, language_code, model):
+    """Content-addressed key: audio digest + language code + model name"""
+    return f"{audio_digest(audio_data)}:{language_code}:{model}"
+
+
+class TranscriptionCache:
+    def __init__(self, max_entries=256, cache_dir=None):
+        """
+        Two-tier transcription cache
+
+        Args:
+            max_entries: Max number of results kept in the in-memory LRU tier
+            cache_dir: Optional directory for the on-disk tier (survives restarts).
+                       If None, only the in-memory tier is used.
+        """
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached result dict for key, or None"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        """Store a successful transcription result"""
+        if not result.get("success"):
+            return
+        with self._lock:
+            self._remember(key, result)
+        self._write_disk(key, result)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "disk_tier": self.cache_dir is not None
+            }
+
+    def _remember(self, key, result):
+        # Caller holds self._lock
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        # Key contains ':' (not valid on Windows), so hash it again for the filename
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], f"{name}.json")
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Unreadable cache entry {path}: {e}")
+            return None
+
+    def _write_disk(self, key, result):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file then rename, so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write cache entry {path}: {e}")
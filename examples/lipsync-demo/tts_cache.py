@@ -0,0 +1,220 @@
+# TTS phrase cache
+# Cache audio TTS trên đĩa theo text (đã chuẩn hoá) + giọng đọc + model. Các câu
+# lặp lại (chào hỏi, các dòng trong dialogues.json) được trả về ngay thay vì
+# tổng hợp lại. Dung lượng giới hạn theo byte, xoá file ít dùng nhất (LRU);
+# nhiều worker process có thể dùng chung một thư mục cache.
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import threading
+import unicodedata
+import wave
+from collections import OrderedDict
+
+from ai_studio_code import DEFAULT_VOICES, TTS_MODEL, stream_tts, stream_tts_async
+from wav_writer import StreamingWavWriter
+
+# Opt-in: set TTS_CACHE_DIR to enable
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR') or None
+TTS_CACHE_MAX_BYTES = int(float(os.getenv('TTS_CACHE_MAX_MB', 200)) * 1024 * 1024)
+
+
+def normalize_text(text):
+    """NFC, collapsed whitespace; case and punctuation are kept since they change delivery"""
+    return " ".join(unicodedata.normalize('NFC', text).split())
+
+
+def tts_cache_key(text, voices=None, model=TTS_MODEL):
+    """Key: normalized text + voice config (single voice or speaker map) + model"""
+    voices = voices or DEFAULT_VOICES
+    if isinstance(voices, dict):
+        voices = sorted(voices.items())
+    payload = json.dumps([normalize_text(text), voices, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, cache_dir, max_bytes=TTS_CACHE_MAX_BYTES):
+        """
+        On-disk TTS audio cache (one WAV per phrase)
+
+        The directory is the source of truth, so several worker processes can
+        share it: a hit touches the file's mtime (the LRU clock), and eviction
+        rescans file mtimes and sizes, so it sees entries written by others.
+
+        Args:
+            cache_dir: Directory for cached WAV files (survives restarts)
+            max_bytes: Total size limit; least recently used files are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._lock:
+            self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_index(self):
+        # Oldest access first (mtime), as seen by every process sharing the directory
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.wav'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, name[:-4], stat.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self.total_bytes = sum(self._entries.values())
+
+    def get(self, key):
+        """
+        Cached audio for key
+
+        Returns:
+            (pcm_bytes, mime_type) or None
+        """
+        path = self._path(key)
+        try:
+            with wave.open(path, 'rb') as wav:
+                pcm = wav.readframes(wav.getnframes())
+                mime_type = f"audio/L{wav.getsampwidth() * 8};codec=pcm;rate={wav.getframerate()}"
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, EOFError, wave.Error) as e:
+            print(f"⚠️ Unreadable TTS cache entry {path}: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return pcm, mime_type
+
+    def put(self, key, wav_bytes):
+        """Store a complete WAV file for key, then evict down to max_bytes"""
+        path = self._path(key)
+        try:
+            # Write to a temp file then rename, so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(wav_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write TTS cache entry {path}: {e}")
+            return
+        with self._lock:
+            # Rescan: other processes may have added, touched or evicted files
+            self._load_index()
+            self._entries.move_to_end(key)
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                # Already evicted by another process
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def default_tts_cache():
+    """TTSCache configured from TTS_CACHE_DIR / TTS_CACHE_MAX_MB, or None if disabled"""
+    return TTSCache(TTS_CACHE_DIR) if TTS_CACHE_DIR else None
+
+
+class _Recorder:
+    """Tees streamed PCM into an in-memory WAV; stored only if the stream completes"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.buffer = io.BytesIO()
+        self.writer = None
+
+    def write(self, data, mime_type):
+        if self.writer is None:
+            self.writer = StreamingWavWriter.for_mime_type(self.buffer, mime_type)
+        self.writer.write(data)
+
+    def finish(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.cache.put(self.key, self.buffer.getvalue())
+
+
+def cached_stream_tts(cache, client, text, voices=None, model=TTS_MODEL):
+    """
+    stream_tts with a cache in front: a hit yields the whole clip as one chunk,
+    a miss streams from Gemini and stores the clip once it has fully arrived
+
+    Args:
+        cache: TTSCache, or None to always synthesize
+
+    Yields:
+        (data, mime_type)
+    """
+    if cache is None:
+        yield from stream_tts(client, text, voices, model)
+        return
+    key = tts_cache_key(text, voices, model)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    recorder = _Recorder(cache, key)
+    for data, mime_type in stream_tts(client, text, voices, model):
+        recorder.write(data, mime_type)
+        yield data, mime_type
+    recorder.finish()
+
+
+async def cached_stream_tts_async(cache, client, text, voices=None, model=TTS_MODEL):
+    """asyncio variant of cached_stream_tts"""
+    if cache is None:
+        async for item in stream_tts_async(client, text, voices, model):
+            yield item
+        return
+    key = tts_cache_key(text, voices, model)
+    # Disk I/O off the event loop
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        yield cached
+        return
+    recorder = _Recorder(cache, key)
+    async for data, mime_type in stream_tts_async(client, text, voices, model):
+        recorder.write(data, mime_type)
+        yield data, mime_type
+    await asyncio.to_thread(recorder.finish)
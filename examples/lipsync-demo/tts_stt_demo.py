@@ -5,6 +5,7 @@ import os
 import json
 from generate_audio import generate, save_binary_file
 from speech_to_text import SpeechToText, transcribe_file
+from batch_transcribe import AUDIO_EXTENSIONS, run_batch, print_summary
 
 def demo_tts_stt_pipeline():
     """
@@ -74,12 +75,11 @@ def transcribe_existing_audio():
     """
     print("=== Transcribe Existing Audio ===\n")
     
-    # Look for audio files
-    audio_extensions = ['.wav', '.mp3', '.m4a', '.flac']
+    # Look for audio files (only formats transcribe_audio_file accepts)
     audio_files = []
     
     for file in os.listdir('.'):
-        if any(file.lower().endswith(ext) for ext in audio_extensions):
+        if file.lower().endswith(AUDIO_EXTENSIONS):
             audio_files.append(file)
     
     if not audio_files:
@@ -94,7 +94,11 @@ def transcribe_existing_audio():
     choice = input("\nEnter file number to transcribe (or 'all' for all files): ").strip()
     
     if choice.lower() == 'all':
-        files_to_process = audio_files
+        # Process pool instead of one file at a time; writes <name>_transcription.json
+        workers = input("Concurrent workers (default 4): ").strip()
+        summary = run_batch(audio_files, language="en-US", workers=int(workers) if workers.isdigit() else 4)
+        print_summary(summary)
+        return
     else:
         try:
             file_index = int(choice) - 1
@@ -0,0 +1,302 @@
+# Streaming upload ingestion for the Speech-to-Text API
+# Đọc body theo từng chunk vào buffer có giới hạn (spooled), decode base64 dần dần
+# thay vì giữ JSON text + chuỗi base64 + bytes đã decode cùng lúc trong RAM.
+
+import base64
+import binascii
+import json
+import os
+import tempfile
+import time
+
+# Max upload size (raw request body); larger uploads are rejected with 413
+MAX_UPLOAD_BYTES = int(float(os.getenv('STT_MAX_UPLOAD_MB', 25)) * 1024 * 1024)
+
+# Read size per chunk, and how much audio stays in RAM before spilling to a temp file
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+# Non-audio JSON fields (language, sampleRate, ...) are tiny; cap them anyway
+MAX_JSON_FIELDS_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised as soon as an upload goes over the configured size limit"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds maximum size of {max_bytes / (1024 * 1024):g} MB")
+        self.max_bytes = max_bytes
+
+
+def new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode='w+b')
+
+
+def check_content_length(content_length, max_bytes=MAX_UPLOAD_BYTES):
+    """Reject early from the Content-Length header, before reading the body"""
+    if content_length is not None and content_length > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+
+class BoundedSpool:
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES):
+        """
+        Raw body sink: chunks are written to a spooled buffer up to max_bytes
+
+        Args:
+            max_bytes: Size limit; UploadTooLarge is raised as soon as it is exceeded
+        """
+        self.max_bytes = max_bytes
+        self.file = new_spool()
+        self.size = 0
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self.file.write(chunk)
+
+    def finish(self):
+        """Returns the spooled file, rewound to the start"""
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+def spool_stream(stream, max_bytes=MAX_UPLOAD_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    Copy a file-like stream into a bounded spooled buffer
+
+    Args:
+        stream: Object with read(n)
+        max_bytes: Size limit; UploadTooLarge is raised as soon as it is exceeded
+        chunk_size: Bytes per read
+
+    Returns:
+        (spooled_file, size): spooled_file is rewound to the start
+    """
+    spool = BoundedSpool(max_bytes)
+    try:
+        read_stream(stream, spool, chunk_size)
+    except BaseException:
+        spool.close()
+        raise
+    return spool.finish(), spool.size
+
+
+def read_stream(stream, consumer, chunk_size=CHUNK_SIZE):
+    """Feed a file-like stream to consumer.feed() chunk by chunk"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        consumer.feed(chunk)
+
+
+class Base64StreamDecoder:
+    def __init__(self, sink):
+        """
+        Incremental base64 decoder
+
+        Args:
+            sink: File-like object receiving the decoded bytes
+        """
+        self.sink = sink
+        self._pending = b""
+        self.decoded_bytes = 0
+        self.decode_seconds = 0.0
+
+    def feed(self, data):
+        # JSON may escape '/' as '\/'; base64 never contains a backslash
+        if b"\\" in data:
+            data = data.replace(b"\\", b"")
+        data = self._pending + b"".join(data.split())
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if usable:
+            self._write(data[:usable])
+
+    def finish(self):
+        if self._pending:
+            # Tolerate missing padding, like most browsers' btoa consumers do
+            self._write(self._pending + b"=" * (-len(self._pending) % 4))
+            self._pending = b""
+
+    def _write(self, data):
+        started = time.perf_counter()
+        try:
+            decoded = base64.b64decode(data)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 audio data: {e}")
+        finally:
+            self.decode_seconds += time.perf_counter() - started
+        self.decoded_bytes += len(decoded)
+        self.sink.write(decoded)
+
+
+class JsonAudioExtractor:
+    # Scanner states
+    _FIELDS = 0        # Outside the audioData value
+    _AUDIO_PREFIX = 1  # Start of the audioData value, looking for a "data:...," prefix
+    _AUDIO = 2         # Inside the base64 payload
+
+    def __init__(self, field='audioData', max_bytes=MAX_UPLOAD_BYTES):
+        """
+        Push parser for `{"audioData": "data:audio/webm;base64,...", ...}` bodies
+
+        The audioData string is base64-decoded straight into a spooled buffer as
+        chunks arrive; every other field is kept (small) and parsed at the end.
+        The data URL's media type ("audio/webm", "audio/L16;rate=24000") is kept
+        in mime_type. Works the same for sync (Flask) and async (Quart) bodies: call feed()
+        for each chunk, then finish().
+
+        Args:
+            field: Name of the top-level field holding the base64 audio
+            max_bytes: Raw body size limit (UploadTooLarge when exceeded)
+        """
+        self.field = field.encode('utf-8')
+        self.max_bytes = max_bytes
+        self.audio = new_spool()
+        self.decoder = Base64StreamDecoder(self.audio)
+        self.found = False
+        self.mime_type = None
+        self.size = 0
+        self._state = self._FIELDS
+        self._fields = bytearray()
+        self._prefix = b""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._expect_value = False
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+
+        pos = 0
+        while pos < len(chunk):
+            if self._state == self._AUDIO:
+                end = chunk.find(b'"', pos)
+                if end == -1:
+                    self.decoder.feed(chunk[pos:])
+                    return
+                self.decoder.feed(chunk[pos:end])
+                self._end_audio()
+                pos = end + 1
+            elif self._state == self._AUDIO_PREFIX:
+                pos = self._scan_prefix(chunk, pos)
+            else:
+                pos = self._scan_fields(chunk, pos)
+
+    def finish(self):
+        """
+        Returns:
+            (audio_file, fields): rewound spooled file with the decoded audio,
+            and the other JSON fields as a dict
+        """
+        if self._state != self._FIELDS:
+            raise ValueError("Truncated audio data")
+        self.decoder.finish()
+        try:
+            fields = json.loads(bytes(self._fields).decode('utf-8')) if self._fields.strip() else None
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        if not isinstance(fields, dict):
+            raise ValueError("Invalid JSON body: expected an object")
+        fields.pop(self.field.decode('utf-8'), None)
+        self.audio.seek(0)
+        return self.audio, fields
+
+    def close(self):
+        self.audio.close()
+
+    def _scan_fields(self, chunk, pos):
+        while pos < len(chunk):
+            byte = chunk[pos:pos + 1]
+            self._keep(byte)
+            pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif byte == b"\\":
+                    self._escape = True
+                elif byte == b'"':
+                    self._in_string = False
+                    self._last_string = bytes(self._fields[self._string_start:-1])
+            elif byte == b'"':
+                if self._expect_value:
+                    self._expect_value = False
+                    self._start_audio()
+                    return pos
+                self._in_string = True
+                self._string_start = len(self._fields)
+            elif byte in (b"{", b"["):
+                self._depth += 1
+                self._last_string = None
+            elif byte in (b"}", b"]"):
+                self._depth -= 1
+                self._last_string = None
+            elif byte == b":":
+                self._expect_value = self._depth == 1 and self._last_string == self.field
+            elif not byte.isspace():
+                self._expect_value = False
+                self._last_string = None
+        return pos
+
+    def _scan_prefix(self, chunk, pos):
+        # Buffer the first bytes of the value until we know whether it is a data URL
+        end = chunk.find(b'"', pos)
+        stop = len(chunk) if end == -1 else end
+        self._prefix += chunk[pos:stop]
+        if end == -1 and self._prefix_undecided():
+            if len(self._prefix) > 256:
+                raise ValueError("Invalid data URL in audio data")
+            return stop
+
+        payload = self._prefix
+        if payload.startswith(b"data:"):
+            comma = payload.find(b",")
+            if comma != -1:
+                self.mime_type = self._media_type(payload[5:comma])
+            payload = payload[comma + 1:] if comma != -1 else b""
+        self._prefix = b""
+        self._state = self._AUDIO
+        self.decoder.feed(payload)
+        if end == -1:
+            return stop
+        self._end_audio()
+        return end + 1
+
+    @staticmethod
+    def _media_type(header):
+        # "audio/webm;codecs=opus;base64" -> "audio/webm;codecs=opus"
+        params = [part.strip() for part in header.decode('ascii', 'replace').split(";")]
+        params = [part for part in params if part and part.lower() != "base64"]
+        return ";".join(params) or None
+
+    def _prefix_undecided(self):
+        # Could still be a "data:" prefix whose comma hasn't arrived yet
+        if len(self._prefix) < 5:
+            return b"data:".startswith(self._prefix)
+        return self._prefix.startswith(b"data:") and b"," not in self._prefix
+
+    def _start_audio(self):
+        self.found = True
+        self._state = self._AUDIO_PREFIX
+        # The opening quote is already kept; close it so the fields JSON
+        # holds an empty string in place of the audio
+        self._fields.extend(b'"')
+
+    def _end_audio(self):
+        self._state = self._FIELDS
+        self._last_string = None
+
+    def _keep(self, byte):
+        self._fields.extend(byte)
+        if len(self._fields) > MAX_JSON_FIELDS_BYTES:
+            raise ValueError("JSON fields too large")
@@ -0,0 +1,186 @@
+# Word-timing viseme alignment
+# Dùng word offsets (start_time / end_time) từ Speech-to-Text để tạo viseme track:
+# mỗi từ được tách thành grapheme -> viseme (bộ Oculus như visemes.ts) và chia
+# đều theo thời gian của từ (nguyên âm dài hơn phụ âm). Rẻ hơn và chính xác hơn
+# phân tích phổ với các câu trả lời dài được phát lại.
+#
+# Usage:
+#   python viseme_alignment.py recording_transcription.json --language vi -o track.json
+
+import argparse
+import json
+import sys
+import unicodedata
+
+from viseme_analysis import SILENCE
+
+# Graphemes per language, longest match wins ("" = silent)
+_GRAPHEMES = {
+    "en": {
+        "tch": "viseme_CH", "sch": "viseme_SS", "igh": "viseme_aa",
+        "th": "viseme_TH", "sh": "viseme_CH", "ch": "viseme_CH", "ph": "viseme_FF",
+        "ng": "viseme_nn", "ck": "viseme_kk", "qu": "viseme_kk", "wh": "viseme_U", "gh": "",
+        "ee": "viseme_I", "ea": "viseme_I", "oo": "viseme_U", "ou": "viseme_aa",
+        "ow": "viseme_O", "ai": "viseme_E", "ay": "viseme_E", "oy": "viseme_O",
+        "j": "viseme_CH", "c": "viseme_kk", "y": "viseme_I", "x": "viseme_kk",
+    },
+    "vi": {
+        "ngh": "viseme_nn", "ng": "viseme_nn", "nh": "viseme_nn", "gh": "viseme_kk",
+        "kh": "viseme_kk", "ph": "viseme_FF", "th": "viseme_DD", "tr": "viseme_CH",
+        "ch": "viseme_CH", "gi": "viseme_SS", "qu": "viseme_kk", "đ": "viseme_DD",
+        "c": "viseme_kk", "x": "viseme_SS", "y": "viseme_I", "d": "viseme_SS",
+    },
+}
+
+# Single letters shared by both languages (after tone marks are stripped)
+_LETTERS = {
+    "a": "viseme_aa", "e": "viseme_E", "i": "viseme_I", "o": "viseme_O", "u": "viseme_U",
+    "p": "viseme_PP", "b": "viseme_PP", "m": "viseme_PP",
+    "f": "viseme_FF", "v": "viseme_FF",
+    "t": "viseme_DD", "d": "viseme_DD",
+    "k": "viseme_kk", "g": "viseme_kk", "q": "viseme_kk",
+    "s": "viseme_SS", "z": "viseme_SS",
+    "n": "viseme_nn", "l": "viseme_nn",
+    "r": "viseme_RR", "w": "viseme_U",
+}
+
+_VOWELS = {"viseme_aa", "viseme_E", "viseme_I", "viseme_O", "viseme_U"}
+
+# Vowels are held about twice as long as consonants
+VOWEL_WEIGHT = 2.0
+CONSONANT_WEIGHT = 1.0
+
+# Pauses between words longer than this close the mouth
+PAUSE_SECONDS = 0.15
+
+# Shorter visemes are merged into the previous one (the mouth can't show them)
+MIN_VISEME_MS = 40
+
+
+def _language(language_code):
+    return "vi" if (language_code or "").lower().startswith("vi") else "en"
+
+
+def _letters(word):
+    """Lowercase letters with tone marks / diacritics stripped (đ kept)"""
+    word = word.lower().replace("đ", "\0")
+    stripped = "".join(
+        ch for ch in unicodedata.normalize('NFD', word) if not unicodedata.combining(ch)
+    )
+    return "".join(ch for ch in stripped.replace("\0", "đ") if ch.isalpha() or ch == "đ")
+
+
+def word_visemes(word, language_code="en-US"):
+    """
+    Viseme sequence for one word
+
+    Returns:
+        [(viseme, weight), ...]; silent letters (h, ...) are skipped and
+        repeated visemes are merged
+    """
+    table = _GRAPHEMES[_language(language_code)]
+    longest = max(len(key) for key in table)
+    letters = _letters(word)
+    visemes = []
+    i = 0
+    while i < len(letters):
+        for size in range(min(longest, len(letters) - i), 0, -1):
+            piece = letters[i:i + size]
+            if piece in table:
+                viseme = table[piece]
+                break
+            if size == 1:
+                viseme = _LETTERS.get(piece)
+        i += size
+        if not viseme:
+            continue
+        weight = VOWEL_WEIGHT if viseme in _VOWELS else CONSONANT_WEIGHT
+        if visemes and visemes[-1][0] == viseme:
+            visemes[-1] = (viseme, visemes[-1][1] + weight)
+        else:
+            visemes.append((viseme, weight))
+    return visemes
+
+
+def transcription_words(result):
+    """Words with timings from a SpeechToText result, in time order"""
+    words = []
+    for item in result.get("results", []):
+        words.extend(item.get("words") or [])
+    return sorted(words, key=lambda w: w["start_time"])
+
+
+def align_words(words, language_code="en-US", duration=None):
+    """
+    Viseme track from timed words
+
+    Args:
+        words: [{"word", "start_time", "end_time"}, ...] (seconds)
+        language_code: Language of the words (grapheme rules: "vi" or English)
+        duration: Clip length in seconds; closes the mouth after the last word
+
+    Returns:
+        [[start_ms, viseme], ...] in the same format as viseme_analysis.viseme_track
+    """
+    segments = [(0.0, SILENCE)]
+    previous_end = 0.0
+    for word in words:
+        start, end = float(word["start_time"]), float(word["end_time"])
+        if start - previous_end > PAUSE_SECONDS:
+            segments.append((previous_end, SILENCE))
+        visemes = word_visemes(word["word"], language_code)
+        total = sum(weight for _, weight in visemes)
+        position = start
+        for viseme, weight in visemes:
+            segments.append((position, viseme))
+            position += (end - start) * weight / total
+        previous_end = max(previous_end, end)
+    if words:
+        segments.append((previous_end, SILENCE))
+
+    track = []
+    for start, viseme in segments:
+        start_ms = int(round(start * 1000))
+        if track and start_ms - track[-1][0] < MIN_VISEME_MS:
+            # Previous viseme too short to show: this one takes its place
+            track[-1][1] = viseme
+        elif not track or track[-1][1] != viseme:
+            track.append([start_ms, viseme])
+        if len(track) > 1 and track[-2][1] == track[-1][1]:
+            track.pop()
+    if duration is not None:
+        track = [item for item in track if item[0] < duration * 1000] or [[0, SILENCE]]
+    return track
+
+
+def align_transcription(result, language_code="en-US", duration=None):
+    """Viseme track for a SpeechToText result with word time offsets"""
+    return align_words(transcription_words(result), language_code, duration)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Viseme track from a transcription with word time offsets")
+    parser.add_argument("transcription", help="*_transcription.json written by batch_transcribe.py / speech_to_text.py")
+    parser.add_argument("--language", default="en-US", help="Language code (default: en-US)")
+    parser.add_argument("--duration", type=float, default=None, help="Clip length in seconds")
+    parser.add_argument("-o", "--output", default=None, help="Write the track JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.transcription, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    words = transcription_words(result)
+    if not words:
+        print("❌ No word timings in transcription (enable_word_time_offsets)", file=sys.stderr)
+        return 1
+    output = {"source": "words", "track": align_words(words, args.language, args.duration)}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f)
+        print(f"✅ {len(output['track'])} viseme changes for {len(words)} words -> {args.output}")
+    else:
+        print(json.dumps(output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
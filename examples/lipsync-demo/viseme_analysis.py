@@ -0,0 +1,448 @@
+# Offline viseme analysis (NumPy port of wawa-lipsync's Lipsync)
+# Chạy cùng phân tích band energy / spectral centroid, computeVisemeScores và
+# adjustScoresForConsistency như Lipsync trong trình duyệt, nhưng vector hoá trên
+# toàn bộ frame STFT của một clip, để tạo sẵn viseme track (có timestamp).
+# AnalyserNode được mô phỏng: cửa sổ Blackman, smoothingTimeConstant 0.8, thang
+# byte [-100, -30] dB, audio đi theo render quantum 128 sample.
+#
+# Usage:
+#   python viseme_analysis.py public/audios/welcome-message.wav
+#   python viseme_analysis.py clip.mp3 --fps 30 -o clip_visemes.json   (cần ffmpeg)
+#   python viseme_analysis.py clip.wav --compare clip_ts_fixture.json  (so với output của Lipsync)
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+
+from audio_vad import read_wav_file
+
+# Oculus viseme set, in the order of packages/wawa-lipsync/src/visemes.ts
+# (ties go to the first viseme, as in Lipsync.detectState)
+VISEMES = (
+    "viseme_sil", "viseme_PP", "viseme_FF", "viseme_TH", "viseme_DD",
+    "viseme_kk", "viseme_CH", "viseme_SS", "viseme_nn", "viseme_RR",
+    "viseme_aa", "viseme_E", "viseme_I", "viseme_O", "viseme_U",
+)
+SILENCE = "viseme_sil"
+_V = {name[len("viseme_"):]: i for i, name in enumerate(VISEMES)}
+_PLOSIVES = [_V["PP"], _V["DD"], _V["kk"], _V["nn"]]
+
+# Frequency bands (Hz), as in Lipsync
+BANDS = ((50, 200), (200, 400), (400, 800), (800, 1500), (1500, 2500), (2500, 4000), (4000, 8000))
+
+FFT_SIZE = 2048
+HISTORY_SIZE = 10
+DEFAULT_FPS = 60
+
+# AnalyserNode defaults
+MIN_DECIBELS = -100.0
+MAX_DECIBELS = -30.0
+SMOOTHING_TIME_CONSTANT = 0.8
+RENDER_QUANTUM = 128
+
+# Browsers run the AudioContext at 48 kHz; clips are resampled to it
+CONTEXT_SAMPLE_RATE = 48000
+
+# adjustScoresForConsistency (ms)
+EARLY_PHASE_MS = 100
+MAX_VISEME_MS = 100
+
+# STFT frames processed per block, bounds memory for long clips
+BLOCK_FRAMES = 1024
+
+# Largest smoothing^-n (as a power of ten) in smooth_over_time's closed form
+SMOOTHING_MAX_EXPONENT = 150
+
+TRACK_VERSION = 1
+
+
+def load_audio(path):
+    """
+    Mono float32 samples in [-1, 1]
+
+    16-bit WAV is read directly; other formats (mp3, ...) are decoded with ffmpeg.
+
+    Returns:
+        (samples, sample_rate)
+    """
+    if path.lower().endswith('.wav'):
+        decoded = read_wav_file(path)
+        if decoded is not None:
+            samples, sample_rate, _ = decoded
+            return samples.astype(np.float32).mean(axis=1) / 32768.0, sample_rate
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError(f"ffmpeg is required to decode {os.path.basename(path)} (only 16-bit WAV is read natively)")
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', path, '-f', 's16le', '-ac', '1', '-ar', str(CONTEXT_SAMPLE_RATE), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed on {path}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    samples = np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768.0
+    return samples, CONTEXT_SAMPLE_RATE
+
+
+def resample(samples, sample_rate, target_rate=CONTEXT_SAMPLE_RATE):
+    """Linear-interpolation resample (what the media element does before the analyser)"""
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / float(sample_rate)
+    positions = np.arange(int(round(duration * target_rate))) * (sample_rate / float(target_rate))
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def smooth_over_time(magnitude, previous, smoothing):
+    """
+    AnalyserNode time smoothing, s[n] = smoothing * s[n-1] + (1 - smoothing) * x[n],
+    along the frame axis without a per-frame loop
+
+    Closed form s[n] = smoothing^(n+1) * (previous + sum_k (1 - smoothing) * x[k] / smoothing^(k+1)),
+    evaluated with a cumulative sum over runs short enough that smoothing^-n
+    stays far from float64 overflow. All terms are positive, so there is no
+    cancellation.
+
+    Args:
+        magnitude: (frames, bins) linear magnitudes of consecutive polls
+        previous: (bins,) smoothed magnitudes of the poll before the first frame
+        smoothing: Time constant in [0, 1)
+
+    Returns:
+        (frames, bins) float64 smoothed magnitudes, column-major so the
+        cumulative sum runs over contiguous memory
+    """
+    if smoothing <= 0:
+        return np.asfortranarray(magnitude, dtype=np.float64)
+    run = max(1, int(SMOOTHING_MAX_EXPONENT / -np.log10(smoothing)))
+    growth = smoothing ** -np.arange(1, min(run, len(magnitude)) + 1, dtype=np.float64)
+    out = np.empty(magnitude.shape, dtype=np.float64, order='F')
+    for start in range(0, len(magnitude), run):
+        chunk = out[start:start + run]
+        np.multiply(magnitude[start:start + run], ((1.0 - smoothing) * growth[:len(chunk)])[:, None], out=chunk)
+        np.cumsum(chunk, axis=0, out=chunk)
+        chunk += previous
+        chunk /= growth[:len(chunk), None]
+        previous = chunk[-1]
+    return out
+
+
+def byte_frequency_data(samples, sample_rate, fps=DEFAULT_FPS, fft_size=FFT_SIZE,
+                        smoothing=SMOOTHING_TIME_CONSTANT):
+    """
+    AnalyserNode.getByteFrequencyData polled once per 1/fps animation frame
+
+    Each poll sees the fft_size samples up to the last completed render quantum.
+
+    Returns:
+        uint8 array of shape (frames, fft_size // 2)
+    """
+    num_frames = int(np.ceil(len(samples) / float(sample_rate) * fps))
+    num_bins = fft_size // 2
+    if num_frames == 0:
+        return np.zeros((0, num_bins), dtype=np.uint8)
+
+    padded = np.concatenate([np.zeros(fft_size, dtype=np.float32), samples.astype(np.float32)])
+    ends = np.arange(num_frames) * (sample_rate / float(fps))
+    ends = (ends // RENDER_QUANTUM).astype(np.int64) * RENDER_QUANTUM + fft_size
+    ends = np.minimum(ends, len(padded))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, fft_size)
+    # 1 / fft_size magnitude scaling folded into the window
+    blackman = (np.blackman(fft_size) / fft_size).astype(np.float32)
+
+    out = np.empty((num_frames, num_bins), dtype=np.uint8)
+    previous = np.zeros(num_bins, dtype=np.float64)
+    scale = 255.0 / (MAX_DECIBELS - MIN_DECIBELS)
+    for block_start in range(0, num_frames, BLOCK_FRAMES):
+        block_ends = ends[block_start:block_start + BLOCK_FRAMES]
+        frames = windows[block_ends - fft_size] * blackman
+        magnitude = np.abs(np.fft.rfft(frames, axis=1)[:, :num_bins])
+        smoothed = smooth_over_time(magnitude, previous, smoothing)
+        previous = smoothed[-1].copy()
+        # In place: bytes = floor(scale * (20 * log10(s) - MIN_DECIBELS))
+        with np.errstate(divide='ignore'):
+            np.log10(smoothed, out=smoothed)
+        smoothed *= 20.0
+        smoothed -= MIN_DECIBELS
+        smoothed *= scale
+        np.floor(smoothed, out=smoothed)
+        np.clip(smoothed, 0, 255, out=smoothed)
+        out[block_start:block_start + len(block_ends)] = smoothed
+    return out
+
+
+def extract_features(data, sample_rate, fft_size=FFT_SIZE):
+    """
+    Band energies, volume and spectral centroid per frame (Lipsync.extractFeatures)
+
+    Returns:
+        (bands (frames, 7), volume (frames,), centroid (frames,), has_sound (frames,))
+    """
+    bin_width = sample_rate / float(fft_size)
+    num_bins = data.shape[1]
+    amplitude = data.astype(np.float64)
+    cumulative = np.concatenate([np.zeros((len(data), 1)), np.cumsum(amplitude, axis=1)], axis=1)
+
+    bands = np.zeros((len(data), len(BANDS)))
+    for i, (start, end) in enumerate(BANDS):
+        start_bin = int(round(start / bin_width))
+        end_bin = min(int(round(end / bin_width)), num_bins - 1)
+        if end_bin > start_bin:
+            bands[:, i] = (cumulative[:, end_bin] - cumulative[:, start_bin]) / (end_bin - start_bin) / 255.0
+
+    amplitude /= 255.0
+    total = amplitude.sum(axis=1)
+    weighted = amplitude @ (np.arange(num_bins) * bin_width)
+    centroid = np.divide(weighted, total, out=np.zeros_like(total), where=total > 0)
+    return bands, bands.mean(axis=1), centroid, total > 0
+
+
+def history_features(bands, volume, centroid, has_sound, history_size=HISTORY_SIZE):
+    """
+    Current and history-averaged features per frame (Lipsync.getAveragedFeatures)
+
+    Only frames with sound enter the history, and the "current" features are
+    the newest history entry, as in detectState.
+
+    Returns:
+        (current_bands, current_volume, current_centroid,
+         avg_bands, avg_volume, avg_centroid, history_length)
+    """
+    sound = np.flatnonzero(has_sound)
+    # Number of sound frames seen up to and including each frame
+    seen = np.cumsum(has_sound)
+    length = np.minimum(seen, history_size)
+    latest = sound[np.maximum(seen - 1, 0)] if len(sound) else np.zeros(len(seen), dtype=np.int64)
+
+    stacked = np.column_stack([bands, volume, centroid])[sound]
+    cumulative = np.concatenate([np.zeros((1, stacked.shape[1])), np.cumsum(stacked, axis=0)])
+    divisor = np.maximum(length, 1)[:, None]
+    averaged = (cumulative[seen] - cumulative[seen - length]) / divisor
+
+    num_bands = bands.shape[1]
+    return (
+        bands[latest], volume[latest], centroid[latest],
+        averaged[:, :num_bands], averaged[:, num_bands], averaged[:, num_bands + 1], length
+    )
+
+
+def compute_viseme_scores(current_bands, current_volume, current_centroid,
+                          avg_bands, avg_volume, avg_centroid):
+    """
+    Rule-based viseme scores for every frame (Lipsync.computeVisemeScores)
+
+    Returns:
+        (frames, len(VISEMES)) score matrix
+    """
+    scores = np.zeros((len(current_volume), len(VISEMES)))
+    c = current_centroid
+    d_volume = current_volume - avg_volume
+    d_centroid = current_centroid - avg_centroid
+
+    # Silence
+    scores[:, _V["sil"]] = np.where((avg_volume < 0.2) & (current_volume < 0.2), 1.0, 0.0)
+
+    # Plosives
+    plosive = (-0.5 * (d_volume < 0.01)) + 0.2 * (avg_volume < 0.2) + 0.2 * (d_centroid > 1000)
+    scores[:, _PLOSIVES] += plosive[:, None]
+
+    # Bursts by centroid
+    burst = (c > 1000) & (c < 8000)
+    scores[:, _V["DD"]] += 0.6 * (burst & (c > 7000))
+    scores[:, _V["kk"]] += 0.6 * (burst & (c <= 7000) & (c > 5000))
+    pp = burst & (c <= 5000) & (c > 4000)
+    scores[:, _V["PP"]] += 1.0 * pp
+    scores[:, _V["DD"]] += 1.4 * (pp & (current_bands[:, 6] > 0.25) & (c < 6000))
+    scores[:, _V["nn"]] += 0.6 * (burst & (c <= 4000))
+
+    # Fricatives
+    ff = ((d_centroid > 1000) & (c > 6000) & (avg_centroid > 5000)
+          & (current_bands[:, 6] > 0.4) & (avg_bands[:, 6] > 0.3))
+    scores[:, _V["FF"]] = np.where(ff, 0.7, scores[:, _V["FF"]])
+
+    # Vowels (later rules overwrite earlier ones, as in the TS)
+    b1, b2, b3, b4, b5 = (avg_bands[:, i] for i in range(5))
+    vowel = (avg_volume > 0.1) & (avg_centroid < 6000) & (c < 6000) & ((b3 > 0.1) | (b4 > 0.1))
+    gap_b1_b2 = np.abs(b1 - b2)
+    max_gap_b2_b3_b4 = np.maximum.reduce([np.abs(b2 - b3), np.abs(b2 - b4), np.abs(b3 - b4)])
+
+    def assign(viseme, mask, value):
+        column = _V[viseme]
+        scores[:, column] = np.where(vowel & mask, value, scores[:, column])
+
+    assign("aa", b4 > b3, 0.8 + 0.2 * (b3 > b2))
+    assign("I", (b3 > b2) & (b3 > b4), 0.7)
+    assign("U", gap_b1_b2 < 0.25, 0.7)
+    assign("O", max_gap_b2_b3_b4 < 0.25, 0.9)
+    assign("E", (b2 > b3) & (b3 > b4), 1.0)
+    assign("I", (b3 < 0.2) & (b4 > 0.3), 0.7)
+    assign("O", (b3 > 0.25) & (b5 > 0.25), 0.7)
+    assign("U", (b3 < 0.15) & (b5 < 0.15), 0.7)
+    return scores
+
+
+def select_visemes(scores, history_length, fps=DEFAULT_FPS):
+    """
+    Viseme index per frame after adjustScoresForConsistency
+
+    The current viseme's score is boosted 1.3x for its first 100 ms, then
+    penalized the longer it is held (down to 0.5x). Sequential by nature, but
+    only touches one score row per frame.
+    """
+    chosen = np.empty(len(scores), dtype=np.int64)
+    viseme = 0
+    started = 0.0
+    frame_ms = 1000.0 / fps
+    for i in range(len(scores)):
+        now = i * frame_ms
+        if history_length[i] == 0:
+            # detectState with an empty history: silence, start time untouched
+            viseme = 0
+            chosen[i] = 0
+            continue
+        held = now - started
+        if held <= EARLY_PHASE_MS:
+            boost = 1.3
+        elif held <= MAX_VISEME_MS:
+            boost = 1.3 - 0.3 * (held - EARLY_PHASE_MS) / (MAX_VISEME_MS - EARLY_PHASE_MS)
+        else:
+            boost = max(0.5, 1.0 - (held - MAX_VISEME_MS) / 1000.0)
+        row = scores[i]
+        current = row[viseme]
+        row[viseme] = current * boost
+        top = int(np.argmax(row))
+        row[viseme] = current
+        if top != viseme:
+            started = now
+        viseme = top
+        chosen[i] = top
+    return chosen
+
+
+def analyze(samples, sample_rate, fps=DEFAULT_FPS, fft_size=FFT_SIZE, history_size=HISTORY_SIZE):
+    """
+    Viseme for every 1/fps frame of a clip, as Lipsync.processAudio would
+    produce it when called once per animation frame during playback
+
+    Returns:
+        List of viseme names, one per frame
+    """
+    samples = resample(np.asarray(samples, dtype=np.float32), sample_rate)
+    data = byte_frequency_data(samples, CONTEXT_SAMPLE_RATE, fps, fft_size)
+    if len(data) == 0:
+        return []
+    bands, volume, centroid, has_sound = extract_features(data, CONTEXT_SAMPLE_RATE, fft_size)
+    (current_bands, current_volume, current_centroid,
+     avg_bands, avg_volume, avg_centroid, length) = history_features(bands, volume, centroid, has_sound, history_size)
+    scores = compute_viseme_scores(current_bands, current_volume, current_centroid,
+                                   avg_bands, avg_volume, avg_centroid)
+    return [VISEMES[i] for i in select_visemes(scores, length, fps)]
+
+
+def viseme_track(visemes, fps=DEFAULT_FPS):
+    """Run-length encode per-frame visemes as [[start_ms, viseme], ...]"""
+    track = []
+    for i, viseme in enumerate(visemes):
+        if not track or track[-1][1] != viseme:
+            track.append([int(round(i * 1000 / fps)), viseme])
+    return track
+
+
+def expand_track(track, duration, fps=DEFAULT_FPS):
+    """Inverse of viseme_track: per-frame visemes for a clip of duration seconds"""
+    num_frames = int(np.ceil(duration * fps))
+    # Start times are rounded to whole ms; map them back to frame indices
+    start_frames = np.round(np.array([start for start, _ in track], dtype=np.float64) * fps / 1000.0)
+    indices = np.searchsorted(start_frames, np.arange(num_frames), side='right') - 1
+    return [track[i][1] if i >= 0 else SILENCE for i in indices]
+
+
+def analyze_file(path, fps=DEFAULT_FPS):
+    """
+    Viseme track for an audio file
+
+    Returns:
+        {"version", "fps", "duration", "track": [[start_ms, viseme], ...]}
+    """
+    samples, sample_rate = load_audio(path)
+    return {
+        "version": TRACK_VERSION,
+        "fps": fps,
+        "duration": round(len(samples) / float(sample_rate), 3),
+        "track": viseme_track(analyze(samples, sample_rate, fps), fps)
+    }
+
+
+def compare_with_fixture(visemes, fixture, fps=DEFAULT_FPS):
+    """
+    Frame agreement with visemes recorded from the TS Lipsync
+
+    Args:
+        visemes: Per-frame visemes from analyze()
+        fixture: {"fps", "visemes": [...]} (lipsync.viseme after each
+                 processAudio() call) or a track {"fps", "duration", "track"}
+
+    Returns:
+        {"frames", "matching", "agreement", "first_mismatch"}
+    """
+    if fixture.get("fps", fps) != fps:
+        raise ValueError(f"Fixture was recorded at {fixture['fps']} fps, analysis ran at {fps}")
+    expected = fixture.get("visemes")
+    if expected is None:
+        expected = expand_track(fixture["track"], fixture["duration"], fps)
+    frames = min(len(expected), len(visemes))
+    matches = [expected[i] == visemes[i] for i in range(frames)]
+    first_mismatch = next((i for i, ok in enumerate(matches) if not ok), None)
+    return {
+        "frames": frames,
+        "matching": sum(matches),
+        "agreement": sum(matches) / float(frames) if frames else 1.0,
+        "first_mismatch": first_mismatch
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute a timestamped viseme track for an audio clip")
+    parser.add_argument("audio", help="Audio file (WAV, or anything ffmpeg can decode)")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help=f"Analysis frames per second (default: {DEFAULT_FPS})")
+    parser.add_argument("-o", "--output", default=None, help="Write the track JSON here instead of stdout")
+    parser.add_argument("--compare", default=None, help="Visemes recorded from the TS Lipsync to check parity against")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="Fail --compare below this fraction of matching frames (default: 0.95)")
+    args = parser.parse_args(argv)
+
+    try:
+        samples, sample_rate = load_audio(args.audio)
+    except (OSError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    visemes = analyze(samples, sample_rate, args.fps)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report = compare_with_fixture(visemes, json.load(f), args.fps)
+        ok = report["agreement"] >= args.min_agreement
+        print(f"{'✅' if ok else '❌'} {report['matching']}/{report['frames']} frames match "
+              f"({report['agreement']:.1%}), first mismatch at frame {report['first_mismatch']}")
+        return 0 if ok else 1
+
+    result = {
+        "version": TRACK_VERSION,
+        "fps": args.fps,
+        "duration": round(len(samples) / float(sample_rate), 3),
+        "track": viseme_track(visemes, args.fps)
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        print(f"✅ {len(result['track'])} viseme changes over {result['duration']}s -> {args.output}")
+    else:
+        print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# Incremental WAV writer for streamed PCM (TTS output)
+# Ghi từng chunk PCM thẳng vào một file/buffer duy nhất qua memoryview (không
+# ghép header + data thành bytes mới mỗi chunk), rồi sửa kích thước RIFF/data
+# trong header khi đóng. Bộ nhớ dùng không đổi theo độ dài audio.
+
+import struct
+
+HEADER_SIZE = 44
+
+# RIFF sizes are 32-bit
+MAX_DATA_SIZE = 0xFFFFFFFF - (HEADER_SIZE - 8)
+
+
+def wav_header(sample_rate, bits_per_sample, data_size, num_channels=1):
+    """
+    44-byte PCM WAV header for data_size bytes of audio
+
+    The RIFF size counts the pad byte after odd-sized data, capped at
+    0xFFFFFFFF (the "unknown length" value of streamed WAVs).
+    """
+    block_align = num_channels * bits_per_sample // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", min(HEADER_SIZE - 8 + data_size + (data_size & 1), 0xFFFFFFFF), b"WAVE",
+        b"fmt ", 16, 1, num_channels, sample_rate,
+        sample_rate * block_align, block_align, bits_per_sample,
+        b"data", data_size
+    )
+
+
+class StreamingWavWriter:
+    def __init__(self, target, sample_rate=24000, bits_per_sample=16, channels=1):
+        """
+        Single PCM WAV file written chunk by chunk
+
+        Args:
+            target: File path, or a seekable binary file object (e.g. io.BytesIO)
+                    that the caller keeps ownership of
+            sample_rate: Sample rate in Hz
+            bits_per_sample: Bits per sample (16 for Gemini's audio/L16)
+            channels: Number of channels
+        """
+        self._owns_file = isinstance(target, (str, bytes)) or hasattr(target, '__fspath__')
+        self._file = open(target, 'wb') if self._owns_file else target
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.channels = channels
+        self.data_size = 0
+        self.closed = False
+        self._start = self._file.tell()
+        # Placeholder sizes; fixed up in close()
+        self._file.write(self._header(0))
+
+    @classmethod
+    def for_mime_type(cls, target, mime_type):
+        """Writer for PCM described by a mime type like "audio/L16;codec=pcm;rate=24000" """
+        from ai_studio_code import parse_audio_mime_type
+        parameters = parse_audio_mime_type(mime_type)
+        return cls(target, sample_rate=parameters["rate"], bits_per_sample=parameters["bits_per_sample"])
+
+    def _header(self, data_size):
+        return wav_header(self.sample_rate, self.bits_per_sample, data_size, self.channels)
+
+    def write(self, pcm):
+        """Append PCM bytes (bytes, bytearray, memoryview or numpy array)"""
+        if self.closed:
+            raise ValueError("write to a closed StreamingWavWriter")
+        view = memoryview(pcm).cast('B')
+        if self.data_size + len(view) > MAX_DATA_SIZE:
+            raise ValueError("WAV data exceeds 4 GB")
+        self._file.write(view)
+        self.data_size += len(view)
+
+    @property
+    def duration(self):
+        """Seconds of audio written so far"""
+        return self.data_size / float(self.sample_rate * self.channels * self.bits_per_sample // 8)
+
+    def close(self):
+        """Fix up the RIFF and data sizes; closes the file if the writer opened it"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.data_size & 1:
+            # RIFF chunks are word-aligned
+            self._file.write(b"\0")
+        end = self._file.tell()
+        self._file.seek(self._start)
+        self._file.write(self._header(self.data_size))
+        self._file.seek(end)
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,2 +1,9 @@
 export { default as Lipsync } from "./lipsync";
 export { default as VISEMES } from "./visemes";
+export {
+  decodeLipsyncWav,
+  decodeVisemeTrack,
+  visemeAt,
+  VisemeTrackSource,
+} from "./visemeTrack";
+export type { VisemeCue, VisemeTrack } from "./visemeTrack";
@@ -0,0 +1,103 @@
+import VISEMES from "./visemes";
+
+// Precomputed viseme track ("VTRK"), as served by the demo's /tts/lipsync
+// endpoint inside a "vtrk" RIFF chunk of the WAV response.
+//
+// Layout (little-endian):
+//   header  "VTRK" | u8 version | u8 source | u16 reserved | u32 count
+//   entries count x (u32 startMs | u8 viseme index in VISEMES order)
+
+const HEADER_SIZE = 12;
+const ENTRY_SIZE = 5;
+const VISEME_ORDER = Object.values(VISEMES) as VISEMES[];
+
+export enum VisemeTrackSource {
+  audio = 0,
+  words = 1,
+}
+
+export interface VisemeCue {
+  startMs: number;
+  viseme: VISEMES;
+}
+
+export interface VisemeTrack {
+  source: VisemeTrackSource;
+  cues: VisemeCue[];
+}
+
+export function decodeVisemeTrack(
+  buffer: ArrayBuffer,
+  byteOffset = 0,
+  byteLength = buffer.byteLength - byteOffset
+): VisemeTrack {
+  const view = new DataView(buffer, byteOffset, byteLength);
+  if (byteLength < HEADER_SIZE) {
+    throw new Error("Viseme track too short");
+  }
+  const magic = String.fromCharCode(
+    view.getUint8(0),
+    view.getUint8(1),
+    view.getUint8(2),
+    view.getUint8(3)
+  );
+  if (magic !== "VTRK" || view.getUint8(4) !== 1) {
+    throw new Error("Not a VTRK v1 viseme track");
+  }
+  const source = view.getUint8(5) as VisemeTrackSource;
+  const count = view.getUint32(8, true);
+  if (HEADER_SIZE + count * ENTRY_SIZE > byteLength) {
+    throw new Error("Truncated viseme track");
+  }
+  const cues: VisemeCue[] = new Array(count);
+  for (let i = 0; i < count; i++) {
+    const offset = HEADER_SIZE + i * ENTRY_SIZE;
+    cues[i] = {
+      startMs: view.getUint32(offset, true),
+      viseme: VISEME_ORDER[view.getUint8(offset + 4)] ?? VISEMES.sil,
+    };
+  }
+  return { source, cues };
+}
+
+// Split a /tts/lipsync response into playable audio and its viseme track.
+// The WAV itself is returned unchanged: decoders skip the unknown chunk.
+export function decodeLipsyncWav(buffer: ArrayBuffer): {
+  audio: ArrayBuffer;
+  track: VisemeTrack | null;
+} {
+  const view = new DataView(buffer);
+  let offset = 12; // "RIFF" size "WAVE"
+  while (offset + 8 <= buffer.byteLength) {
+    const id = String.fromCharCode(
+      view.getUint8(offset),
+      view.getUint8(offset + 1),
+      view.getUint8(offset + 2),
+      view.getUint8(offset + 3)
+    );
+    const size = view.getUint32(offset + 4, true);
+    if (id === "vtrk") {
+      return { audio: buffer, track: decodeVisemeTrack(buffer, offset + 8, size) };
+    }
+    offset += 8 + size + (size & 1);
+  }
+  return { audio: buffer, track: null };
+}
+
+// Viseme active at timeMs (binary search; cues are sorted by startMs)
+export function visemeAt(track: VisemeTrack, timeMs: number): VISEMES {
+  const { cues } = track;
+  let low = 0;
+  let high = cues.length - 1;
+  let found = -1;
+  while (low <= high) {
+    const mid = (low + high) >> 1;
+    if (cues[mid].startMs <= timeMs) {
+      found = mid;
+      low = mid + 1;
+    } else {
+      high = mid - 1;
+    }
+  }
+  return found >= 0 ? cues[found].viseme : VISEMES.sil;
+}